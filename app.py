@@ -21,6 +21,11 @@ from flask import Flask, render_template, session, request, redirect, url_for
 from extensions import db
 # Importamos la función de traducción
 from translations import _
+from compresion import init_compresion
+from fragmentos import init_fragmentos
+from migraciones import actualizar_esquema
+from replica import init_replica
+from sedes import init_sedes, asegurar_sede_defecto, lista_sedes, sede_actual
 import os
 
 if os.environ.get("RAILWAY_ENV") is None and os.environ.get("RENDER") is None:
@@ -35,11 +40,80 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///fresado.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.secret_key = os.environ.get('SECRET_KEY', 'supersecreto')
+    # Compresión de respuestas y streaming de las páginas con tablas grandes
+    app.config['COMPRESION_MIN_BYTES'] = int(os.environ.get('COMPRESION_MIN_BYTES', 1024))
+    app.config['COMPRESION_NIVEL'] = int(os.environ.get('COMPRESION_NIVEL', 6))
+    app.config['STREAM_TEMPLATES'] = os.environ.get('STREAM_TEMPLATES', '0') == '1'
+    # Caché de las partes fijas de las plantillas y del bytecode de Jinja (ver fragmentos.py)
+    app.config['FRAGMENTOS_CACHE'] = os.environ.get('FRAGMENTOS_CACHE', '1') == '1'
+    app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+    # Réplica opcional para las rutas de solo lectura (paneles, exportaciones, analítica)
+    app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+    retraso = os.environ.get('REPLICA_RETRASO_MAXIMO')
+    app.config['REPLICA_RETRASO_MAXIMO'] = float(retraso) if retraso else None
+    # Horas entre cada mantenimiento automático de la base de datos (ANALYZE, VACUUM sin bloqueo); 0 lo desactiva.
+    # El VACUUM completo (VACUUM FULL en Postgres) solo se ejecuta a mano: flask mantenimiento-bd --completo
+    app.config['MANTENIMIENTO_BD_HORAS'] = float(os.environ.get('MANTENIMIENTO_BD_HORAS', 24))
+    # Retiro automático de bloques usados terminados (ver retiro_bloques.py); desactivado por defecto, 0 desactiva cada regla
+    app.config['RETIRO_BLOQUES_HORAS'] = float(os.environ.get('RETIRO_BLOQUES_HORAS', 0))
+    modelos = os.environ.get('RETIRO_BLOQUES_MODELOS', '0')
+    app.config['RETIRO_BLOQUES_MODELOS'] = modelos if modelos == 'capacidad' else int(modelos)
+    app.config['RETIRO_BLOQUES_DIAS'] = int(os.environ.get('RETIRO_BLOQUES_DIAS', 0))
+    app.config['RETIRO_BLOQUES_INACTIVO_DIAS'] = int(os.environ.get('RETIRO_BLOQUES_INACTIVO_DIAS', 0))
+    # Carpeta donde el CAM de las fresadoras deja los logs de trabajos (ver ingesta_logs.py); vacía la desactiva
+    app.config['INGESTA_DIRECTORIO'] = os.environ.get('INGESTA_DIRECTORIO')
+    app.config['INGESTA_PATRON'] = os.environ.get('INGESTA_PATRON', '*.log')
+    app.config['INGESTA_SEGUNDOS'] = float(os.environ.get('INGESTA_SEGUNDOS', 5))
+    app.config['INGESTA_SEDE'] = int(os.environ.get('INGESTA_SEDE', 1))
+    # Etiquetas de bloques con código de barras (ver etiquetas.py): tamaño, caché y pool de procesos
+    app.config['ETIQUETAS_ANCHO_MM'] = float(os.environ.get('ETIQUETAS_ANCHO_MM', 50))
+    app.config['ETIQUETAS_ALTO_MM'] = float(os.environ.get('ETIQUETAS_ALTO_MM', 25))
+    app.config['ETIQUETAS_PUNTOS_POR_MM'] = int(os.environ.get('ETIQUETAS_PUNTOS_POR_MM', 8))
+    app.config['ETIQUETAS_CACHE_DIR'] = os.environ.get('ETIQUETAS_CACHE_DIR', os.path.join(app.instance_path, 'etiquetas'))
+    app.config['ETIQUETAS_PROCESOS'] = int(os.environ.get('ETIQUETAS_PROCESOS', 2))
+    app.config['ETIQUETAS_MINIMO_POOL'] = int(os.environ.get('ETIQUETAS_MINIMO_POOL', 500))
+    # Conciliación incremental de los contadores de bloques y fresas con las órdenes (ver conciliacion.py); 0 la desactiva
+    app.config['CONCILIACION_HORAS'] = float(os.environ.get('CONCILIACION_HORAS', 0))
+    # Respaldos en línea de la base de datos (ver respaldos.py): frecuencia, rotación y ritmo de la copia
+    app.config['RESPALDOS_HORAS'] = float(os.environ.get('RESPALDOS_HORAS', 24))
+    app.config['RESPALDOS_DIR'] = os.environ.get('RESPALDOS_DIR', os.path.join(app.instance_path, 'respaldos'))
+    app.config['RESPALDOS_CONSERVAR'] = int(os.environ.get('RESPALDOS_CONSERVAR', 7))
+    app.config['RESPALDOS_DIFERENCIALES'] = int(os.environ.get('RESPALDOS_DIFERENCIALES', 6))
+    app.config['RESPALDOS_NIVEL'] = int(os.environ.get('RESPALDOS_NIVEL', 6))
+    app.config['RESPALDOS_PAGINAS_POR_PASO'] = int(os.environ.get('RESPALDOS_PAGINAS_POR_PASO', 256))
+    app.config['RESPALDOS_PAUSA'] = float(os.environ.get('RESPALDOS_PAUSA', 0.005))
+    app.config['RESPALDOS_REINICIOS'] = int(os.environ.get('RESPALDOS_REINICIOS', 3))
+    app.config['RESPALDOS_PG_DUMP'] = os.environ.get('RESPALDOS_PG_DUMP', 'pg_dump')
+    init_replica(app)
     # Inicializamos la base de datos con la app
     db.init_app(app)
+    # Activamos la compresión gzip/brotli de las respuestas
+    init_compresion(app)
+    # Caché de fragmentos de plantillas y de bytecode de Jinja
+    init_fragmentos(app)
 
     # Importamos los modelos para que se creen las tablas
     import models
+    # Recalculamos la predicción de desgaste de las fresas en cada guardado
+    from desgaste import init_desgaste
+    init_desgaste()
+    # Cada petición trabaja solo con los datos de su sede (laboratorio)
+    init_sedes(app)
+    # Enlazamos órdenes, fresas y mantenimientos con el registro de máquinas (maquina_id)
+    from maquinas import init_maquinas, migrar_maquinas
+    init_maquinas()
+    # Enlazamos material, marca y shade con sus catálogos (material_id, marca_id, shade_id)
+    from catalogos import init_catalogos, migrar_catalogos
+    init_catalogos()
+    # Anotamos los borrados para la sincronización incremental de los clientes
+    from sincronizacion import init_sincronizacion, completar_fechas
+    init_sincronizacion()
+    # Registramos cada cambio en la tabla de eventos, en la misma transacción
+    from bitacora import init_bitacora, completar_transacciones
+    init_bitacora()
+    # Publicamos los cambios de pendientes, órdenes y bloques para las páginas abiertas (SSE)
+    from eventos import init_eventos
+    init_eventos(app)
 
     # Importamos y registramos los blueprints (módulos de rutas)
     from routes.ordenes import ordenes_bp
@@ -48,6 +122,11 @@ def create_app():
     from routes.mantenimiento import mantenimiento_bp
     from routes.historial_bloques import historial_bp
     from routes.configuracion import configuracion_bp
+    from routes.analitica import analitica_bp
+    from routes.eventos import eventos_bp
+    from routes.escaneo import escaneo_bp
+    from routes.salud import salud_bp
+    from routes.sincronizacion import sincronizacion_bp
 
     app.register_blueprint(ordenes_bp)  # Rutas de órdenes
     app.register_blueprint(bloques_bp)  # Rutas de bloques
@@ -55,6 +134,11 @@ def create_app():
     app.register_blueprint(mantenimiento_bp)  # Rutas de mantenimiento
     app.register_blueprint(historial_bp)      # Rutas de historial
     app.register_blueprint(configuracion_bp)  # Rutas de configuración
+    app.register_blueprint(analitica_bp)      # Rutas de analítica y pronósticos
+    app.register_blueprint(eventos_bp)        # Stream de eventos (SSE)
+    app.register_blueprint(escaneo_bp)        # Resolución de códigos escaneados
+    app.register_blueprint(salud_bp)          # Salud de la base de datos
+    app.register_blueprint(sincronizacion_bp) # Sincronización incremental de los clientes
 
     # Ruta para cambiar el idioma
     @app.route('/set_language', methods=['POST'])
@@ -63,19 +147,66 @@ def create_app():
         session['lang'] = lang
         return redirect(request.referrer or url_for('home'))
 
+    # Ruta para cambiar de sede (o crear una nueva)
+    @app.route('/set_sede', methods=['POST'])
+    def set_sede():
+        from models import Sede
+        from maquinas import registrar_sede_nueva
+        nombre = request.form.get('nueva_sede', '').strip()
+        if nombre:
+            sede = Sede.query.filter_by(nombre=nombre).first()
+            if not sede:
+                sede = Sede(nombre=nombre)
+                db.session.add(sede)
+                db.session.commit()
+                # Las listas de la sede nueva muestran las máquinas por defecto: se registran para que los formularios las acepten
+                registrar_sede_nueva(sede.id)
+        else:
+            sede = db.session.get(Sede, request.form.get('sede_id', type=int) or 0)
+        if sede:
+            session['sede_id'] = sede.id
+        return redirect(request.referrer or url_for('home'))
+
     # Inyectar el traductor en las plantillas
     @app.context_processor
     def inject_translator():
         return {'_': _}
 
+    # Sede actual y lista de sedes para el selector
+    @app.context_processor
+    def inject_sedes():
+        return {'sede_actual': sede_actual, 'lista_sedes': lista_sedes}
+
     # Definimos la ruta principal que muestra la página de inicio
     @app.route('/')
     def home():
         return render_template('home.html')
 
-    # Creamos las tablas de la base de datos si no existen
+    # Creamos las tablas de la base de datos si no existen y agregamos las columnas nuevas
     with app.app_context():
         db.create_all()
+        actualizar_esquema()
+        asegurar_sede_defecto()
+        migrar_maquinas()
+        migrar_catalogos()
+        completar_fechas()
+        completar_transacciones()
+
+    # Mantenimiento de la base de datos: comando 'flask mantenimiento-bd' y ejecución programada
+    from mantenimiento_bd import init_mantenimiento_bd
+    init_mantenimiento_bd(app)
+    # Retiro de bloques usados terminados: comando 'flask retirar-bloques' y pasadas programadas
+    from retiro_bloques import init_retiro_bloques
+    init_retiro_bloques(app)
+    # Ingesta de los logs de las fresadoras: comando 'flask ingerir-logs' y revisión periódica de la carpeta
+    from ingesta_logs import init_ingesta_logs
+    init_ingesta_logs(app)
+    # Conciliación de contadores: comando 'flask conciliar-contadores' y pasadas incrementales programadas
+    from conciliacion import init_conciliacion
+    init_conciliacion(app)
+    # Respaldos de la base de datos: comandos 'flask respaldar' / 'flask restaurar-respaldo' y copias programadas
+    from respaldos import init_respaldos
+    init_respaldos(app)
 
     # NOTA: Cuando el usuario selecciona varios códigos de la lista de pendientes y presiona "Fresar seleccionados",
     # se debe redirigir a un formulario donde se completan los datos compartidos (shade, material, bloque, etc.)
@@ -0,0 +1,164 @@
+"""
+Este archivo planifica en qué bloque se fresa cada caso pendiente, abriendo la menor cantidad de bloques nuevos.
+
+Paso a paso:
+1. Se agrupan los casos por material y shade (un caso solo puede ir a un bloque del mismo material y shade).
+2. La capacidad de cada bloque depende de su grosor (configurable en 'capacidad_grosores', formato grosor:modelos).
+3. Los bloques usados aportan su capacidad restante (capacidad - modelos ya fresados) sin costo.
+4. Se resuelve un bin packing con la heurística Best Fit Decreasing:
+   - los casos se ordenan de mayor a menor cantidad de modelos,
+   - cada caso va al bloque abierto con menos espacio libre donde todavía entra,
+   - solo si no entra en ninguno se abre un bloque nuevo del stock (el de mayor capacidad disponible).
+5. Se devuelve el plan: asignaciones por caso, bloques nuevos a abrir y casos que no se pudieron asignar.
+
+Cada grupo se resuelve con búsqueda binaria sobre la capacidad libre, así cientos de casos se planifican en milisegundos.
+"""
+
+import time
+from bisect import bisect_left
+from models import Bloque, OrdenPendiente, Configuracion
+
+# Modelos que entran en un bloque según su grosor (se puede cambiar en Configuración)
+CAPACIDAD_GROSORES_DEFECTO = ['14:2', '16:3', '18:3', '20:4', '22:5', '25:6']
+
+
+def capacidades_por_grosor(solo_configuradas=False):
+    """
+    Devuelve {grosor: capacidad} leyendo la configuración 'capacidad_grosores'.
+    Con solo_configuradas=True no se usan los valores de ejemplo: {} si el laboratorio no cargó las suyas.
+    """
+    capacidades = {}
+    defecto = None if solo_configuradas else CAPACIDAD_GROSORES_DEFECTO
+    for item in Configuracion.get_lista('capacidad_grosores', default=defecto):
+        grosor, _, capacidad = item.partition(':')
+        try:
+            capacidades[int(grosor)] = int(capacidad)
+        except ValueError:
+            continue
+    return capacidades
+
+
+def _clave(material, shade):
+    return ((material or '').strip().lower(), (shade or '').strip().lower())
+
+
+def planificar(casos, bloques_usados, bloques_nuevos, capacidades):
+    """
+    Calcula el plan de asignación.
+    - casos: lista de dicts con 'codigo', 'material', 'shade' y 'modelos'.
+    - bloques_usados / bloques_nuevos: objetos Bloque (o equivalentes con los mismos atributos).
+    - capacidades: {grosor: modelos por bloque}.
+    """
+    inicio = time.perf_counter()
+    asignaciones = []
+    sin_asignar = []
+    abiertos = []
+
+    # Casos válidos agrupados por (material, shade)
+    grupos = {}
+    for caso in casos:
+        if not caso.get('material') or not caso.get('shade') or not caso.get('modelos'):
+            sin_asignar.append({'codigo': caso.get('codigo'), 'motivo': 'Faltan material, shade o cantidad de modelos'})
+            continue
+        grupos.setdefault(_clave(caso['material'], caso['shade']), []).append(caso)
+
+    usados_por_grupo = {}
+    for b in bloques_usados:
+        restante = capacidades.get(b.grosor, 0) - (b.modelos_fresados or 0)
+        if restante > 0:
+            usados_por_grupo.setdefault(_clave(b.material, b.shade), []).append((restante, b))
+    stock_por_grupo = {}
+    for b in bloques_nuevos:
+        if (b.cantidad or 0) > 0 and capacidades.get(b.grosor, 0) > 0:
+            stock_por_grupo.setdefault(_clave(b.material, b.shade), []).append(b)
+
+    for clave, casos_grupo in grupos.items():
+        # Contenedores ordenados por espacio libre; 'libres' es la lista paralela usada para la búsqueda binaria
+        usados = sorted(usados_por_grupo.get(clave, []), key=lambda u: u[0])
+        libres = [restante for restante, _b in usados]
+        contenedores = [{'tipo': 'usado', 'bloque': b} for _r, b in usados]
+        # Stock nuevo: se abre primero el de mayor capacidad (menos bloques abiertos)
+        stock = sorted(
+            (
+                {'bloque': b, 'disponibles': b.cantidad, 'capacidad': capacidades[b.grosor]}
+                for b in stock_por_grupo.get(clave, [])
+            ),
+            key=lambda s: (-s['capacidad'], s['bloque'].grosor)
+        )
+
+        for caso in sorted(casos_grupo, key=lambda c: -c['modelos']):
+            modelos = caso['modelos']
+            i = bisect_left(libres, modelos)
+            if i < len(libres):
+                # Best fit: el contenedor con menos espacio libre donde entra el caso
+                restante = libres.pop(i)
+                cont = contenedores.pop(i)
+            else:
+                origen = next((s for s in stock if s['disponibles'] > 0 and s['capacidad'] >= modelos), None)
+                if origen is None:
+                    sin_asignar.append({'codigo': caso['codigo'], 'motivo': 'No hay bloque compatible con capacidad suficiente'})
+                    continue
+                origen['disponibles'] -= 1
+                cont = {
+                    'tipo': 'nuevo',
+                    'bloque': origen['bloque'],
+                    'n': len(abiertos) + 1,
+                    'capacidad': origen['capacidad'],
+                    'casos': [],
+                }
+                abiertos.append(cont)
+                restante = origen['capacidad']
+            b = cont['bloque']
+            asignaciones.append({
+                'codigo': caso['codigo'],
+                'material': b.material,
+                'shade': b.shade,
+                'modelos': modelos,
+                'tipo': cont['tipo'],
+                'bloque_id': b.id,
+                'codigo_barra': b.codigo_barra if cont['tipo'] == 'usado' else None,
+                'grosor': b.grosor,
+                'bloque_nuevo': cont.get('n'),
+            })
+            if cont['tipo'] == 'nuevo':
+                cont['casos'].append(caso['codigo'])
+            restante -= modelos
+            if restante > 0:
+                j = bisect_left(libres, restante)
+                libres.insert(j, restante)
+                contenedores.insert(j, cont)
+
+    return {
+        'asignaciones': asignaciones,
+        'bloques_nuevos': [
+            {
+                'n': c['n'],
+                'bloque_nuevo_id': c['bloque'].id,
+                'material': c['bloque'].material,
+                'shade': c['bloque'].shade,
+                'grosor': c['bloque'].grosor,
+                'capacidad': c['capacidad'],
+                'casos': c['casos'],
+            }
+            for c in abiertos
+        ],
+        'bloques_nuevos_abiertos': len(abiertos),
+        'sin_asignar': sin_asignar,
+        'tiempo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+    }
+
+
+def planificar_pendientes(casos=None):
+    """
+    Planifica usando el inventario actual. Si no se pasan casos, se usan los pendientes guardados.
+    """
+    if casos is None:
+        casos = [
+            {'codigo': p.codigo_orden, 'material': p.material, 'shade': p.shade, 'modelos': p.cantidad_modelos}
+            for p in OrdenPendiente.query.order_by(OrdenPendiente.fecha_escaneo.asc()).all()
+        ]
+    # Importación local: retiro_bloques usa capacidades_por_grosor de este archivo
+    from retiro_bloques import vigentes
+    bloques_usados = vigentes(Bloque.query.filter_by(estado='usado')).all()
+    bloques_nuevos = Bloque.query.filter_by(estado='nuevo').all()
+    return planificar(casos, bloques_usados, bloques_nuevos, capacidades_por_grosor())
@@ -0,0 +1,255 @@
+"""
+Este archivo mantiene el registro de eventos del dominio (tabla Evento), donde solo se agregan filas.
+
+Paso a paso:
+1. En cada guardado (after_flush) se anota un evento por cada fila creada, modificada o eliminada:
+   casos pendientes, órdenes, bloques, historial, fresas, mantenimientos, máquinas, catálogos
+   y configuración.
+   - creado / eliminado guardan todos los valores de la fila,
+   - actualizado guarda solo las columnas que cambiaron como [antes, después].
+2. Los eventos se insertan con la misma conexión, dentro de la misma transacción que el cambio:
+   si hay rollback tampoco quedan los eventos.
+3. Las escrituras no se ordenan con ningún bloqueo: en Postgres dos transacciones pueden confirmarse en otro
+   orden que el de sus ids. Por eso cada evento guarda su transacción (models.transaccion_actual) y se lee
+   en orden (transaccion, id) y solo hasta el horizonte: las transacciones anteriores al horizonte ya
+   terminaron, así que un evento que se confirma tarde siempre queda después del punto ya leído.
+   Mientras una transacción larga sigue abierta, los eventos posteriores esperan a que termine.
+4. Cada consumidor guarda en EventoCheckpoint el id del último evento que procesó; procesar() le entrega solo
+   los eventos que siguen en ese orden, en lotes, y avanza el checkpoint en la misma transacción que sus cambios.
+5. reproducir() vuelve el checkpoint a cero para reconstruir un estado derivado desde el principio.
+6. Cada evento guarda la sede de su fila (Evento es PorSede): dentro de una petición leer_eventos() y
+   ultima_posicion() solo ven los eventos de la sede actual, como las demás tablas del laboratorio.
+   Los consumidores que corren fuera de una petición (tareas, comandos) leen los de todas las sedes.
+
+Así los resúmenes, pronósticos y cachés pueden actualizarse con los cambios en vez de recalcular todo.
+"""
+
+import json
+from datetime import datetime
+from sqlalchemy import event, inspect, insert, text, update, or_, and_, true
+from extensions import db
+from sedes import sede_actual
+from models import (
+    Orden, Bloque, BloqueHistorial, FresaInventario, FresaInstalada, FresaHistorial,
+    Mantenimiento, OrdenPendiente, Configuracion, Maquina,
+    Material, Marca, Shade, Evento, EventoCheckpoint,
+)
+
+# Modelos que generan eventos
+MODELOS_REGISTRADOS = (
+    Orden, Bloque, BloqueHistorial, FresaInventario, FresaInstalada, FresaHistorial,
+    Mantenimiento, OrdenPendiente, Configuracion, Maquina, Material, Marca, Shade,
+)
+# Columnas derivadas que se recalculan solas; cambiarlas no es un evento del dominio
+COLUMNAS_IGNORADAS = {
+    'fresa_instalada': {'vida_estimada', 'fecha_reemplazo_estimada'},
+}
+# Columnas que calcula la base de datos al escribir (leerlas en el guardado costaría una consulta por fila)
+COLUMNAS_INTERNAS = {'transaccion'}
+LOTE_CONSUMIDOR = 500
+
+
+def _valor(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+
+def _fila(obj, tabla, accion, datos):
+    return {
+        'tipo': f'{tabla}.{accion}',
+        'entidad': tabla,
+        'entidad_id': getattr(obj, 'id', None),
+        'sede_id': obj.sede_id,
+        'datos': json.dumps(datos, default=str, ensure_ascii=False),
+        'fecha': datetime.utcnow(),
+    }
+
+
+def _valores(obj):
+    return {
+        a.key: _valor(getattr(obj, a.key))
+        for a in inspect(obj).mapper.column_attrs if a.key not in COLUMNAS_INTERNAS
+    }
+
+
+def _cambios(obj, ignoradas):
+    estado = inspect(obj)
+    cambios = {}
+    for atributo in estado.mapper.column_attrs:
+        if atributo.key in ignoradas or atributo.key in COLUMNAS_INTERNAS:
+            continue
+        historia = estado.attrs[atributo.key].history
+        if historia.has_changes():
+            antes = historia.deleted[0] if historia.deleted else None
+            despues = historia.added[0] if historia.added else None
+            if antes != despues:
+                cambios[atributo.key] = [_valor(antes), _valor(despues)]
+    return cambios
+
+
+def _despues_de_flush(session, flush_context):
+    filas = []
+    for obj in session.new:
+        if isinstance(obj, MODELOS_REGISTRADOS):
+            filas.append(_fila(obj, obj.__tablename__, 'creado', _valores(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, MODELOS_REGISTRADOS):
+            cambios = _cambios(obj, COLUMNAS_IGNORADAS.get(obj.__tablename__, ()))
+            if cambios:
+                filas.append(_fila(obj, obj.__tablename__, 'actualizado', cambios))
+    for obj in session.deleted:
+        if isinstance(obj, MODELOS_REGISTRADOS):
+            filas.append(_fila(obj, obj.__tablename__, 'eliminado', _valores(obj)))
+    if filas:
+        _insertar(session.connection(), filas)
+
+
+def _insertar(conexion, filas):
+    # La columna transaccion la completa la base de datos (default de Evento)
+    conexion.execute(insert(Evento.__table__), filas)
+
+
+def registrar(tipo, entidad, datos, entidad_id=None, sede_id=None):
+    """
+    Agrega un evento a la transacción actual. Para cambios que no pasan por el ORM (por ejemplo inserciones masivas).
+    Sin sede_id el evento queda en la sede actual.
+    """
+    _insertar(db.session.connection(), [{
+        'tipo': tipo,
+        'entidad': entidad,
+        'entidad_id': entidad_id,
+        'sede_id': sede_id or sede_actual(),
+        'datos': json.dumps(datos, default=str, ensure_ascii=False),
+        'fecha': datetime.utcnow(),
+    }])
+
+
+def horizonte():
+    """
+    Marca de la transacción más vieja que todavía puede estar abierta (Postgres): los eventos y filas con una
+    marca menor ya no cambian. None si todo lo visible ya es definitivo (SQLite, donde las escrituras se turnan).
+    """
+    conexion = db.session.connection()
+    if conexion.dialect.name == 'postgresql':
+        return conexion.execute(text('SELECT txid_snapshot_xmin(txid_current_snapshot())')).scalar()
+    return None
+
+
+def _hasta_horizonte(consulta, tope):
+    return consulta if tope is None else consulta.filter(Evento.transaccion < tope)
+
+
+def _despues_de(posicion):
+    # Los eventos que siguen al evento 'posicion' en el orden (transaccion, id)
+    if not posicion:
+        return true()
+    transaccion = db.session.query(Evento.transaccion).filter(Evento.id == posicion).scalar()
+    if transaccion is None:
+        # Posición desconocida: se entrega de nuevo todo lo posterior (mejor repetir que saltear)
+        transaccion = 0
+    return or_(Evento.transaccion > transaccion, and_(Evento.transaccion == transaccion, Evento.id > posicion))
+
+
+def ultima_posicion(entidades=None):
+    """
+    Id del último evento ya definitivo (0 si no hay) de la sede actual. Sirve como versión barata de todos sus datos.
+    entidades: nombres de tabla ('orden', 'bloque', ...) para la versión de solo esas tablas.
+    """
+    consulta = _hasta_horizonte(db.session.query(Evento.id), horizonte())
+    if entidades:
+        consulta = consulta.filter(Evento.entidad.in_(entidades))
+    return consulta.order_by(Evento.transaccion.desc(), Evento.id.desc()).limit(1).scalar() or 0
+
+
+def leer_eventos(desde=0, limite=LOTE_CONSUMIDOR, tipos=None):
+    """
+    Eventos posteriores al evento 'desde' (su id; 0 desde el principio), en orden (transaccion, id) y hasta el
+    horizonte. Los ids no siempre crecen: la posición siguiente es el id del último evento entregado.
+    Cada evento es un dict con los datos ya decodificados.
+    """
+    consulta = _hasta_horizonte(Evento.query.filter(_despues_de(desde)), horizonte())
+    if tipos:
+        consulta = consulta.filter(Evento.tipo.in_(list(tipos)))
+    return [
+        {
+            'id': e.id,
+            'tipo': e.tipo,
+            'entidad': e.entidad,
+            'entidad_id': e.entidad_id,
+            'datos': json.loads(e.datos) if e.datos else {},
+            'fecha': e.fecha.isoformat() if e.fecha else None,
+        }
+        for e in consulta.order_by(Evento.transaccion.asc(), Evento.id.asc()).limit(limite).all()
+    ]
+
+
+def _checkpoint(consumidor):
+    cp = EventoCheckpoint.query.filter_by(consumidor=consumidor).first()
+    if cp is None:
+        cp = EventoCheckpoint(consumidor=consumidor, posicion=0)
+        db.session.add(cp)
+    return cp
+
+
+def posicion_consumidor(consumidor):
+    cp = EventoCheckpoint.query.filter_by(consumidor=consumidor).first()
+    return cp.posicion if cp else 0
+
+
+def fijar_checkpoint(consumidor, posicion):
+    """
+    Mueve el checkpoint del consumidor (sin confirmar), por ejemplo después de recalcular todo su estado.
+    """
+    cp = _checkpoint(consumidor)
+    cp.posicion = posicion
+    cp.fecha = datetime.utcnow()
+
+
+def procesar(consumidor, funcion, tipos=None, lote=LOTE_CONSUMIDOR):
+    """
+    Entrega a funcion(eventos) los eventos posteriores al checkpoint del consumidor, en lotes.
+    Los cambios que haga funcion y el nuevo checkpoint se confirman juntos. Devuelve la cantidad procesada.
+    """
+    total = 0
+    while True:
+        cp = _checkpoint(consumidor)
+        eventos = leer_eventos(cp.posicion, lote, tipos)
+        if not eventos:
+            db.session.commit()
+            return total
+        funcion(eventos)
+        cp.posicion = eventos[-1]['id']
+        cp.fecha = datetime.utcnow()
+        db.session.commit()
+        total += len(eventos)
+        if len(eventos) < lote:
+            return total
+
+
+def reproducir(consumidor, funcion, reiniciar=None, tipos=None, lote=LOTE_CONSUMIDOR):
+    """
+    Vuelve a entregar todos los eventos desde el principio (para reconstruir un estado derivado).
+    reiniciar() se llama antes para vaciar ese estado; se confirma junto con el checkpoint en cero.
+    """
+    if reiniciar:
+        reiniciar()
+    _checkpoint(consumidor).posicion = 0
+    db.session.commit()
+    return procesar(consumidor, funcion, tipos, lote)
+
+
+def completar_transacciones():
+    """
+    Los eventos anteriores a la columna transaccion quedan antes de todos los nuevos (una sola vez).
+    """
+    db.session.execute(update(Evento).where(Evento.transaccion.is_(None)).values(transaccion=0))
+    db.session.commit()
+
+
+def init_bitacora():
+    """
+    Registra la escritura de eventos en cada guardado de la sesión.
+    """
+    if not event.contains(db.session, 'after_flush', _despues_de_flush):
+        event.listen(db.session, 'after_flush', _despues_de_flush)
@@ -0,0 +1,200 @@
+"""
+Este archivo administra los catálogos de material, marca y shade (tablas Material, Marca y Shade) de cada sede.
+
+Paso a paso:
+1. Cada valor tiene un id entero, un nombre canónico y una clave sin diferencias de mayúsculas ni espacios
+   ('zirconia ', 'Zirconia' y 'ZIRCONIA' son el mismo material).
+2. Al guardar una orden, bloque, historial o caso pendiente (before_flush) se completan material_id, marca_id
+   y shade_id a partir de los nombres, y el texto se reemplaza por el nombre canónico.
+3. Las consultas filtran y agrupan por estos ids (filtro_catalogo, nombres_por_id), que son más chicos y
+   rápidos de comparar que el texto.
+4. migrar_catalogos() une las variantes ya guardadas una sola vez por sede:
+   - se elige el nombre canónico (el de la lista de Configuración o, si no, la variante más usada),
+   - se crea la fila del catálogo y se actualizan los ids y el texto con actualizaciones masivas.
+   Solo trabaja con las filas que todavía no tienen id, así las siguientes ejecuciones no hacen nada.
+
+Así los agregados del tablero agrupan por enteros y cada valor se escribe de una sola forma.
+"""
+
+from sqlalchemy import event, false, func
+from extensions import db
+from models import Material, Marca, Shade, Orden, Bloque, BloqueHistorial, OrdenPendiente, Configuracion, Sede, SEDE_DEFECTO
+from sedes import sede_actual
+
+# Catálogo de cada columna de texto y la lista de Configuración con sus nombres preferidos
+CATALOGOS = {
+    'material': (Material, 'materiales'),
+    'marca': (Marca, 'marcas'),
+    'shade': (Shade, 'shades'),
+}
+# Modelos que referencian los catálogos y sus columnas
+MODELOS_CON_CATALOGO = {
+    Orden: ('material', 'marca', 'shade'),
+    Bloque: ('material', 'marca', 'shade'),
+    BloqueHistorial: ('material', 'marca', 'shade'),
+    OrdenPendiente: ('material', 'shade'),
+}
+
+
+def normalizar(nombre):
+    """
+    Nombre sin espacios repetidos ni en los extremos; None si queda vacío.
+    """
+    if nombre is None:
+        return None
+    nombre = ' '.join(str(nombre).split())
+    return nombre or None
+
+
+def clave_catalogo(nombre):
+    nombre = normalizar(nombre)
+    return nombre.casefold() if nombre else None
+
+
+def _buscar_o_crear(session, campo, sede, nombre, cache):
+    clave = (campo, sede, clave_catalogo(nombre))
+    if clave in cache:
+        return cache[clave]
+    modelo = CATALOGOS[campo][0]
+    registro = modelo.query.filter_by(sede_id=sede, clave=clave[2]).first()
+    if registro is None:
+        registro = modelo(sede_id=sede, nombre=normalizar(nombre), clave=clave[2])
+        session.add(registro)
+    cache[clave] = registro
+    return registro
+
+
+def _asignar_catalogos(session, flush_context, instances):
+    pendientes = []
+    # session.new arma un conjunto nuevo en cada acceso: se lee una sola vez
+    nuevos = set(session.new)
+    for obj in list(nuevos) + list(session.dirty):
+        campos = MODELOS_CON_CATALOGO.get(type(obj))
+        if not campos:
+            continue
+        if obj not in nuevos:
+            estado = db.inspect(obj)
+            campos = [c for c in campos if estado.attrs[c].history.has_changes()]
+        if campos:
+            pendientes.append((obj, campos))
+    if not pendientes:
+        return
+    cache = {}
+    with session.no_autoflush:
+        for obj, campos in pendientes:
+            for campo in campos:
+                nombre = normalizar(getattr(obj, campo))
+                if nombre is None:
+                    setattr(obj, f'{campo}_registro', None)
+                    continue
+                registro = _buscar_o_crear(session, campo, obj.sede_id or sede_actual(), nombre, cache)
+                # Por la relación, el id se completa al guardar aunque el valor sea nuevo
+                setattr(obj, f'{campo}_registro', registro)
+                if getattr(obj, campo) != registro.nombre:
+                    setattr(obj, campo, registro.nombre)
+
+
+def catalogo_id(campo, nombre):
+    """
+    Id del valor en el catálogo de la sede actual (None si no existe).
+    """
+    clave = clave_catalogo(nombre)
+    if clave is None:
+        return None
+    modelo = CATALOGOS[campo][0]
+    return db.session.query(modelo.id).filter_by(sede_id=sede_actual(), clave=clave).scalar()
+
+
+def filtro_catalogo(columna, campo, nombre):
+    """
+    Condición columna_id == id del nombre; si el nombre no está en el catálogo no coincide ninguna fila.
+    """
+    identificador = catalogo_id(campo, nombre)
+    return columna == identificador if identificador is not None else false()
+
+
+def ids_catalogo(campo, nombres):
+    """
+    Ids de varios nombres (se crean los que falten). Para inserciones masivas que no pasan por el ORM.
+    """
+    cache = {}
+    registros = {
+        nombre: _buscar_o_crear(db.session, campo, sede_actual(), nombre, cache)
+        for nombre in {normalizar(n) for n in nombres} if nombre
+    }
+    db.session.flush()
+    return {nombre: r.id for nombre, r in registros.items()}
+
+
+def nombres_por_id(campo):
+    """
+    Diccionario id -> nombre canónico del catálogo en la sede actual.
+    """
+    modelo = CATALOGOS[campo][0]
+    return dict(db.session.query(modelo.id, modelo.nombre).filter_by(sede_id=sede_actual()).all())
+
+
+def _canonicos(sede, campo, variantes):
+    """
+    Elige el nombre canónico de cada clave: el del catálogo, el de la lista de Configuración o la variante más usada.
+    """
+    modelo, clave_config = CATALOGOS[campo]
+    canonicos = {r.clave: r.nombre for r in modelo.query.filter_by(sede_id=sede)}
+    fila = Configuracion.query.filter_by(sede_id=sede, clave=clave_config).first()
+    preferidos = [normalizar(x) for x in fila.valor.split(',')] if fila else []
+    for nombre in preferidos:
+        if nombre:
+            canonicos.setdefault(nombre.casefold(), nombre)
+    for nombre, _ in sorted(variantes.items(), key=lambda v: -v[1]):
+        canonicos.setdefault(clave_catalogo(nombre), normalizar(nombre))
+    return canonicos
+
+
+def _migrar_sede(sede):
+    cache = {}
+    for campo in CATALOGOS:
+        modelos = [m for m, campos in MODELOS_CON_CATALOGO.items() if campo in campos]
+        # Variantes escritas (sin id todavía) y cuántas filas usan cada una
+        variantes = {}
+        por_modelo = {}
+        for modelo in modelos:
+            columna, columna_id = getattr(modelo, campo), getattr(modelo, f'{campo}_id')
+            filas = db.session.query(columna, func.count()).filter(
+                modelo.sede_id == sede, columna.isnot(None), columna_id.is_(None)
+            ).group_by(columna).all()
+            por_modelo[modelo] = [n for n, _ in filas]
+            for nombre, cantidad in filas:
+                if normalizar(nombre):
+                    variantes[nombre] = variantes.get(nombre, 0) + cantidad
+        if not variantes:
+            continue
+        canonicos = _canonicos(sede, campo, variantes)
+        for modelo, nombres in por_modelo.items():
+            columna, columna_id = getattr(modelo, campo), getattr(modelo, f'{campo}_id')
+            for nombre in nombres:
+                if not normalizar(nombre):
+                    continue
+                registro = _buscar_o_crear(db.session, campo, sede, canonicos[clave_catalogo(nombre)], cache)
+                db.session.flush()
+                db.session.query(modelo).filter(
+                    modelo.sede_id == sede, columna == nombre, columna_id.is_(None)
+                ).update({columna_id: registro.id, columna: registro.nombre}, synchronize_session=False)
+
+
+def migrar_catalogos():
+    """
+    Crea los catálogos a partir de los textos guardados, une las variantes y completa los ids.
+    Solo hace trabajo la primera vez (o si quedaron filas sin id).
+    """
+    sedes = {s.id for s in Sede.query.all()} | {SEDE_DEFECTO}
+    for sede in sorted(sedes):
+        _migrar_sede(sede)
+    db.session.commit()
+
+
+def init_catalogos():
+    """
+    Registra el enlace automático con los catálogos en cada guardado de la sesión.
+    """
+    if not event.contains(db.session, 'before_flush', _asignar_catalogos):
+        event.listen(db.session, 'before_flush', _asignar_catalogos)
@@ -0,0 +1,152 @@
+"""
+Este archivo codifica textos en Code128 y dibuja una etiqueta de bloque en PDF o en ZPL.
+
+Paso a paso:
+1. simbolos_code128() arma los valores del código: subconjunto B para letras y C (dos dígitos por símbolo)
+   para las series largas de números, con el dígito de control y el símbolo de fin.
+2. modulos_code128() los pasa a anchos de barras y espacios.
+3. dibujar() arma una etiqueta: en PDF como rectángulos (las barras) y texto con Helvetica, en ZPL con el
+   comando ^BC (la impresora dibuja las barras a partir del texto).
+
+No depende de Flask ni de la base de datos: así los procesos del pool de etiquetas.py arrancan rápido.
+"""
+
+import zlib
+
+PUNTOS_POR_MM = 72 / 25.4
+ZONA_SILENCIO = 10          # Módulos en blanco a cada lado del código (mínimo del estándar)
+
+# Anchos de barra y espacio de cada símbolo Code128 (0-102 datos, 103-105 inicio A/B/C, 106 fin)
+_PATRONES = (
+    '212222 222122 222221 121223 121322 131222 122213 122312 132212 221213 221312 231212 112232 122132 '
+    '122231 113222 123122 123221 223211 221132 221231 213212 223112 312131 311222 321122 321221 312212 '
+    '322112 322211 212123 212321 232121 111323 131123 131321 112313 132113 132311 211313 231113 231311 '
+    '112133 112331 132131 113123 113321 133121 313121 211331 231131 213113 213311 213131 311123 311321 '
+    '331121 312113 312311 332111 314111 221411 431111 111224 111422 121124 121421 141122 141221 112214 '
+    '112412 122114 122411 142112 142211 241211 221114 413111 241112 134111 111242 121142 121241 114212 '
+    '124112 124211 411212 421112 421211 212141 214121 412121 111143 111341 131141 114113 114311 411113 '
+    '411311 113141 114131 311141 411131 211412 211214 211232 2331112'
+).split()
+_INICIO_B, _INICIO_C, _A_CODIGO_B, _A_CODIGO_C, _FIN = 104, 105, 100, 99, 106
+
+
+def _digitos_desde(texto, i):
+    fin = i
+    while fin < len(texto) and texto[fin].isdigit():
+        fin += 1
+    return fin - i
+
+
+def simbolos_code128(texto):
+    """
+    Valores Code128 del texto (inicio, datos, control y fin). Solo caracteres ASCII imprimibles.
+    """
+    if not texto or any(not 32 <= ord(c) <= 126 for c in texto):
+        raise ValueError(f'El código {texto!r} no se puede escribir en Code128')
+    # El subconjunto C conviene desde 4 dígitos seguidos (al inicio o al final) o 6 en medio del texto
+    subconjunto = 'C' if _digitos_desde(texto, 0) >= 4 else 'B'
+    valores = [_INICIO_C if subconjunto == 'C' else _INICIO_B]
+    i = 0
+    while i < len(texto):
+        digitos = _digitos_desde(texto, i)
+        if subconjunto == 'C':
+            if digitos >= 2:
+                valores.append(int(texto[i:i + 2]))
+                i += 2
+                continue
+            valores.append(_A_CODIGO_B)
+            subconjunto = 'B'
+        final = i + digitos == len(texto)
+        if digitos >= (4 if final else 6):
+            # Con cantidad impar el primer dígito va en B y el resto en pares
+            if digitos % 2:
+                valores.append(ord(texto[i]) - 32)
+                i += 1
+            valores.append(_A_CODIGO_C)
+            subconjunto = 'C'
+            continue
+        valores.append(ord(texto[i]) - 32)
+        i += 1
+    valores.append((valores[0] + sum(posicion * v for posicion, v in enumerate(valores[1:], 1))) % 103)
+    valores.append(_FIN)
+    return valores
+
+
+def modulos_code128(texto):
+    """
+    Anchos alternados barra/espacio (en módulos) del código, empezando por una barra.
+    """
+    return [int(ancho) for valor in simbolos_code128(texto) for ancho in _PATRONES[valor]]
+
+
+def _texto_pdf(texto):
+    # Helvetica con WinAnsiEncoding: lo que no entra en latin-1 se reemplaza
+    texto = texto.encode('latin-1', errors='replace').decode('latin-1')
+    return texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def dibujo_pdf(datos, ancho, alto):
+    """
+    Operaciones PDF (comprimidas) de una etiqueta de ancho x alto puntos.
+    """
+    modulos = modulos_code128(datos['codigo'])
+    margen = 2 * PUNTOS_POR_MM
+    modulo = (ancho - 2 * margen) / (sum(modulos) + 2 * ZONA_SILENCIO)
+    alto_barras = alto * 0.5
+    y_barras = alto - margen - alto_barras
+    x = margen + ZONA_SILENCIO * modulo
+    operaciones = ['0 g']
+    for posicion, ancho_modulos in enumerate(modulos):
+        if posicion % 2 == 0:
+            operaciones.append(f'{x:.2f} {y_barras:.2f} {ancho_modulos * modulo:.2f} {alto_barras:.2f} re')
+        x += ancho_modulos * modulo
+    operaciones.append('f')
+    tamano_codigo = min(alto * 0.16, 12)
+    tamano_detalle = tamano_codigo * 0.7
+    y = y_barras - tamano_codigo - 1
+    operaciones.append(f'BT /F1 {tamano_codigo:.1f} Tf {margen:.2f} {y:.2f} Td ({_texto_pdf(datos["codigo"])}) Tj ET')
+    if datos['detalle']:
+        y -= tamano_detalle + 1
+        operaciones.append(f'BT /F1 {tamano_detalle:.1f} Tf {margen:.2f} {y:.2f} Td ({_texto_pdf(datos["detalle"])}) Tj ET')
+    return zlib.compress('\n'.join(operaciones).encode('latin-1'))
+
+
+def _texto_zpl(texto):
+    # Con ^FH el carácter _ marca un byte en hexadecimal: así ^ y ~ no se toman como comandos
+    return ''.join(f'_{ord(c):02X}' if c in '_^~' else c for c in texto)
+
+
+def dibujo_zpl(datos, ancho, alto, puntos_por_mm):
+    """
+    Etiqueta ZPL (^XA ... ^XZ) de ancho x alto puntos de impresora.
+    """
+    margen = 2 * puntos_por_mm
+    # Ancho del módulo en puntos de impresora: el mayor que entra en la etiqueta
+    modulo = max(1, min(4, int((ancho - 2 * margen) // (sum(modulos_code128(datos['codigo'])) + 2 * ZONA_SILENCIO))))
+    alto_barras = int(alto * 0.5)
+    tamano_codigo = int(min(alto * 0.16, 3.5 * puntos_por_mm))
+    tamano_detalle = int(tamano_codigo * 0.7)
+    x = int(margen + ZONA_SILENCIO * modulo)
+    y = int(margen)
+    lineas = [
+        '^XA', '^CI28', f'^PW{int(ancho)}', f'^LL{int(alto)}',
+        f'^FO{x},{y}^BY{modulo}^BCN,{alto_barras},N,N,N^FH^FD{_texto_zpl(datos["codigo"])}^FS',
+    ]
+    y += alto_barras + 4
+    lineas.append(f'^FO{int(margen)},{y}^A0N,{tamano_codigo},{tamano_codigo}^FH^FD{_texto_zpl(datos["codigo"])}^FS')
+    if datos['detalle']:
+        y += tamano_codigo + 2
+        lineas.append(f'^FO{int(margen)},{y}^A0N,{tamano_detalle},{tamano_detalle}^FH^FD{_texto_zpl(datos["detalle"])}^FS')
+    lineas.append('^XZ')
+    return '\n'.join(lineas).encode('utf-8') + b'\n'
+
+
+def dibujar(tarea):
+    """
+    Dibuja una etiqueta. Recibe y devuelve datos simples para poder correr en otro proceso.
+    """
+    formato, datos, medidas = tarea
+    if formato == 'pdf':
+        return dibujo_pdf(datos, medidas['ancho_mm'] * PUNTOS_POR_MM, medidas['alto_mm'] * PUNTOS_POR_MM)
+    puntos = medidas['puntos_por_mm']
+    return dibujo_zpl(datos, medidas['ancho_mm'] * puntos, medidas['alto_mm'] * puntos, puntos)
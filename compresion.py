@@ -0,0 +1,131 @@
+"""
+Este archivo agrega la compresión de respuestas (gzip/brotli) y el renderizado en streaming de las páginas con tablas grandes.
+
+Paso a paso:
+1. Se registra un after_request que comprime las respuestas de texto (HTML, JSON, CSS, JS) cuando el navegador lo acepta.
+2. Solo se comprimen las respuestas que superan un tamaño mínimo configurable (COMPRESION_MIN_BYTES).
+3. Si el paquete opcional 'brotli' está instalado y el navegador lo acepta, se usa brotli; si no, gzip.
+4. Las respuestas en streaming se comprimen por partes, sin juntar todo el documento en memoria.
+5. La función render_lista() renderiza una plantilla con stream_template cuando STREAM_TEMPLATES está activo,
+   para que las filas de la tabla se envíen mientras se van generando.
+6. La función filas() devuelve los registros de una consulta por lotes (yield_per) cuando se usa streaming.
+
+Así bajan el tiempo hasta el primer byte y la memoria por petición en las páginas de listas grandes.
+"""
+
+import zlib
+from flask import Response, current_app, render_template, request, stream_template
+
+# brotli es opcional: si no está instalado se usa solo gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Tipos de contenido que vale la pena comprimir
+TIPOS_COMPRIMIBLES = (
+    'text/html', 'text/css', 'text/plain', 'text/csv',
+    'application/json', 'application/javascript', 'text/javascript',
+)
+
+
+def init_compresion(app):
+    """
+    Registra la compresión de respuestas en la app.
+    """
+    app.config.setdefault('COMPRESION_MIN_BYTES', 1024)
+    app.config.setdefault('COMPRESION_NIVEL', 6)
+    app.config.setdefault('STREAM_TEMPLATES', False)
+    app.config.setdefault('STREAM_BUFFER_BYTES', 16384)
+    app.after_request(_comprimir_respuesta)
+
+
+def render_lista(plantilla, **contexto):
+    """
+    Renderiza una plantilla de lista grande.
+    Con STREAM_TEMPLATES activo se envía por partes; si no, se comporta igual que render_template.
+    """
+    if not current_app.config.get('STREAM_TEMPLATES'):
+        return render_template(plantilla, **contexto)
+    partes = stream_template(plantilla, **contexto)
+    tam = current_app.config.get('STREAM_BUFFER_BYTES', 16384)
+    return Response(_agrupar(partes, tam), mimetype='text/html')
+
+
+def filas(query, tam_lote=500):
+    """
+    Devuelve los registros de la consulta. En modo streaming se leen por lotes en vez de cargarlos todos.
+    """
+    if current_app.config.get('STREAM_TEMPLATES'):
+        return query.yield_per(tam_lote)
+    return query.all()
+
+
+def _agrupar(partes, tam):
+    # Jinja entrega trozos muy pequeños; los juntamos para no enviar (ni comprimir) cada uno por separado
+    buffer = []
+    acumulado = 0
+    for parte in partes:
+        buffer.append(parte)
+        acumulado += len(parte)
+        if acumulado >= tam:
+            yield ''.join(buffer)
+            buffer = []
+            acumulado = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _elegir_codificacion():
+    aceptadas = request.accept_encodings
+    if brotli is not None and aceptadas['br']:
+        return 'br'
+    if aceptadas['gzip']:
+        return 'gzip'
+    return None
+
+
+def _comprimir_respuesta(response):
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in TIPOS_COMPRIMIBLES
+    ):
+        return response
+    codificacion = _elegir_codificacion()
+    if codificacion is None:
+        return response
+    nivel = current_app.config.get('COMPRESION_NIVEL', 6)
+
+    if response.is_streamed:
+        # No conocemos el tamaño final: se comprime cada parte a medida que sale
+        response.response = _comprimir_stream(response.iter_encoded(), codificacion, nivel)
+        response.headers.pop('Content-Length', None)
+    else:
+        datos = response.get_data()
+        if len(datos) < current_app.config.get('COMPRESION_MIN_BYTES', 1024):
+            return response
+        if codificacion == 'br':
+            response.set_data(brotli.compress(datos, quality=min(nivel, 11)))
+        else:
+            compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+            response.set_data(compresor.compress(datos) + compresor.flush())
+    response.headers['Content-Encoding'] = codificacion
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _comprimir_stream(partes, codificacion, nivel):
+    if codificacion == 'br':
+        compresor = brotli.Compressor(quality=min(nivel, 11))
+        for parte in partes:
+            yield compresor.process(parte) + compresor.flush()
+        yield compresor.finish()
+    else:
+        # wbits=31 genera formato gzip; Z_SYNC_FLUSH deja cada parte lista para el navegador
+        compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+        for parte in partes:
+            yield compresor.compress(parte) + compresor.flush(zlib.Z_SYNC_FLUSH)
+        yield compresor.flush()
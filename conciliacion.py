@@ -0,0 +1,377 @@
+"""
+Este archivo concilia los contadores guardados de bloques y fresas con las órdenes registradas.
+
+Paso a paso:
+1. Bloque.modelos_fresados, Bloque.codigos_orden_fresados y FresaInstalada.modelos_fresados se suman al crear
+   una orden, pero no cambian al editarla o eliminarla: con el tiempo se desvían de la tabla Orden.
+2. Los valores esperados se calculan desde Orden con pandas, de una vez para muchos bloques:
+   - bloque: las órdenes de la misma sede con su codigo_barra, desde que se abrió (con MARGEN_BLOQUE para
+     los relojes desfasados; así un código reciclado de un bloque retirado no suma órdenes viejas),
+   - fresa: cada orden va a la fresa instalada más reciente de su máquina que acepta su material y ya estaba
+     instalada en la fecha de la orden (merge_asof), igual que elige la fresa ordenes().
+3. Se comparan con los valores guardados columna contra columna (los códigos sin importar el orden) y se
+   devuelven las diferencias. Con reparar=True los bloques se corrigen con UPDATE masivos por lote (y un evento
+   'contadores.conciliados' con los valores de antes y después); las fresas, que son pocas, con el ORM para
+   que se recalcule su desgaste.
+4. El modo incremental lee el registro de eventos (bitacora.procesar) desde su checkpoint: solo revisa los
+   bloques y fresas tocados por órdenes, bloques o fresas creados o modificados desde la última pasada.
+   El modo completo recorre todos los bloques usados en lotes de LOTE_BLOQUES y, si repara, deja el
+   checkpoint al día. La primera vez conviene correr el completo.
+5. Se ejecuta con flask conciliar-contadores [--completo] [--reparar], o cada CONCILIACION_HORAS en un hilo
+   (modo incremental con reparación; 0 lo desactiva).
+
+Así los contadores que usan el retiro de bloques, el desgaste de fresas y los reportes vuelven a coincidir
+con las órdenes aunque se hayan editado o borrado órdenes a mano.
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+import pandas as pd
+from flask import current_app
+from sqlalchemy import select, update
+from extensions import db
+from models import Bloque, FresaInstalada, Orden, TareaProgramada
+from bitacora import fijar_checkpoint, leer_eventos, posicion_consumidor, procesar, registrar, ultima_posicion
+from mantenimiento_bd import reservar_tarea
+from sedes import leer_df
+
+CONSUMIDOR = 'conciliacion_contadores'
+TAREA = 'conciliacion_contadores'
+LOTE_BLOQUES = 2000             # Bloques revisados por consulta (y por transacción al reparar)
+LOTE_IN = 500                   # Valores por consulta IN
+MARGEN_BLOQUE = timedelta(days=1)
+MAX_EJEMPLOS = 50               # Diferencias detalladas en el resumen
+INTERVALO_REVISION = 600        # Segundos entre revisiones del hilo
+# Eventos que pueden cambiar un contador esperado o guardado
+TIPOS_EVENTO = (
+    'orden.creado', 'orden.actualizado', 'orden.eliminado',
+    'bloque.creado', 'bloque.actualizado',
+    'fresa_instalada.creado', 'fresa_instalada.actualizado',
+)
+
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+def _en_lotes(valores, tamano=LOTE_IN):
+    valores = list(valores)
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def _normalizar_codigos(serie):
+    # Mismo conjunto de códigos sin importar el orden ni las comas sobrantes
+    return serie.fillna('').map(lambda texto: ','.join(sorted(c for c in texto.split(',') if c)))
+
+
+def _numeros(serie):
+    # cantidad_modelos puede venir como texto (editar_orden guarda el valor del formulario)
+    return pd.to_numeric(serie, errors='coerce').fillna(0).astype('int64')
+
+
+def _esperado_bloques(ids):
+    """
+    DataFrame indexado por bloque_id con 'modelos_esperados' y 'codigos_esperados' (en orden de creación).
+    """
+    # Se une solo por codigo_barra (usa su índice); la sede y la fecha se comparan después, en el DataFrame
+    df = leer_df(
+        select(
+            Bloque.id.label('bloque_id'), Bloque.sede_id.label('sede_bloque'), Bloque.fecha_creacion.label('fecha_bloque'),
+            Orden.sede_id.label('sede_orden'), Orden.codigo_orden, Orden.cantidad_modelos,
+            Orden.fecha_creacion.label('fecha_orden'),
+        )
+        .join(Orden, Orden.codigo_barra == Bloque.codigo_barra)
+        .where(Bloque.id.in_(ids))
+        .order_by(Orden.id),
+        columnas_fecha=['fecha_bloque', 'fecha_orden'],
+    )
+    en_fecha = df['fecha_bloque'].isna() | df['fecha_orden'].isna() | (df['fecha_orden'] >= df['fecha_bloque'] - MARGEN_BLOQUE)
+    df = df[(df['sede_orden'] == df['sede_bloque']) & en_fecha]
+    return df.assign(
+        cantidad_modelos=_numeros(df['cantidad_modelos']),
+        codigo_orden=df['codigo_orden'].fillna(''),
+    ).groupby('bloque_id', sort=False).agg(
+        modelos_esperados=('cantidad_modelos', 'sum'),
+        codigos_esperados=('codigo_orden', lambda codigos: ','.join(c for c in codigos if c)),
+    )
+
+
+def _diferencias_bloques(ids):
+    """
+    Bloques usados (de ids) cuyo contador guardado no coincide con las órdenes, con ambos valores.
+    """
+    guardados = leer_df(
+        select(Bloque.id, Bloque.sede_id, Bloque.modelos_fresados, Bloque.codigos_orden_fresados)
+        .where(Bloque.id.in_(ids), Bloque.estado == 'usado')
+    )
+    if guardados.empty:
+        return guardados, 0
+    df = guardados.merge(_esperado_bloques(ids), left_on='id', right_index=True, how='left')
+    df['modelos_esperados'] = df['modelos_esperados'].fillna(0).astype('int64')
+    df['codigos_esperados'] = df['codigos_esperados'].fillna('')
+    distinto = (
+        (_numeros(df['modelos_fresados']) != df['modelos_esperados'])
+        | (_normalizar_codigos(df['codigos_orden_fresados']) != _normalizar_codigos(df['codigos_esperados']))
+    )
+    return df[distinto], len(df)
+
+
+def _reparar_bloques(diferencias):
+    ahora = datetime.utcnow()
+    # UPDATE masivo por clave primaria: no pasa por el ORM, así que la fecha y el evento se ponen a mano
+    db.session.execute(update(Bloque), [
+        {
+            'id': int(fila.id),
+            'modelos_fresados': int(fila.modelos_esperados),
+            'codigos_orden_fresados': fila.codigos_esperados or None,
+            'fecha_actualizacion': ahora,
+        }
+        for fila in diferencias.itertuples()
+    ])
+    # Un evento por sede: cada laboratorio solo lee los eventos de sus filas
+    for sede_id, filas in diferencias.groupby('sede_id'):
+        registrar('contadores.conciliados', 'bloque', {'bloques': _detalle_bloques(filas)}, sede_id=int(sede_id))
+
+
+def _detalle_bloques(diferencias, maximo=None):
+    filas = diferencias if maximo is None else diferencias.head(maximo)
+    return [
+        {
+            'id': int(fila.id),
+            'modelos_fresados': [None if pd.isna(fila.modelos_fresados) else int(fila.modelos_fresados),
+                                 int(fila.modelos_esperados)],
+            'codigos_orden_fresados': [fila.codigos_orden_fresados, fila.codigos_esperados or None],
+        }
+        for fila in filas.itertuples()
+    ]
+
+
+def _diferencias_fresas(ids=None):
+    """
+    Fresas instaladas (todas o las de ids) cuyo contador no coincide con las órdenes que les corresponden.
+    """
+    consulta = select(
+        FresaInstalada.id, FresaInstalada.sede_id, FresaInstalada.maquina, FresaInstalada.materiales,
+        FresaInstalada.fecha_instalacion, FresaInstalada.modelos_fresados,
+    )
+    if ids is not None:
+        # Todas las fresas de esas máquinas: una orden va a la más reciente, aunque esa no esté en ids
+        consulta = consulta.where(FresaInstalada.maquina.in_(
+            select(FresaInstalada.maquina).where(FresaInstalada.id.in_(ids)).scalar_subquery()
+        ))
+    fresas = leer_df(consulta, columnas_fecha=['fecha_instalacion'])
+    if fresas.empty:
+        return fresas, 0
+    fresas['fecha_instalacion'] = fresas['fecha_instalacion'].fillna(pd.Timestamp('1970-01-01'))
+    # Una fila por (fresa, material aceptado), como la búsqueda LIKE de ordenes()
+    por_material = fresas.assign(
+        material=fresas['materiales'].fillna('').str.split(','),
+    ).explode('material')
+    por_material['material'] = por_material['material'].str.strip().str.lower()
+    por_material = por_material[por_material['material'] != '']
+    ordenes = leer_df(
+        select(Orden.sede_id, Orden.maquina, Orden.material, Orden.fecha_creacion, Orden.cantidad_modelos)
+        .where(
+            Orden.maquina.in_(fresas['maquina'].dropna().unique().tolist()),
+            Orden.fecha_creacion >= fresas['fecha_instalacion'].min().to_pydatetime(),
+        ),
+        columnas_fecha=['fecha_creacion'],
+    ).dropna(subset=['fecha_creacion', 'material'])
+    esperado = pd.Series(dtype='int64')
+    if not ordenes.empty:
+        ordenes['material'] = ordenes['material'].str.strip().str.lower()
+        ordenes['cantidad_modelos'] = _numeros(ordenes['cantidad_modelos'])
+        # Cada orden a la fresa más reciente instalada antes de la orden, en su máquina y material
+        asignadas = pd.merge_asof(
+            ordenes.sort_values('fecha_creacion'),
+            por_material[['id', 'sede_id', 'maquina', 'material', 'fecha_instalacion']].sort_values('fecha_instalacion'),
+            left_on='fecha_creacion', right_on='fecha_instalacion',
+            by=['sede_id', 'maquina', 'material'], direction='backward',
+        ).dropna(subset=['id'])
+        esperado = asignadas.groupby(asignadas['id'].astype('int64'))['cantidad_modelos'].sum()
+    fresas['modelos_esperados'] = fresas['id'].map(esperado).fillna(0).astype('int64')
+    distinto = _numeros(fresas['modelos_fresados']) != fresas['modelos_esperados']
+    return fresas[distinto], len(fresas)
+
+
+def _reparar_fresas(diferencias):
+    # Son pocas: con el ORM se recalcula su desgaste y queda el evento de cada una
+    esperados = dict(zip(diferencias['id'].astype(int), diferencias['modelos_esperados'].astype(int)))
+    for fresa in FresaInstalada.query.filter(FresaInstalada.id.in_(list(esperados))).all():
+        fresa.modelos_fresados = esperados[fresa.id]
+
+
+def _resumen():
+    return {
+        'bloques': {'revisados': 0, 'diferencias': 0, 'ejemplos': []},
+        'fresas': {'revisadas': 0, 'diferencias': 0, 'ejemplos': []},
+    }
+
+
+def _conciliar(resumen, bloque_ids, fresa_ids, reparar):
+    """
+    Revisa (y repara) los bloques y fresas dados; fresa_ids=None revisa todas las fresas instaladas.
+    """
+    for lote in _en_lotes(sorted(bloque_ids), LOTE_BLOQUES):
+        diferencias, revisados = _diferencias_bloques(lote)
+        resumen['bloques']['revisados'] += revisados
+        resumen['bloques']['diferencias'] += len(diferencias)
+        ejemplos = resumen['bloques']['ejemplos']
+        ejemplos.extend(_detalle_bloques(diferencias, MAX_EJEMPLOS - len(ejemplos)))
+        if reparar and len(diferencias):
+            _reparar_bloques(diferencias)
+    if fresa_ids is None or fresa_ids:
+        diferencias, revisadas = _diferencias_fresas(None if fresa_ids is None else sorted(fresa_ids))
+        resumen['fresas']['revisadas'] += revisadas
+        resumen['fresas']['diferencias'] += len(diferencias)
+        resumen['fresas']['ejemplos'].extend(
+            {'id': int(f.id), 'modelos_fresados': [None if pd.isna(f.modelos_fresados) else int(f.modelos_fresados),
+                                                   int(f.modelos_esperados)]}
+            for f in diferencias.head(MAX_EJEMPLOS).itertuples()
+        )
+        if reparar and len(diferencias):
+            _reparar_fresas(diferencias)
+
+
+def _tocados(eventos):
+    """
+    Ids de los bloques y fresas cuyo contador pudo cambiar con estos eventos.
+    """
+    bloque_ids, fresa_ids, orden_ids = set(), set(), set()
+    codigos, maquinas = set(), set()
+    for e in eventos:
+        datos = e['datos']
+        if e['entidad'] == 'orden':
+            if e['tipo'] == 'orden.actualizado':
+                # Solo trae las columnas que cambiaron ([antes, después]); el resto se busca en la orden
+                orden_ids.add(e['entidad_id'])
+                codigos.update(datos.get('codigo_barra') or [])
+                maquinas.update(datos.get('maquina') or [])
+            else:
+                codigos.add(datos.get('codigo_barra'))
+                maquinas.add(datos.get('maquina'))
+        elif e['entidad'] == 'bloque':
+            bloque_ids.add(e['entidad_id'])
+        elif e['entidad'] == 'fresa_instalada':
+            fresa_ids.add(e['entidad_id'])
+    for lote in _en_lotes(i for i in orden_ids if i is not None):
+        for codigo, maquina in db.session.query(Orden.codigo_barra, Orden.maquina).filter(Orden.id.in_(lote)).all():
+            codigos.add(codigo)
+            maquinas.add(maquina)
+    for lote in _en_lotes(c for c in codigos if c):
+        bloque_ids.update(i for (i,) in db.session.query(Bloque.id).filter(Bloque.codigo_barra.in_(lote)).all())
+    for lote in _en_lotes(m for m in maquinas if m):
+        fresa_ids.update(i for (i,) in db.session.query(FresaInstalada.id).filter(FresaInstalada.maquina.in_(lote)).all())
+    bloque_ids.discard(None)
+    fresa_ids.discard(None)
+    return bloque_ids, fresa_ids
+
+
+def conciliar_contadores(reparar=False, completo=False):
+    """
+    Compara los contadores con las órdenes y devuelve el resumen de diferencias (y las repara si reparar=True).
+    """
+    inicio = time.perf_counter()
+    resumen = _resumen()
+    eventos = 0
+    if completo:
+        # Los eventos posteriores a este punto los revisa la próxima pasada incremental
+        posicion = ultima_posicion()
+        consulta = db.session.query(Bloque.id).filter(Bloque.estado == 'usado').order_by(Bloque.id)
+        ultimo_id = 0
+        while True:
+            ids = [i for (i,) in consulta.filter(Bloque.id > ultimo_id).limit(LOTE_BLOQUES).all()]
+            if not ids:
+                break
+            _conciliar(resumen, ids, set(), reparar)
+            if reparar:
+                db.session.commit()
+            ultimo_id = ids[-1]
+        _conciliar(resumen, (), None, reparar)
+        if reparar:
+            fijar_checkpoint(CONSUMIDOR, posicion)
+            db.session.commit()
+    elif reparar:
+        # Cada lote de eventos se concilia y confirma junto con su checkpoint
+        eventos = procesar(CONSUMIDOR, lambda lote: _conciliar(resumen, *_tocados(lote), True), TIPOS_EVENTO)
+    else:
+        # Solo informar: se leen los eventos pendientes sin mover el checkpoint
+        bloque_ids, fresa_ids = set(), set()
+        posicion = posicion_consumidor(CONSUMIDOR)
+        while True:
+            lote = leer_eventos(posicion, tipos=TIPOS_EVENTO)
+            if not lote:
+                break
+            tocados = _tocados(lote)
+            bloque_ids |= tocados[0]
+            fresa_ids |= tocados[1]
+            posicion = lote[-1]['id']
+            eventos += len(lote)
+        _conciliar(resumen, bloque_ids, fresa_ids, False)
+    if not reparar:
+        db.session.rollback()
+    resumen.update({
+        'modo': 'completo' if completo else 'incremental',
+        'reparado': reparar,
+        'eventos': eventos,
+        'segundos': round(time.perf_counter() - inicio, 3),
+    })
+    return resumen
+
+
+def ejecutar_conciliacion(forzar=False):
+    """
+    Pasada incremental con reparación si pasó el intervalo configurado (o si forzar=True). Devuelve el resumen o None.
+    """
+    intervalo = timedelta(hours=current_app.config.get('CONCILIACION_HORAS') or 1)
+    if not reservar_tarea(TAREA, timedelta(0) if forzar else intervalo):
+        return None
+    resultado = conciliar_contadores(reparar=True)
+    tarea = TareaProgramada.query.filter_by(nombre=TAREA).first()
+    tarea.duracion = resultado['segundos']
+    tarea.resultado = json.dumps({
+        'eventos': resultado['eventos'],
+        'bloques': resultado['bloques']['diferencias'],
+        'fresas': resultado['fresas']['diferencias'],
+    })
+    db.session.commit()
+    if resultado['bloques']['diferencias'] or resultado['fresas']['diferencias']:
+        current_app.logger.info('Contadores corregidos: %s bloques, %s fresas',
+                                resultado['bloques']['diferencias'], resultado['fresas']['diferencias'])
+    return resultado
+
+
+def _ciclo(app):
+    while True:
+        time.sleep(INTERVALO_REVISION)
+        with app.app_context():
+            try:
+                ejecutar_conciliacion()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Falló la conciliación programada de contadores')
+            finally:
+                db.session.remove()
+
+
+def init_conciliacion(app):
+    """
+    Registra el comando 'flask conciliar-contadores' y arranca el hilo de la conciliación programada.
+    """
+    @app.cli.command('conciliar-contadores')
+    @click.option('--reparar', is_flag=True, help='Corregir los contadores distintos (si no, solo se informan).')
+    @click.option('--completo', is_flag=True, help='Revisar todos los bloques y fresas, no solo los tocados.')
+    def comando_conciliar(reparar, completo):
+        resultado = conciliar_contadores(reparar=reparar, completo=completo)
+        click.echo(json.dumps(resultado, indent=2, ensure_ascii=False, default=str))
+
+    global _hilo
+    if not app.config.get('CONCILIACION_HORAS'):
+        return
+    with _hilo_lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_ciclo, args=(app,), name='conciliacion-contadores', daemon=True)
+            _hilo.start()
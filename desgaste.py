@@ -0,0 +1,211 @@
+"""
+Este archivo estima el desgaste de las fresas y predice cuándo hay que reemplazarlas.
+
+Paso a paso:
+1. Con el historial de fresas retiradas (FresaHistorial) se ajusta un modelo simple de vida útil:
+   la mediana de modelos fresados por (tipo, material), por tipo y global.
+   Si no hay suficientes muestras se usa la vida configurada ('vida_fresa_modelos').
+2. Para cada fresa instalada se calcula la vida estimada, los modelos que le quedan
+   y la fecha de reemplazo según su ritmo de uso (modelos por día desde su instalación).
+3. Las predicciones se guardan en la propia fresa instalada y se recalculan antes de cada guardado
+   (evento before_flush) solo para las fresas que cambiaron, por ejemplo al crear una orden.
+4. Cuando el modelo cambia se recalculan todas las fresas instaladas: al retirar una fresa (en la misma
+   petición POST) y en la tarea programada de mantenimiento (refrescar_sedes, por ejemplo si cambió la
+   configuración). Las páginas y la API (GET) solo leen las predicciones guardadas, no escriben.
+
+Así la página de fresas y la API muestran qué fresas están por terminarse.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select
+from extensions import db
+from sedes import leer_df, sede_actual, en_sede
+from models import FresaInstalada, FresaHistorial, Configuracion, Sede, SEDE_DEFECTO
+
+VIDA_FRESA_DEFECTO = 600     # Modelos que aguanta una fresa si no hay otro dato
+MIN_MUESTRAS = 3             # Fresas retiradas necesarias para confiar en una mediana
+
+# Modelo ajustado por sede: {sede: {'firma': ..., 'vidas': ..., 'refrescado': ...}}
+_modelos = {}
+_modelo_lock = threading.Lock()
+
+
+def _modelo():
+    return _modelos.setdefault(sede_actual(), {'firma': None, 'vidas': None, 'refrescado': None})
+
+
+def vida_fresa_configurada():
+    """
+    Vida de una fresa en modelos, leída de la configuración 'vida_fresa_modelos'.
+    """
+    valores = Configuracion.get_lista('vida_fresa_modelos', default=[str(VIDA_FRESA_DEFECTO)])
+    try:
+        return max(int(valores[0]), 1)
+    except (ValueError, IndexError):
+        return VIDA_FRESA_DEFECTO
+
+
+def _firma_modelo():
+    historial = db.session.query(func.count(FresaHistorial.id), func.max(FresaHistorial.id)).one()
+    return tuple(historial) + (vida_fresa_configurada(),)
+
+
+def ajustar_modelo():
+    """
+    Calcula las vidas medianas a partir del historial. Devuelve (por_tipo_material, por_tipo, global).
+    """
+    df = leer_df(
+        select(FresaHistorial.tipo, FresaHistorial.materiales, FresaHistorial.modelos_fresados)
+        .where(FresaHistorial.modelos_fresados > 0)
+    )
+    vida_defecto = vida_fresa_configurada()
+    if df.empty:
+        return {}, {}, vida_defecto
+    df['tipo'] = df['tipo'].fillna('').str.strip()
+    por_tipo = df.groupby('tipo')['modelos_fresados'].agg(['median', 'count'])
+    por_tipo = por_tipo[por_tipo['count'] >= MIN_MUESTRAS]['median']
+    vida_global = float(df['modelos_fresados'].median()) if len(df) >= MIN_MUESTRAS else vida_defecto
+    # Una fresa compatible con varios materiales aporta una muestra a cada material
+    df['material'] = df['materiales'].fillna('').str.lower().str.split(',')
+    df = df.explode('material')
+    df['material'] = df['material'].str.strip()
+    df = df[df['material'] != '']
+    por_tm = df.groupby(['tipo', 'material'])['modelos_fresados'].agg(['median', 'count'])
+    por_tm = por_tm[por_tm['count'] >= MIN_MUESTRAS]['median']
+    return (
+        {k: int(v) for k, v in por_tm.items()},
+        {k: int(v) for k, v in por_tipo.items()},
+        int(vida_global),
+    )
+
+
+def modelo_actual():
+    """
+    Devuelve el modelo ajustado; solo se vuelve a ajustar si cambió el historial o la configuración.
+    """
+    firma = _firma_modelo()
+    with _modelo_lock:
+        modelo = _modelo()
+        if modelo['firma'] == firma:
+            return modelo['vidas']
+    vidas = ajustar_modelo()
+    with _modelo_lock:
+        modelo.update(firma=firma, vidas=vidas)
+    return vidas
+
+
+def vida_para(tipo, materiales, vidas):
+    """
+    Vida estimada de una fresa: la menor entre sus materiales; si no hay datos, la del tipo o la global.
+    """
+    por_tm, por_tipo, vida_global = vidas
+    tipo = (tipo or '').strip()
+    candidatas = [por_tm[(tipo, m.lower())] for m in materiales if (tipo, m.lower()) in por_tm]
+    if candidatas:
+        return min(candidatas)
+    return por_tipo.get(tipo, vida_global)
+
+
+def predecir(fresa, vidas, ahora=None):
+    """
+    Actualiza vida_estimada y fecha_reemplazo_estimada de una fresa instalada.
+    """
+    ahora = ahora or datetime.utcnow()
+    vida = vida_para(fresa.tipo, fresa.get_materiales(), vidas)
+    modelos = fresa.modelos_fresados or 0
+    restante = max(vida - modelos, 0)
+    fecha = None
+    if modelos > 0:
+        dias_uso = max((ahora - (fresa.fecha_instalacion or ahora)).total_seconds() / 86400, 1)
+        tasa = modelos / dias_uso
+        fecha = ahora + timedelta(days=restante / tasa)
+    fresa.vida_estimada = vida
+    fresa.fecha_reemplazo_estimada = fecha
+
+
+def resumen(fresa, ahora=None):
+    """
+    Datos de desgaste de una fresa listos para mostrar o devolver como JSON.
+    """
+    ahora = ahora or datetime.utcnow()
+    vida = fresa.vida_estimada or VIDA_FRESA_DEFECTO
+    modelos = fresa.modelos_fresados or 0
+    fecha = fresa.fecha_reemplazo_estimada
+    return {
+        'id': fresa.id,
+        'tipo': fresa.tipo,
+        'maquina': fresa.maquina,
+        'materiales': fresa.materiales,
+        'modelos_fresados': modelos,
+        'vida_estimada': vida,
+        'modelos_restantes': max(vida - modelos, 0),
+        'desgaste': round(min(modelos / vida, 1), 3),
+        'fecha_reemplazo_estimada': fecha.strftime('%Y-%m-%d') if fecha else None,
+        'dias_restantes': round((fecha - ahora).total_seconds() / 86400, 1) if fecha else None,
+    }
+
+
+def refrescar_predicciones():
+    """
+    Recalcula todas las fresas instaladas si el modelo cambió desde el último refresco.
+    """
+    vidas = modelo_actual()
+    with _modelo_lock:
+        modelo = _modelo()
+        actual = modelo['firma']
+        if modelo['refrescado'] == actual:
+            return False
+    ahora = datetime.utcnow()
+    for fresa in FresaInstalada.query.all():
+        predecir(fresa, vidas, ahora)
+    db.session.commit()
+    with _modelo_lock:
+        modelo['refrescado'] = actual
+    return True
+
+
+def refrescar_sedes():
+    """
+    Ejecuta refrescar_predicciones() en cada sede (tareas fuera de una petición). Devuelve cuántas se recalcularon.
+    """
+    sedes = {s.id for s in Sede.query.all()} | {SEDE_DEFECTO}
+    refrescadas = 0
+    for sede in sorted(sedes):
+        with en_sede(sede):
+            refrescadas += refrescar_predicciones()
+    return refrescadas
+
+
+def fresas_por_reemplazar(dias=14, umbral=0.9):
+    """
+    Fresas cuya fecha de reemplazo cae dentro de los próximos días o que superan el umbral de desgaste.
+    """
+    ahora = datetime.utcnow()
+    resultado = []
+    for fresa in FresaInstalada.query.order_by(FresaInstalada.fecha_reemplazo_estimada.asc()).all():
+        datos = resumen(fresa, ahora)
+        proxima = datos['dias_restantes'] is not None and datos['dias_restantes'] <= dias
+        if proxima or datos['desgaste'] >= umbral:
+            resultado.append(datos)
+    return resultado
+
+
+def _antes_de_guardar(session, flush_context, instances):
+    # Solo se recalculan las fresas nuevas o modificadas en este guardado
+    fresas = [o for o in list(session.new) + list(session.dirty) if isinstance(o, FresaInstalada)]
+    if not fresas:
+        return
+    with session.no_autoflush:
+        vidas = modelo_actual()
+    ahora = datetime.utcnow()
+    for fresa in fresas:
+        predecir(fresa, vidas, ahora)
+
+
+def init_desgaste():
+    """
+    Registra el recálculo de predicciones en cada guardado de la sesión.
+    """
+    if not event.contains(db.session, 'before_flush', _antes_de_guardar):
+        event.listen(db.session, 'before_flush', _antes_de_guardar)
@@ -0,0 +1,191 @@
+"""
+Este archivo resuelve un código escaneado: puede ser un caso (pendiente u orden), un bloque o un bloque del historial.
+
+Paso a paso:
+1. Se busca el código exacto en las columnas indexadas:
+   - OrdenPendiente.codigo_orden y Orden.codigo_orden (casos),
+   - Bloque.codigo_barra (bloques usados, generados en generar_codigo_bloque),
+   - BloqueHistorial.codigo_barra (bloques eliminados).
+2. Para cada coincidencia se agregan sus datos relacionados:
+   - un caso trae sus órdenes, el bloque donde se fresó y la fresa que lo fresó,
+   - un bloque trae las órdenes fresadas en él.
+3. Si no hay coincidencias exactas (o se pide con prefijo=True) se buscan los códigos que empiezan igual.
+   La búsqueda por prefijo no depende de la collation de la base de datos:
+   - Postgres: LIKE 'p%' con los comodines del código escapados, sobre índices varchar_pattern_ops
+     (models.indice_prefijo); un índice normal con collation distinta de "C" no sirve para LIKE.
+   - SQLite: GLOB 'p*' (distingue mayúsculas igual que LIKE en Postgres), que usa el índice normal de la columna.
+4. Cada búsqueda devuelve pocas filas, así que la respuesta tarda milisegundos aunque las tablas sean grandes.
+
+Así un solo escaneo muestra toda la trazabilidad del caso o del bloque.
+"""
+
+import re
+import time
+from extensions import db
+from models import Orden, Bloque, BloqueHistorial, OrdenPendiente, FresaInstalada, FresaHistorial
+
+LIMITE_PREFIJO = 10  # Coincidencias por tipo en la búsqueda por prefijo
+
+
+def _fecha(valor):
+    return valor.isoformat() if valor else None
+
+
+def _datos_orden(o):
+    return {
+        'id': o.id, 'codigo_orden': o.codigo_orden, 'material': o.material, 'marca': o.marca,
+        'shade': o.shade, 'codigo_barra': o.codigo_barra, 'maquina': o.maquina,
+        'cantidad_modelos': o.cantidad_modelos, 'fecha_creacion': _fecha(o.fecha_creacion),
+    }
+
+
+def _datos_bloque(b, historial=False):
+    datos = {
+        'id': b.id, 'material': b.material, 'marca': b.marca, 'shade': b.shade, 'grosor': b.grosor,
+        'cantidad': b.cantidad, 'codigo_barra': b.codigo_barra, 'estado': b.estado,
+        'modelos_fresados': b.modelos_fresados, 'codigos_orden_fresados': b.get_codigos_orden_fresados(),
+        'fecha_creacion': _fecha(b.fecha_creacion), 'historial': historial,
+    }
+    if historial:
+        datos['bloque_id'] = b.bloque_id
+        datos['fecha_eliminacion'] = _fecha(b.fecha_eliminacion)
+    return datos
+
+
+def _datos_fresa(f, retirada=False):
+    return {
+        'id': f.id, 'tipo': f.tipo, 'diametro': f.diametro, 'maquina': f.maquina, 'materiales': f.materiales,
+        'modelos_fresados': f.modelos_fresados, 'fecha_instalacion': _fecha(f.fecha_instalacion),
+        'fecha_retiro': _fecha(f.fecha_retiro) if retirada else None, 'retirada': retirada,
+    }
+
+
+def bloque_de_orden(orden):
+    """
+    Bloque donde se fresó la orden: el bloque usado actual o, si ya se eliminó, su entrada del historial.
+    """
+    if not orden.codigo_barra:
+        return None
+    bloque = Bloque.query.filter(Bloque.codigo_barra == orden.codigo_barra).first()
+    if bloque:
+        return _datos_bloque(bloque)
+    historial = (
+        BloqueHistorial.query.filter(BloqueHistorial.codigo_barra == orden.codigo_barra)
+        .order_by(BloqueHistorial.fecha_eliminacion.desc()).first()
+    )
+    return _datos_bloque(historial, historial=True) if historial else None
+
+
+def fresa_de_orden(orden):
+    """
+    Fresa que estaba instalada en la máquina de la orden, compatible con su material, cuando se creó la orden.
+    Igual que al crear órdenes, se toma la instalada más recientemente.
+    """
+    if not orden.maquina:
+        return None
+    fecha = orden.fecha_creacion
+    material = f'%{orden.material or ""}%'
+    consulta = FresaInstalada.query.filter(FresaInstalada.maquina == orden.maquina, FresaInstalada.materiales.like(material))
+    if fecha:
+        consulta = consulta.filter(FresaInstalada.fecha_instalacion <= fecha)
+    fresa = consulta.order_by(FresaInstalada.fecha_instalacion.desc()).first()
+    if fresa:
+        return _datos_fresa(fresa)
+    if not fecha:
+        return None
+    retirada = (
+        FresaHistorial.query.filter(
+            FresaHistorial.maquina == orden.maquina,
+            FresaHistorial.materiales.like(material),
+            FresaHistorial.fecha_instalacion <= fecha,
+            FresaHistorial.fecha_retiro >= fecha,
+        ).order_by(FresaHistorial.fecha_instalacion.desc()).first()
+    )
+    return _datos_fresa(retirada, retirada=True) if retirada else None
+
+
+def _coincidencias(codigo):
+    resultados = []
+    pendiente = OrdenPendiente.query.filter(OrdenPendiente.codigo_orden == codigo).first()
+    if pendiente:
+        resultados.append({
+            'tipo': 'pendiente',
+            'pendiente': {
+                'id': pendiente.id, 'codigo_orden': pendiente.codigo_orden,
+                'fecha_escaneo': _fecha(pendiente.fecha_escaneo), 'material': pendiente.material,
+                'shade': pendiente.shade, 'cantidad_modelos': pendiente.cantidad_modelos,
+            },
+        })
+    ordenes = Orden.query.filter(Orden.codigo_orden == codigo).order_by(Orden.fecha_creacion.desc()).all()
+    for orden in ordenes:
+        resultados.append({
+            'tipo': 'orden',
+            'orden': _datos_orden(orden),
+            'bloque': bloque_de_orden(orden),
+            'fresa': fresa_de_orden(orden),
+        })
+    bloques = [(b, False) for b in Bloque.query.filter(Bloque.codigo_barra == codigo).all()]
+    bloques += [
+        (h, True)
+        for h in BloqueHistorial.query.filter(BloqueHistorial.codigo_barra == codigo)
+        .order_by(BloqueHistorial.fecha_eliminacion.desc()).all()
+    ]
+    if bloques:
+        # Las órdenes de un bloque se buscan por Orden.codigo_barra (indexado), no en el texto de códigos
+        ordenes_bloque = Orden.query.filter(Orden.codigo_barra == codigo).order_by(Orden.fecha_creacion.asc()).all()
+        for bloque, historial in bloques:
+            resultados.append({
+                'tipo': 'bloque_historial' if historial else 'bloque',
+                'bloque': _datos_bloque(bloque, historial=historial),
+                'ordenes': [_datos_orden(o) for o in ordenes_bloque],
+            })
+    return resultados
+
+
+def _empieza_por(columna, prefijo):
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # En GLOB los comodines son * ? y [: se escriben entre corchetes para que valgan como texto
+        return columna.op('GLOB')(re.sub(r'([*?\[])', r'[\1]', prefijo) + '*')
+    # LIKE :prefijo || '%' con % _ y el carácter de escape escapados
+    return columna.startswith(prefijo, autoescape=True)
+
+
+def _por_prefijo(columna, prefijo, limite):
+    return [
+        fila[0]
+        for fila in columna.class_.query.with_entities(columna)
+        .filter(_empieza_por(columna, prefijo))
+        .distinct().order_by(columna).limit(limite).all()
+    ]
+
+
+def sugerencias_prefijo(prefijo, limite=LIMITE_PREFIJO):
+    """
+    Códigos que empiezan por el prefijo, agrupados por tipo.
+    """
+    return {
+        'pendiente': _por_prefijo(OrdenPendiente.codigo_orden, prefijo, limite),
+        'orden': _por_prefijo(Orden.codigo_orden, prefijo, limite),
+        'bloque': _por_prefijo(Bloque.codigo_barra, prefijo, limite),
+        'bloque_historial': _por_prefijo(BloqueHistorial.codigo_barra, prefijo, limite),
+    }
+
+
+def resolver_codigo(codigo, prefijo=False, limite=LIMITE_PREFIJO):
+    """
+    Resuelve un código escaneado. Devuelve las coincidencias exactas y, si hace falta, las sugerencias por prefijo.
+    """
+    inicio = time.perf_counter()
+    codigo = (codigo or '').strip()
+    resultados = _coincidencias(codigo) if codigo else []
+    sugerencias = None
+    if codigo and (prefijo or not resultados):
+        sugerencias = sugerencias_prefijo(codigo, limite)
+    return {
+        'codigo': codigo,
+        'encontrado': bool(resultados),
+        'tipos': sorted({r['tipo'] for r in resultados}),
+        'resultados': resultados,
+        'sugerencias': sugerencias,
+        'tiempo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+    }
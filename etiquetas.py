@@ -0,0 +1,196 @@
+"""
+Este archivo arma las etiquetas con código de barras (Code128) de los bloques, en PDF o en ZPL (impresoras Zebra).
+
+Paso a paso:
+1. Se leen los bloques pedidos (solo los que tienen codigo_barra, ver generar_codigo_bloque en utils.py).
+   Cada etiqueta lleva el código de barras, el código escrito y material, shade, grosor y marca.
+2. Cada etiqueta se dibuja por separado con code128.py (Code128 sin librerías externas): en PDF como
+   rectángulos y texto, en ZPL con el comando ^BC. El dibujo se guarda por el hash de su contenido en memoria
+   y en ETIQUETAS_CACHE_DIR: reimprimir un bloque no vuelve a dibujarlo, y los workers comparten la caché.
+3. Si faltan muchas etiquetas en la caché (ETIQUETAS_MINIMO_POOL o más) se dibujan en un pool de procesos
+   (ETIQUETAS_PROCESOS, 0 lo desactiva); con pocas no conviene pagar el envío entre procesos.
+4. El PDF tiene una página del tamaño de la etiqueta (ETIQUETAS_ANCHO_MM x ETIQUETAS_ALTO_MM) por bloque.
+
+Así se imprimen de una vez las etiquetas de una entrega o de una tanda de fresado.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from extensions import db
+from models import Bloque
+from reportes import CacheLRU
+from code128 import PUNTOS_POR_MM, dibujar, simbolos_code128
+
+VERSION = 1                 # Cambiarla invalida las etiquetas guardadas (si cambia el dibujo)
+ETIQUETAS_ENTRADAS = 2000   # Etiquetas guardadas en memoria por worker
+ETIQUETAS_SEGUNDOS = 86400  # El contenido no cambia para un mismo hash: solo se limita la memoria
+FORMATOS = {'pdf': 'application/pdf', 'zpl': 'text/plain'}
+_cache = CacheLRU(ETIQUETAS_ENTRADAS, ETIQUETAS_SEGUNDOS)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _clave(formato, datos, medidas):
+    contenido = json.dumps([VERSION, formato, datos, medidas], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def _ruta_cache(clave, formato):
+    directorio = current_app.config.get('ETIQUETAS_CACHE_DIR')
+    return os.path.join(directorio, clave[:2], f'{clave}.{formato}') if directorio else None
+
+
+def _leer_cache(clave, formato):
+    dibujo = _cache.obtener(clave)
+    if dibujo is not None:
+        return dibujo
+    ruta = _ruta_cache(clave, formato)
+    if ruta and os.path.exists(ruta):
+        try:
+            with open(ruta, 'rb') as archivo:
+                dibujo = archivo.read()
+        except OSError:
+            return None
+        _cache.guardar(clave, dibujo)
+    return dibujo
+
+
+def _guardar_cache(clave, formato, dibujo):
+    _cache.guardar(clave, dibujo)
+    ruta = _ruta_cache(clave, formato)
+    if not ruta:
+        return
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Se escribe aparte y se renombra: otro worker nunca lee un archivo a medias
+        temporal = f'{ruta}.{os.getpid()}.tmp'
+        with open(temporal, 'wb') as archivo:
+            archivo.write(dibujo)
+        os.replace(temporal, ruta)
+    except OSError:
+        current_app.logger.warning('No se pudo guardar la etiqueta en la caché %s', ruta, exc_info=True)
+
+
+def _obtener_pool(procesos):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn': el proceso hijo no hereda los hilos ni las conexiones abiertas del worker
+            _pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def dibujar_etiquetas(etiquetas, formato='pdf'):
+    """
+    Dibujo de cada etiqueta (en el mismo orden), desde la caché o dibujando las que faltan.
+    """
+    config = current_app.config
+    medidas = {
+        'ancho_mm': config.get('ETIQUETAS_ANCHO_MM') or 50,
+        'alto_mm': config.get('ETIQUETAS_ALTO_MM') or 25,
+        'puntos_por_mm': config.get('ETIQUETAS_PUNTOS_POR_MM') or 8,
+    }
+    claves = [_clave(formato, datos, medidas) for datos in etiquetas]
+    dibujos = {}
+    faltantes = {}
+    for clave, datos in zip(claves, etiquetas):
+        if clave in dibujos or clave in faltantes:
+            continue
+        dibujo = _leer_cache(clave, formato)
+        if dibujo is None:
+            faltantes[clave] = datos
+        else:
+            dibujos[clave] = dibujo
+    tareas = [(formato, datos, medidas) for datos in faltantes.values()]
+    procesos = config.get('ETIQUETAS_PROCESOS') or 0
+    if procesos and len(tareas) >= (config.get('ETIQUETAS_MINIMO_POOL') or 1):
+        nuevos = _obtener_pool(procesos).map(dibujar, tareas, chunksize=max(1, len(tareas) // (procesos * 4)))
+    else:
+        nuevos = map(dibujar, tareas)
+    for clave, dibujo in zip(faltantes, nuevos):
+        _guardar_cache(clave, formato, dibujo)
+        dibujos[clave] = dibujo
+    return [dibujos[clave] for clave in claves]
+
+
+def _documento_pdf(dibujos, ancho, alto):
+    """
+    PDF con una página por etiqueta; cada dibujo es el contenido (comprimido) de su página.
+    """
+    objetos = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,  # El árbol de páginas se completa cuando se conocen las páginas
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    ]
+    paginas = []
+    for dibujo in dibujos:
+        numero = len(objetos) + 1
+        paginas.append(f'{numero} 0 R')
+        objetos.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {ancho:.2f} {alto:.2f}] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {numero + 1} 0 R >>'.encode('ascii')
+        )
+        objetos.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(dibujo) + dibujo + b'\nendstream')
+    objetos[1] = f'<< /Type /Pages /Kids [{" ".join(paginas)}] /Count {len(paginas)} >>'.encode('ascii')
+    partes = [b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n']
+    posiciones = []
+    largo = len(partes[0])
+    for numero, objeto in enumerate(objetos, 1):
+        posiciones.append(largo)
+        parte = b'%d 0 obj\n' % numero + objeto + b'\nendobj\n'
+        partes.append(parte)
+        largo += len(parte)
+    partes.append(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1))
+    partes.extend(b'%010d 00000 n \n' % posicion for posicion in posiciones)
+    partes.append(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objetos) + 1, largo))
+    return b''.join(partes)
+
+
+def datos_etiqueta(bloque):
+    """
+    Lo que se imprime de un bloque: el código y una línea con material, shade, grosor y marca.
+    """
+    detalle = ' '.join(str(v) for v in (bloque.material, bloque.shade) if v)
+    if bloque.grosor:
+        detalle += f' {bloque.grosor} mm'
+    if bloque.marca:
+        detalle += f' - {bloque.marca}'
+    return {'codigo': bloque.codigo_barra.strip(), 'detalle': detalle.strip()}
+
+
+def etiquetas_bloques(ids, formato='pdf'):
+    """
+    Documento con las etiquetas de los bloques pedidos, en el orden de ids.
+    Devuelve (contenido, cantidad, omitidos): los bloques sin código o que no existen van en omitidos.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato de etiqueta desconocido: {formato}')
+    ids = list(dict.fromkeys(ids))
+    encontrados = {b.id: b for b in db.session.query(Bloque).filter(Bloque.id.in_(ids)).all()} if ids else {}
+    etiquetas, omitidos = [], []
+    for bloque_id in ids:
+        bloque = encontrados.get(bloque_id)
+        if bloque is None or not (bloque.codigo_barra or '').strip():
+            omitidos.append(bloque_id)
+            continue
+        datos = datos_etiqueta(bloque)
+        try:
+            # Se valida aquí y no al dibujar: un código escrito a mano inválido no corta toda la tanda
+            simbolos_code128(datos['codigo'])
+        except ValueError:
+            omitidos.append(bloque_id)
+            continue
+        etiquetas.append(datos)
+    dibujos = dibujar_etiquetas(etiquetas, formato) if etiquetas else []
+    if formato == 'zpl':
+        contenido = b''.join(dibujos)
+    else:
+        config = current_app.config
+        contenido = _documento_pdf(dibujos, (config.get('ETIQUETAS_ANCHO_MM') or 50) * PUNTOS_POR_MM,
+                                   (config.get('ETIQUETAS_ALTO_MM') or 25) * PUNTOS_POR_MM)
+    return contenido, len(etiquetas), omitidos
@@ -0,0 +1,185 @@
+"""
+Este archivo publica los cambios de la base de datos (casos pendientes, órdenes, bloques) para las páginas abiertas.
+
+Paso a paso:
+1. Al guardar (after_flush) se anotan los cambios relevantes de la sesión:
+   - caso pendiente agregado o eliminado,
+   - orden creada o eliminada,
+   - bloque consumido (se abre un bloque nuevo) o bloque usado actualizado.
+2. Solo cuando la transacción se confirma (after_commit) se publican; si hay rollback se descartan.
+3. La publicación se escribe en un archivo compartido (una línea JSON por evento), así la ven todos los
+   workers de gunicorn. El id de cada evento es la posición (byte) en el archivo, que siempre crece.
+4. Dentro del mismo proceso se avisa al instante a los streams que esperan; los otros workers
+   revisan el archivo cada medio segundo.
+5. Cada evento lleva la sede de la fila; el stream solo envía los de la sede de la página.
+6. Cuando el archivo supera un tamaño máximo se reemplaza por uno nuevo (los lectores lo detectan por el inodo).
+   Los workers se turnan con un archivo de bloqueo aparte (ruta + '.lock'), que nunca se reemplaza: el archivo
+   de eventos se abre por su ruta después de tomar el bloqueo, así nadie escribe en un archivo ya rotado.
+
+Las páginas se conectan por Server-Sent Events (routes/eventos.py) y actualizan sus tablas sin recargar.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import event, inspect
+from extensions import db
+from models import Orden, Bloque, OrdenPendiente
+
+# fcntl solo existe en Unix; en otros sistemas se escribe sin bloqueo de archivo
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+TAMANO_MAXIMO = 5 * 1024 * 1024   # Bytes antes de rotar el archivo de eventos
+
+
+class Difusor:
+    """
+    Difusor de eventos respaldado en un archivo de líneas JSON.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        self._condicion = threading.Condition()
+
+    def configurar(self, ruta):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        for archivo in (ruta, ruta + '.lock'):
+            if not os.path.exists(archivo):
+                open(archivo, 'a').close()
+
+    def publicar(self, eventos):
+        if not eventos or not self.ruta:
+            return
+        lineas = ''.join(json.dumps(e, default=str, ensure_ascii=False) + '\n' for e in eventos)
+        with open(self.ruta + '.lock', 'a') as bloqueo:
+            if fcntl:
+                fcntl.flock(bloqueo, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.ruta) and os.path.getsize(self.ruta) > TAMANO_MAXIMO:
+                    # Rotación: se crea un archivo nuevo y se reemplaza de forma atómica
+                    nuevo = self.ruta + '.nuevo'
+                    open(nuevo, 'w').close()
+                    os.replace(nuevo, self.ruta)
+                # Se abre por ruta con el bloqueo tomado: si otro worker rotó el archivo, se escribe en el nuevo
+                with open(self.ruta, 'a', encoding='utf-8') as f:
+                    f.write(lineas)
+            finally:
+                if fcntl:
+                    fcntl.flock(bloqueo, fcntl.LOCK_UN)
+        with self._condicion:
+            self._condicion.notify_all()
+
+    def posicion_actual(self):
+        """
+        Cursor que apunta al final del archivo (los clientes nuevos solo reciben eventos futuros).
+        """
+        st = os.stat(self.ruta)
+        return f'{st.st_ino}-{st.st_size}'
+
+    def leer_desde(self, cursor):
+        """
+        Devuelve (eventos, nuevo_cursor). Cada evento incluye su 'id' (cursor después de leerlo).
+        """
+        eventos = []
+        with open(self.ruta, 'rb') as f:
+            # El inodo y el tamaño se toman del archivo abierto: el cursor no mezcla dos archivos si rota en medio
+            st = os.fstat(f.fileno())
+            inodo, _, posicion = (cursor or '').partition('-')
+            try:
+                inodo, posicion = int(inodo), int(posicion)
+            except ValueError:
+                inodo, posicion = st.st_ino, st.st_size
+            # El archivo rotó o se truncó: se lee el nuevo desde el principio
+            if inodo != st.st_ino or posicion > st.st_size:
+                posicion = 0
+            if posicion == st.st_size:
+                return [], f'{st.st_ino}-{posicion}'
+            f.seek(posicion)
+            for linea in f:
+                if not linea.endswith(b'\n'):
+                    break  # Línea a medio escribir: se lee en la próxima vuelta
+                posicion += len(linea)
+                try:
+                    datos = json.loads(linea)
+                except ValueError:
+                    continue
+                datos['id'] = f'{st.st_ino}-{posicion}'
+                eventos.append(datos)
+        return eventos, f'{st.st_ino}-{posicion}'
+
+    def esperar(self, timeout):
+        with self._condicion:
+            self._condicion.wait(timeout)
+
+
+difusor = Difusor()
+
+
+def _evento(tipo, **datos):
+    return {'tipo': tipo, 'fecha': datetime.utcnow().isoformat(), 'datos': datos}
+
+
+def _anotar(eventos, tipo, obj, **datos):
+    # La sede va en cada evento para que cada página solo reciba los de su laboratorio
+    eventos.append(_evento(tipo, sede_id=obj.sede_id, **datos))
+
+
+def _despues_de_flush(session, flush_context):
+    eventos = session.info.setdefault('eventos_sse', [])
+    for obj in session.new:
+        if isinstance(obj, OrdenPendiente):
+            _anotar(eventos, 'pendiente_agregado', obj, id=obj.id, codigo_orden=obj.codigo_orden,
+                    fecha_escaneo=obj.fecha_escaneo, material=obj.material, shade=obj.shade,
+                    cantidad_modelos=obj.cantidad_modelos)
+        elif isinstance(obj, Orden):
+            _anotar(eventos, 'orden_creada', obj, id=obj.id, codigo_orden=obj.codigo_orden, material=obj.material,
+                    shade=obj.shade, codigo_barra=obj.codigo_barra, maquina=obj.maquina,
+                    cantidad_modelos=obj.cantidad_modelos)
+        elif isinstance(obj, Bloque) and obj.estado == 'usado':
+            # Un bloque usado nuevo significa que se abrió un bloque del stock
+            _anotar(eventos, 'bloque_consumido', obj, id=obj.id, codigo_barra=obj.codigo_barra,
+                    material=obj.material, shade=obj.shade, grosor=obj.grosor)
+    for obj in session.deleted:
+        if isinstance(obj, OrdenPendiente):
+            _anotar(eventos, 'pendiente_eliminado', obj, id=obj.id, codigo_orden=obj.codigo_orden)
+        elif isinstance(obj, Orden):
+            _anotar(eventos, 'orden_eliminada', obj, id=obj.id, codigo_orden=obj.codigo_orden)
+        elif isinstance(obj, Bloque):
+            _anotar(eventos, 'bloque_eliminado', obj, id=obj.id, estado=obj.estado, codigo_barra=obj.codigo_barra)
+    for obj in session.dirty:
+        if isinstance(obj, Bloque):
+            estado = inspect(obj)
+            if not (estado.attrs.cantidad.history.has_changes() or estado.attrs.modelos_fresados.history.has_changes()):
+                continue
+            _anotar(eventos, 'bloque_actualizado', obj, id=obj.id, estado=obj.estado, cantidad=obj.cantidad,
+                    modelos_fresados=obj.modelos_fresados, codigo_barra=obj.codigo_barra)
+
+
+def _despues_de_commit(session):
+    eventos = session.info.pop('eventos_sse', None)
+    if eventos:
+        difusor.publicar(eventos)
+
+
+def _despues_de_rollback(session, transaccion_previa):
+    session.info.pop('eventos_sse', None)
+
+
+def init_eventos(app):
+    """
+    Configura el archivo de eventos y registra los hooks de la sesión.
+    """
+    ruta = app.config.get('SSE_ARCHIVO') or os.path.join(app.instance_path, 'eventos_sse.jsonl')
+    difusor.configurar(ruta)
+    for nombre, funcion in (
+        ('after_flush', _despues_de_flush),
+        ('after_commit', _despues_de_commit),
+        ('after_soft_rollback', _despues_de_rollback),
+    ):
+        if not event.contains(db.session, nombre, funcion):
+            event.listen(db.session, nombre, funcion)
@@ -5,11 +5,14 @@ Paso a paso:
 1. Se importa la clase SQLAlchemy, que permite trabajar con bases de datos de manera sencilla.
 2. Se crea una instancia de SQLAlchemy llamada db, que se usará en toda la aplicación para definir y manipular la base de datos.
 
+3. La sesión es SesionEnrutada (replica.py): las rutas de solo lectura pueden leer de una réplica.
+
 Este archivo permite que otros archivos importen y usen la base de datos fácilmente.
 """
 
 # Importamos la clase SQLAlchemy de flask_sqlalchemy
 from flask_sqlalchemy import SQLAlchemy
+from replica import SesionEnrutada
 
 # Creamos la instancia de la base de datos que se usará en toda la app
 # Esta variable 'db' se importa en otros archivos para definir modelos y manipular la base de datos
@@ -18,4 +21,4 @@ from flask_sqlalchemy import SQLAlchemy
 # Se inicializa en app.py con la configuración de la app
 
 # Creamos la instancia
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy(session_options={'class_': SesionEnrutada})
\ No newline at end of file
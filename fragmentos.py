@@ -0,0 +1,89 @@
+"""
+Este archivo guarda en memoria las partes de las plantillas que casi nunca cambian (menús, pie de página, textos fijos).
+
+Paso a paso:
+1. En la plantilla se marca la parte con {% fragmento 'nombre', otros, valores %} ... {% endfragmento %}.
+2. La primera vez se renderiza normalmente y el HTML se guarda en una caché LRU (la misma de reportes.py).
+   La clave es (nombre, idioma, sede, versión de la configuración, otros valores). Por ejemplo el menú
+   se guarda una vez por idioma y por página activa (request.endpoint).
+3. La versión de la configuración sube cuando se guarda una fila de Configuracion, Maquina o Sede en este
+   proceso. Los demás workers ven el cambio cuando vence la entrada (los mismos segundos que la caché de
+   Configuracion), igual que las listas de configuración.
+   Por eso solo se guardan partes fijas (textos, menús, scripts): los formularios con valores de la base
+   (configuración, máquinas) se renderizan siempre, para que otro worker no muestre valores viejos
+   y al guardarlos se pierda un cambio.
+4. Las plantillas se compilan con una caché de bytecode en disco (JINJA_CACHE_DIR): un worker nuevo no
+   vuelve a compilar las plantillas que ya compiló otro.
+5. Con FRAGMENTOS_CACHE=0 los fragmentos se renderizan siempre (para desarrollar las plantillas).
+
+Así cada petición solo renderiza la parte de la página que depende de los datos.
+"""
+
+import itertools
+import os
+from flask import current_app, request
+from jinja2 import nodes, FileSystemBytecodeCache
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event
+from extensions import db
+from models import Configuracion, Maquina, Sede
+from reportes import CacheLRU
+from sedes import sede_actual
+from translations import get_locale
+
+FRAGMENTOS_ENTRADAS = 512   # Fragmentos guardados (nombre x idioma x sede x valores)
+
+_cache = CacheLRU(FRAGMENTOS_ENTRADAS, Configuracion.CACHE_SEGUNDOS)
+_version = 0
+# Modelos que cambian el contenido de los fragmentos
+_MODELOS_CONFIGURACION = (Configuracion, Maquina, Sede)
+
+
+def _despues_de_flush(session, flush_context):
+    global _version
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, _MODELOS_CONFIGURACION):
+            _version += 1
+            return
+
+
+class FragmentoCache(Extension):
+    """
+    Etiqueta {% fragmento 'nombre', valores... %} ... {% endfragmento %} para guardar una parte de la plantilla.
+    """
+    tags = {'fragmento'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        argumentos = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            argumentos.append(parser.parse_expression())
+        cuerpo = parser.parse_statements(('name:endfragmento',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_renderizar', [nodes.List(argumentos)]), [], [], cuerpo
+        ).set_lineno(lineno)
+
+    def _renderizar(self, argumentos, caller):
+        if not current_app.config.get('FRAGMENTOS_CACHE', True):
+            return caller()
+        clave = (get_locale(), sede_actual(), _version, request.script_root, *argumentos)
+        guardado = _cache.obtener(clave)
+        if guardado is None:
+            guardado = str(caller())
+            _cache.guardar(clave, guardado)
+        return Markup(guardado)
+
+
+def init_fragmentos(app):
+    """
+    Agrega la etiqueta {% fragmento %} y la caché de bytecode a Jinja, y registra el aumento de versión.
+    """
+    app.config.setdefault('FRAGMENTOS_CACHE', True)
+    app.jinja_env.add_extension(FragmentoCache)
+    directorio = app.config.get('JINJA_CACHE_DIR')
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directorio)
+    if not event.contains(db.session, 'after_flush', _despues_de_flush):
+        event.listen(db.session, 'after_flush', _despues_de_flush)
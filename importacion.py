@@ -0,0 +1,229 @@
+"""
+Este archivo importa entregas de bloques desde un archivo CSV o XLSX (nota de entrega del proveedor).
+
+Paso a paso:
+1. Se lee el archivo fila por fila, sin cargarlo entero en memoria (csv para CSV, openpyxl en modo read_only para XLSX).
+   Los CSV se leen en UTF-8 y, si no lo son, en Windows-1252 (la exportación de Excel); un archivo
+   ilegible o dañado se informa como error de importación.
+2. La primera fila son los encabezados: material, shade, grosor, cantidad y marca (opcional).
+   También se aceptan los nombres en inglés (thickness, quantity/count, brand).
+3. Cada fila se valida contra las listas de Configuración (materiales, shades, marcas, grosores).
+   Los valores se comparan sin importar mayúsculas y se guardan con el nombre configurado.
+4. Las filas válidas se agrupan por (material, marca, shade, grosor) y se suman las cantidades.
+5. Si ya existe un bloque 'nuevo' igual se le suma la cantidad; el resto se inserta de una vez.
+   Todo se guarda en una sola transacción.
+6. Se devuelve un reporte con el error de cada fila rechazada.
+
+Así una entrega de cientos de cajas se registra con una sola subida de archivo.
+"""
+
+import codecs
+import csv
+from sqlalchemy import insert
+from extensions import db
+from models import Bloque, Configuracion
+from bitacora import registrar
+from sedes import sede_actual
+from catalogos import ids_catalogo
+
+# Nombres de columna aceptados -> campo del modelo
+ENCABEZADOS = {
+    'material': 'material',
+    'shade': 'shade', 'color': 'shade',
+    'grosor': 'grosor', 'thickness': 'grosor',
+    'cantidad': 'cantidad', 'quantity': 'cantidad', 'count': 'cantidad', 'qty': 'cantidad',
+    'marca': 'marca', 'brand': 'marca',
+}
+OBLIGATORIOS = ('material', 'shade', 'grosor', 'cantidad')
+MAX_ERRORES = 500  # Límite de errores detallados en el reporte
+
+
+class ErrorImportacion(Exception):
+    """Error que impide leer el archivo completo (formato o encabezados)."""
+
+
+def _lineas(archivo):
+    # Decodifica línea por línea: UTF-8 y, si falla, Windows-1252 (el "CSV" que exporta Excel en español)
+    codificaciones = ['utf-8', 'cp1252']
+    for numero, linea in enumerate(archivo, start=1):
+        if numero == 1 and linea.startswith(codecs.BOM_UTF8):
+            linea = linea[len(codecs.BOM_UTF8):]
+        while True:
+            try:
+                yield linea.decode(codificaciones[0])
+                break
+            except UnicodeDecodeError:
+                if len(codificaciones) == 1:
+                    raise ErrorImportacion(
+                        f'No se pudo leer la línea {numero}: guarda el archivo como CSV UTF-8 o Windows-1252.'
+                    )
+                codificaciones.pop(0)
+
+
+def _filas_csv(archivo):
+    muestra = archivo.read(4096).decode('utf-8', errors='replace')
+    archivo.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    for fila in csv.reader(_lineas(archivo), dialecto):
+        yield fila
+
+
+def _filas_xlsx(archivo):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ErrorImportacion('Para importar archivos XLSX se necesita el paquete openpyxl.')
+    # Un archivo dañado o renombrado puede fallar de muchas formas (zip, XML, partes faltantes):
+    # todas se informan como un error de importación y no como un error del servidor
+    try:
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+    except Exception:
+        raise ErrorImportacion('No se pudo abrir el archivo XLSX: está dañado o no es un libro de Excel.')
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        while True:
+            try:
+                fila = next(filas, None)
+            except Exception:
+                raise ErrorImportacion('No se pudo leer el archivo XLSX: el contenido de la hoja está dañado.')
+            if fila is None:
+                break
+            yield ['' if v is None else v for v in fila]
+    finally:
+        libro.close()
+
+
+def leer_filas(archivo, nombre):
+    """
+    Devuelve un iterador de filas (listas) según la extensión del archivo.
+    """
+    nombre = (nombre or '').lower()
+    if nombre.endswith('.xlsx') or nombre.endswith('.xlsm'):
+        return _filas_xlsx(archivo)
+    if nombre.endswith('.csv') or nombre.endswith('.txt'):
+        return _filas_csv(archivo)
+    raise ErrorImportacion('Formato no soportado: usa un archivo .csv o .xlsx.')
+
+
+def _canonico(lista):
+    return {str(x).strip().lower(): x for x in lista}
+
+
+def _texto(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def importar_bloques(filas, simular=False):
+    """
+    Valida e importa las filas. Con simular=True no se guarda nada (solo se devuelve el reporte).
+    """
+    materiales = _canonico(Configuracion.get_lista('materiales', default=['Zirconia','Disilicato','PMMA','Cera','Wax','Composite']))
+    shades = _canonico(Configuracion.get_lista('shades', default=['A1','A2','A3','B1','B2','C1','C2']))
+    marcas = _canonico(Configuracion.get_lista('marcas', default=['Vita','Ivoclar','Aidite']))
+    grosores = {int(g) for g in Configuracion.get_lista('grosores', default=['14','16','18','20','22','25']) if g.isdigit()}
+
+    filas = iter(filas)
+    try:
+        encabezado = next(filas)
+    except StopIteration:
+        raise ErrorImportacion('El archivo está vacío.')
+    columnas = {}
+    for i, nombre in enumerate(encabezado):
+        campo = ENCABEZADOS.get(_texto(nombre).lower())
+        if campo and campo not in columnas:
+            columnas[campo] = i
+    faltantes = [c for c in OBLIGATORIOS if c not in columnas]
+    if faltantes:
+        raise ErrorImportacion('Faltan columnas obligatorias: ' + ', '.join(faltantes))
+
+    errores = []
+    total_errores = 0
+    filas_leidas = 0
+    agrupado = {}
+    # La fila 1 es el encabezado; los datos empiezan en la fila 2
+    for numero, fila in enumerate(filas, start=2):
+        valores = {campo: (_texto(fila[i]) if i < len(fila) else '') for campo, i in columnas.items()}
+        if not any(valores.values()):
+            continue  # Fila vacía
+        filas_leidas += 1
+        problemas = []
+        material = materiales.get(valores['material'].lower())
+        if not material:
+            problemas.append(f"material desconocido '{valores['material']}'")
+        shade = shades.get(valores['shade'].lower())
+        if not shade:
+            problemas.append(f"shade desconocido '{valores['shade']}'")
+        try:
+            grosor = int(float(valores['grosor']))
+            if grosores and grosor not in grosores:
+                problemas.append(f"grosor no configurado '{valores['grosor']}'")
+        except ValueError:
+            grosor = None
+            problemas.append(f"grosor inválido '{valores['grosor']}'")
+        try:
+            cantidad = int(float(valores['cantidad']))
+            if cantidad <= 0:
+                problemas.append('la cantidad debe ser mayor que cero')
+        except ValueError:
+            cantidad = None
+            problemas.append(f"cantidad inválida '{valores['cantidad']}'")
+        marca = None
+        # Igual que en el formulario: la marca solo se guarda para Zirconia
+        if material == 'Zirconia' and valores.get('marca'):
+            marca = marcas.get(valores['marca'].lower())
+            if not marca:
+                problemas.append(f"marca desconocida '{valores['marca']}'")
+        if problemas:
+            total_errores += 1
+            if len(errores) < MAX_ERRORES:
+                errores.append({'fila': numero, 'errores': problemas, 'valores': valores})
+            continue
+        clave = (material, marca, shade, grosor)
+        agrupado[clave] = agrupado.get(clave, 0) + cantidad
+
+    # Bloques nuevos existentes con los mismos datos: se les suma la cantidad
+    existentes = {}
+    if agrupado:
+        materiales_usados = {k[0] for k in agrupado}
+        for b in Bloque.query.filter(Bloque.estado == 'nuevo', Bloque.material.in_(materiales_usados)).all():
+            existentes.setdefault((b.material, b.marca, b.shade, b.grosor), b)
+    actualizados = 0
+    nuevos = []
+    sede = sede_actual()  # La inserción masiva no pasa por el ORM: la sede se pone a mano
+    for clave, cantidad in agrupado.items():
+        bloque = existentes.get(clave)
+        if bloque:
+            actualizados += 1
+            if not simular:
+                bloque.cantidad = (bloque.cantidad or 0) + cantidad
+        else:
+            material, marca, shade, grosor = clave
+            nuevos.append({'material': material, 'marca': marca, 'shade': shade, 'grosor': grosor,
+                           'cantidad': cantidad, 'estado': 'nuevo', 'modelos_fresados': 0, 'sede_id': sede})
+    if not simular:
+        if nuevos:
+            # Tampoco pasa por el enlace con los catálogos: los ids se buscan (o crean) antes de insertar
+            for campo in ('material', 'marca', 'shade'):
+                ids = ids_catalogo(campo, [b[campo] for b in nuevos])
+                for b in nuevos:
+                    b[f'{campo}_id'] = ids.get(b[campo])
+            db.session.execute(insert(Bloque), nuevos)
+            # La inserción masiva no pasa por el ORM: se registra el evento a mano
+            registrar('bloque.importado', 'bloque', {'bloques': nuevos})
+        db.session.commit()
+
+    return {
+        'simulado': simular,
+        'filas_leidas': filas_leidas,
+        'filas_validas': filas_leidas - total_errores,
+        'filas_con_error': total_errores,
+        'bloques_actualizados': actualizados,
+        'bloques_insertados': len(nuevos),
+        'cantidad_total': sum(agrupado.values()),
+        'errores': errores,
+    }
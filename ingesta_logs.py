@@ -0,0 +1,375 @@
+"""
+Este archivo carga como órdenes los trabajos que el software CAM de las fresadoras escribe en sus logs.
+
+Paso a paso:
+1. Se revisa cada INGESTA_SEGUNDOS la carpeta INGESTA_DIRECTORIO (los archivos que cumplen INGESTA_PATRON).
+   Se revisa por tiempo y no con avisos del sistema operativo porque las carpetas compartidas en red no los envían.
+2. De cada archivo se guarda hasta qué byte se leyó (tabla ArchivoIngesta): solo se leen las líneas nuevas,
+   sin volver a leer el archivo completo. Una línea sin salto de línea final se espera a que el CAM la termine
+   (salvo que el archivo no cambie en ESPERA_LINEA_SEGUNDOS). Si el archivo se reemplazó (otro inodo o más chico),
+   se lee desde el inicio.
+3. Cada línea es un trabajo terminado, en JSON o como pares clave=valor separados por espacios, ';' o '|':
+       2025-06-02T10:15:00 maquina=A bloque=14X7KQ casos=C-1001,C-1002 modelos=3
+       {"machine": "A", "blank": "14X7KQ", "cases": ["C-1001"], "units": 1, "time": "2025-06-02T10:15:00"}
+   Se aceptan los nombres de ALIAS (en español o en inglés). Las líneas que no se entienden se cuentan como error.
+4. Las líneas se procesan en lotes de LOTE_LINEAS, con pocas consultas por lote (IN sobre los códigos):
+   - se crea una Orden por código de caso, salvo que ese código ya tenga orden (no se duplica),
+   - el material y el shade salen del bloque escaneado si la línea no los trae,
+   - se suman los modelos al bloque usado y a la fresa instalada, y se quitan los casos de la lista de pendientes,
+   igual que al cargar la orden a mano en ordenes().
+5. Las órdenes del lote y la nueva posición del archivo se guardan en la misma transacción. La posición se actualiza
+   con un UPDATE condicional: si otro worker ya procesó esas líneas, el lote se descarta y no se cuenta dos veces.
+6. También se puede ejecutar a mano: flask ingerir-logs [--directorio carpeta].
+
+Así el operador ya no tiene que volver a escribir en la app lo que la fresadora ya registró.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import click
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import ArchivoIngesta, Bloque, FresaInstalada, Orden, OrdenPendiente, SEDE_DEFECTO
+from mantenimiento_bd import reservar_tarea
+from sedes import en_sede
+
+TAREA = 'ingesta_logs'
+LOTE_LINEAS = 1000          # Líneas por transacción
+LOTE_IN = 500               # Valores por consulta IN
+ESPERA_LINEA_SEGUNDOS = 30  # Una línea sin salto final se toma como completa si el archivo no cambia en este tiempo
+SEPARADORES = (';', '|', '\t')
+
+# Nombres aceptados para cada dato de la línea
+ALIAS = {
+    'maquina': ('maquina', 'máquina', 'machine', 'mill', 'fresadora'),
+    'codigo_barra': ('bloque', 'codigo_barra', 'block', 'blank', 'barcode'),
+    'casos': ('casos', 'caso', 'codigos', 'codigo_orden', 'orden', 'cases', 'case', 'job', 'order'),
+    'modelos': ('modelos', 'cantidad_modelos', 'unidades', 'units', 'models', 'pieces'),
+    'fecha': ('fecha', 'fin', 'time', 'timestamp', 'end', 'finished'),
+    'material': ('material',),
+    'shade': ('shade', 'color'),
+}
+_CAMPO_POR_ALIAS = {alias: campo for campo, nombres in ALIAS.items() for alias in nombres}
+
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+class LineaInvalida(ValueError):
+    pass
+
+
+def _fecha(valor):
+    if not valor:
+        return None
+    fecha = datetime.fromisoformat(str(valor).strip().replace(' ', 'T', 1))
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+
+def _pares(texto):
+    # Separadores explícitos si aparecen; si no, espacios
+    for separador in SEPARADORES:
+        if separador in texto:
+            return [p.strip() for p in texto.split(separador) if p.strip()]
+    return texto.split()
+
+
+def interpretar_linea(texto):
+    """
+    Convierte una línea del log en un trabajo: {'maquina', 'codigo_barra', 'casos', 'modelos', 'fecha', ...}.
+    Lanza LineaInvalida si la línea no tiene casos.
+    """
+    texto = texto.strip().lstrip('﻿')
+    datos = {}
+    if texto.startswith('{'):
+        try:
+            crudo = json.loads(texto)
+        except ValueError as e:
+            raise LineaInvalida(f'JSON inválido: {e}')
+        if not isinstance(crudo, dict):
+            raise LineaInvalida('se esperaba un objeto JSON')
+        items = crudo.items()
+    else:
+        items = []
+        for parte in _pares(texto):
+            clave, igual, valor = parte.partition('=')
+            if igual:
+                items.append((clave, valor))
+            elif 'fecha' not in datos:
+                # Una fecha suelta al inicio (formato típico de log)
+                try:
+                    datos['fecha'] = _fecha(parte)
+                except ValueError:
+                    pass
+    for clave, valor in items:
+        campo = _CAMPO_POR_ALIAS.get(str(clave).strip().lower())
+        if campo:
+            datos[campo] = valor
+    casos = datos.get('casos')
+    if isinstance(casos, str):
+        casos = casos.replace('+', ',').split(',')
+    casos = [str(c).strip() for c in (casos or []) if str(c).strip()]
+    if not casos:
+        raise LineaInvalida('la línea no tiene códigos de caso')
+    try:
+        modelos = int(datos['modelos']) if datos.get('modelos') not in (None, '') else None
+        fecha = datos['fecha'] if isinstance(datos.get('fecha'), datetime) else _fecha(datos.get('fecha'))
+    except (TypeError, ValueError) as e:
+        raise LineaInvalida(str(e))
+    return {
+        'casos': list(dict.fromkeys(casos)),
+        'maquina': str(datos.get('maquina') or '').strip() or None,
+        'codigo_barra': str(datos.get('codigo_barra') or '').strip() or None,
+        'material': str(datos.get('material') or '').strip() or None,
+        'shade': str(datos.get('shade') or '').strip() or None,
+        'modelos': modelos,
+        'fecha': fecha,
+    }
+
+
+def _repartir(total, cantidad):
+    # Igual que la división automática de ordenes(): el resto va a los primeros casos
+    if total is None:
+        return [1] * cantidad
+    base, resto = divmod(max(total, 0), cantidad)
+    return [base + 1 if i < resto else base for i in range(cantidad)]
+
+
+def _en_lotes(valores):
+    valores = list(valores)
+    for i in range(0, len(valores), LOTE_IN):
+        yield valores[i:i + LOTE_IN]
+
+
+def _existentes(columna, valores):
+    encontrados = []
+    for lote in _en_lotes(valores):
+        encontrados.extend(columna.class_.query.filter(columna.in_(lote)).all())
+    return encontrados
+
+
+def guardar_trabajos(trabajos):
+    """
+    Agrega a la sesión las órdenes de los trabajos (sin confirmar). Devuelve (creadas, duplicadas).
+    Todas las lecturas se hacen antes de agregar las órdenes, así el lote se guarda con un solo flush.
+    """
+    codigos = {c for t in trabajos for c in t['casos']}
+    ya_cargados = set()
+    for lote in _en_lotes(codigos):
+        ya_cargados.update(c for (c,) in db.session.query(Orden.codigo_orden).filter(Orden.codigo_orden.in_(lote)).all())
+    bloques = {b.codigo_barra: b for b in _existentes(Bloque.codigo_barra, {t['codigo_barra'] for t in trabajos if t['codigo_barra']})}
+    pendientes = _existentes(OrdenPendiente.codigo_orden, codigos - ya_cargados)
+    # Fresa instalada de cada máquina y material (pocas por lote), con la misma búsqueda que ordenes()
+    fresas = {}
+    for trabajo in trabajos:
+        bloque = bloques.get(trabajo['codigo_barra'])
+        trabajo['material'] = trabajo['material'] or (bloque.material if bloque else None)
+        clave = (trabajo['maquina'], trabajo['material'])
+        if all(clave) and clave not in fresas:
+            fresas[clave] = FresaInstalada.query.filter(
+                FresaInstalada.maquina == clave[0],
+                FresaInstalada.materiales.like(f'%{clave[1]}%'),
+            ).order_by(FresaInstalada.fecha_instalacion.desc()).first()
+
+    creadas = duplicadas = 0
+    nuevos = set()
+    modelos_bloque = {}
+    codigos_bloque = {}
+    ahora = datetime.utcnow()
+    for trabajo in trabajos:
+        bloque = bloques.get(trabajo['codigo_barra'])
+        pares = [(c, m) for c, m in zip(trabajo['casos'], _repartir(trabajo['modelos'], len(trabajo['casos'])))
+                 if c not in ya_cargados]
+        duplicadas += len(trabajo['casos']) - len(pares)
+        if not pares:
+            continue
+        for codigo, modelos in pares:
+            ya_cargados.add(codigo)
+            nuevos.add(codigo)
+            db.session.add(Orden(
+                codigo_orden=codigo,
+                material=trabajo['material'],
+                marca=bloque.marca if bloque else None,
+                shade=trabajo['shade'] or (bloque.shade if bloque else None),
+                codigo_barra=trabajo['codigo_barra'],
+                maquina=trabajo['maquina'],
+                cantidad_modelos=modelos,
+                fecha_creacion=trabajo['fecha'] or ahora,
+            ))
+        creadas += len(pares)
+        total = sum(m for _c, m in pares)
+        if bloque is not None:
+            modelos_bloque[bloque] = modelos_bloque.get(bloque, 0) + total
+            codigos_bloque.setdefault(bloque, []).extend(c for c, _m in pares)
+        fresa = fresas.get((trabajo['maquina'], trabajo['material']))
+        if fresa is not None:
+            fresa.modelos_fresados = (fresa.modelos_fresados or 0) + total
+    # Cada bloque se actualiza una vez por lote (la lista de códigos puede ser larga)
+    for bloque, total in modelos_bloque.items():
+        bloque.modelos_fresados = (bloque.modelos_fresados or 0) + total
+        bloque.codigos_orden_fresados = ','.join(bloque.get_codigos_orden_fresados() + codigos_bloque[bloque])
+    for pendiente in pendientes:
+        if pendiente.codigo_orden in nuevos:
+            db.session.delete(pendiente)
+    return creadas, duplicadas
+
+
+def _leer_lineas(ruta, posicion, maximo, completo):
+    """
+    Hasta 'maximo' líneas completas desde 'posicion'. Devuelve (lineas, nueva_posicion).
+    """
+    lineas = []
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(posicion)
+        for linea in archivo:
+            if not linea.endswith(b'\n') and not completo:
+                break
+            lineas.append(linea)
+            posicion += len(linea)
+            if len(lineas) >= maximo:
+                break
+    return lineas, posicion
+
+
+def _registro(ruta):
+    registro = ArchivoIngesta.query.filter_by(ruta=ruta).first()
+    if registro is None:
+        try:
+            db.session.add(ArchivoIngesta(ruta=ruta, posicion=0, lineas=0, trabajos=0, errores=0))
+            db.session.commit()
+        except IntegrityError:
+            # Otro worker lo registró al mismo tiempo
+            db.session.rollback()
+        registro = ArchivoIngesta.query.filter_by(ruta=ruta).first()
+    return registro
+
+
+def ingerir_archivo(ruta, lote=LOTE_LINEAS):
+    """
+    Procesa las líneas nuevas de un archivo. Devuelve {'lineas', 'trabajos', 'duplicados', 'errores'}.
+    """
+    resumen = {'lineas': 0, 'trabajos': 0, 'duplicados': 0, 'errores': 0}
+    estado = os.stat(ruta)
+    registro = _registro(ruta)
+    # 'confirmada' es la posición guardada; 'posicion' la que se lee (0 si el archivo se reemplazó)
+    confirmada = posicion = registro.posicion or 0
+    if (registro.inodo and estado.st_ino and registro.inodo != estado.st_ino) or estado.st_size < posicion:
+        current_app.logger.info('El log %s se reemplazó: se lee desde el inicio', ruta)
+        posicion = 0
+    completo = time.time() - estado.st_mtime > ESPERA_LINEA_SEGUNDOS
+    while True:
+        lineas, nueva_posicion = _leer_lineas(ruta, posicion, lote, completo)
+        if not lineas:
+            break
+        trabajos, errores = [], 0
+        for numero, linea in enumerate(lineas):
+            texto = linea.decode('utf-8', errors='replace')
+            if not texto.strip() or texto.lstrip().startswith('#'):
+                continue
+            try:
+                trabajos.append(interpretar_linea(texto))
+            except LineaInvalida as e:
+                errores += 1
+                if errores <= 3:
+                    current_app.logger.warning('Línea inválida en %s: %s (%s)', ruta, texto.strip()[:200], e)
+        creadas, duplicadas = guardar_trabajos(trabajos)
+        # La posición avanza solo si nadie más la movió: si otro worker procesó estas líneas, se descarta el lote
+        movida = db.session.execute(
+            update(ArchivoIngesta)
+            .where(ArchivoIngesta.id == registro.id, ArchivoIngesta.posicion == confirmada)
+            .values(
+                posicion=nueva_posicion,
+                inodo=estado.st_ino,
+                lineas=ArchivoIngesta.lineas + len(lineas),
+                trabajos=ArchivoIngesta.trabajos + creadas,
+                errores=ArchivoIngesta.errores + errores,
+                fecha_actualizacion=datetime.utcnow(),
+            )
+        ).rowcount == 1
+        if not movida:
+            db.session.rollback()
+            break
+        db.session.commit()
+        confirmada = posicion = nueva_posicion
+        resumen['lineas'] += len(lineas)
+        resumen['trabajos'] += creadas
+        resumen['duplicados'] += duplicadas
+        resumen['errores'] += errores
+        if len(lineas) < lote:
+            break
+    return resumen
+
+
+def ingerir_directorio(directorio=None, patron=None):
+    """
+    Una pasada por todos los logs de la carpeta, del más viejo al más nuevo.
+    """
+    config = current_app.config
+    directorio = directorio or config.get('INGESTA_DIRECTORIO')
+    patron = patron or config.get('INGESTA_PATRON') or '*.log'
+    inicio = time.perf_counter()
+    total = {'archivos': 0, 'lineas': 0, 'trabajos': 0, 'duplicados': 0, 'errores': 0}
+    if not directorio or not os.path.isdir(directorio):
+        return {**total, 'segundos': 0.0}
+    rutas = sorted(
+        {os.path.abspath(r) for p in patron.split(',') for r in glob.glob(os.path.join(directorio, p.strip()))},
+        key=lambda r: os.stat(r).st_mtime,
+    )
+    with en_sede(config.get('INGESTA_SEDE') or SEDE_DEFECTO):
+        for ruta in rutas:
+            try:
+                resumen = ingerir_archivo(ruta)
+            except OSError:
+                # El archivo desapareció o está bloqueado por el CAM: se reintenta en la próxima pasada
+                db.session.rollback()
+                current_app.logger.warning('No se pudo leer el log %s', ruta, exc_info=True)
+                continue
+            total['archivos'] += 1
+            for clave, valor in resumen.items():
+                total[clave] += valor
+    total['segundos'] = round(time.perf_counter() - inicio, 3)
+    if total['trabajos'] or total['errores']:
+        current_app.logger.info('Logs de fresado: %s', total)
+    return total
+
+
+def _ciclo(app):
+    intervalo = app.config.get('INGESTA_SEGUNDOS') or 5
+    while True:
+        time.sleep(intervalo)
+        with app.app_context():
+            try:
+                # La reserva evita que todos los workers recorran la carpeta a la vez
+                if reservar_tarea(TAREA, timedelta(seconds=intervalo / 2)):
+                    ingerir_directorio()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Falló la ingesta de los logs de fresado')
+            finally:
+                db.session.remove()
+
+
+def init_ingesta_logs(app):
+    """
+    Registra el comando 'flask ingerir-logs' y arranca el hilo que revisa la carpeta de logs.
+    """
+    @app.cli.command('ingerir-logs')
+    @click.option('--directorio', default=None, help='Carpeta de logs (por defecto INGESTA_DIRECTORIO).')
+    def comando_ingerir_logs(directorio):
+        click.echo(json.dumps(ingerir_directorio(directorio), indent=2))
+
+    global _hilo
+    if not app.config.get('INGESTA_DIRECTORIO'):
+        return
+    with _hilo_lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_ciclo, args=(app,), name='ingesta-logs', daemon=True)
+            _hilo.start()
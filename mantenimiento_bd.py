@@ -0,0 +1,362 @@
+"""
+Este archivo mantiene sanas las estadísticas y el tamaño de la base de datos.
+
+Paso a paso:
+1. optimizar() actualiza las estadísticas que usa el planificador de consultas y recupera el espacio de las filas borradas:
+   - Postgres: VACUUM (ANALYZE) de cada tabla; con completo=True, VACUUM FULL (bloquea las tablas mientras corre).
+   - SQLite: PRAGMA optimize (ANALYZE si todavía no hay estadísticas) y, si hay páginas libres y el archivo usa
+     auto_vacuum incremental, incremental_vacuum en pasos cortos (cada paso es su propia transacción, así las
+     escrituras esperan poco). El VACUUM completo reescribe todo el archivo y bloquea la base mientras corre:
+     solo se ejecuta a mano (completo=True), que además pasa el archivo a auto_vacuum incremental.
+2. reporte_salud() junta el tamaño de cada tabla e índice, las filas muertas o páginas libres (espacio perdido)
+   y la fecha de las últimas estadísticas, y resume los problemas en una lista de avisos.
+   La ruta /salud/bd usa solo datos baratos (estadísticas del motor); el comando cuenta las filas exactas.
+3. Un hilo revisa cada tanto si toca ejecutar el mantenimiento (MANTENIMIENTO_BD_HORAS, 0 lo desactiva).
+   La ejecución se reserva en la tabla TareaProgramada, así con varios workers corre en uno solo.
+   En la misma tarea se borran las marcas de borrado vencidas de la sincronización (sincronizacion.py)
+   y se recalculan las predicciones de desgaste de las fresas si cambió su modelo (desgaste.py).
+4. También se puede ejecutar a mano: flask mantenimiento-bd [--completo] [--reporte].
+
+Así los planes de consulta no empeoran sin que nadie lo note a medida que se insertan y borran filas.
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import text, update, or_
+from sqlalchemy.exc import IntegrityError, OperationalError
+from extensions import db
+from models import TareaProgramada
+from sincronizacion import purgar_eliminaciones
+from desgaste import refrescar_sedes
+
+TAREA = 'mantenimiento_bd'
+INTERVALO_REVISION = 600        # Segundos entre revisiones del hilo
+UMBRAL_ESPACIO_LIBRE = 0.25     # Fracción de páginas libres (SQLite) a partir de la cual se compacta
+UMBRAL_FILAS_MUERTAS = 0.20     # Fracción de filas muertas (Postgres) que se avisa en el reporte
+UMBRAL_CAMBIOS_SIN_ANALIZAR = 0.20  # Fracción de filas modificadas desde el último ANALYZE (Postgres)
+MINIMO_FILAS_AVISO = 1000       # Las tablas chicas no generan avisos
+PAGINAS_POR_PASO = 500          # Páginas que libera cada paso de incremental_vacuum (SQLite)
+PAUSA_PASO = 0.05               # Segundos entre pasos, para dejar pasar a las escrituras
+
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+def _tablas():
+    return [t.name for t in db.metadata.sorted_tables]
+
+
+def _autocommit():
+    # VACUUM no puede correr dentro de una transacción
+    return db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+
+def _pragma(conn, nombre):
+    return conn.execute(text(f'PRAGMA {nombre}')).scalar()
+
+
+def _optimizar_sqlite(conn, completo):
+    acciones = []
+    paginas = _pragma(conn, 'page_count') or 0
+    libres = _pragma(conn, 'freelist_count') or 0
+    incremental = _pragma(conn, 'auto_vacuum') == 2
+    if completo:
+        if not incremental:
+            # auto_vacuum solo cambia con un VACUUM; desde entonces alcanza con incremental_vacuum
+            conn.execute(text('PRAGMA auto_vacuum = INCREMENTAL'))
+        conn.execute(text('VACUUM'))
+        acciones.append('VACUUM')
+    elif incremental and libres:
+        liberadas = 0
+        while libres > 0:
+            # execute() de sqlite3 avanza un solo paso (libera una página); executescript lo ejecuta completo
+            conn.connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({PAGINAS_POR_PASO});')
+            restantes = _pragma(conn, 'freelist_count') or 0
+            if restantes >= libres:
+                break
+            liberadas += libres - restantes
+            libres = restantes
+            if libres:
+                time.sleep(PAUSA_PASO)
+        acciones.append(f'incremental_vacuum({liberadas} páginas en pasos de {PAGINAS_POR_PASO})')
+    sin_estadisticas = not conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")).first()
+    if completo or sin_estadisticas:
+        conn.execute(text('ANALYZE'))
+        acciones.append('ANALYZE')
+    conn.execute(text('PRAGMA optimize'))
+    acciones.append('PRAGMA optimize')
+    return acciones
+
+
+def _optimizar_postgres(conn, completo):
+    quote = conn.dialect.identifier_preparer.quote
+    opciones = '(FULL, ANALYZE)' if completo else '(ANALYZE)'
+    acciones = []
+    for tabla in _tablas():
+        conn.execute(text(f'VACUUM {opciones} {quote(tabla)}'))
+        acciones.append(f'VACUUM {opciones} {tabla}')
+    return acciones
+
+
+def optimizar(completo=False):
+    """
+    Actualiza estadísticas y recupera espacio. Devuelve el resumen de lo que se hizo.
+    """
+    inicio = time.monotonic()
+    db.session.close()  # Que ninguna transacción abierta de la sesión bloquee el VACUUM
+    antes = _tamano_total()
+    with _autocommit() as conn:
+        if conn.dialect.name == 'postgresql':
+            acciones = _optimizar_postgres(conn, completo)
+        elif conn.dialect.name == 'sqlite':
+            acciones = _optimizar_sqlite(conn, completo)
+        else:
+            acciones = []
+    return {
+        'motor': db.engine.dialect.name,
+        'completo': completo,
+        'acciones': acciones,
+        'bytes_antes': antes,
+        'bytes_despues': _tamano_total(),
+        'segundos': round(time.monotonic() - inicio, 3),
+    }
+
+
+def _tamano_total():
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            return conn.execute(text('SELECT pg_database_size(current_database())')).scalar()
+        if conn.dialect.name == 'sqlite':
+            return (_pragma(conn, 'page_count') or 0) * (_pragma(conn, 'page_size') or 0)
+    return None
+
+
+def _filas_estimadas(conn, objetos):
+    # La primera cifra de cada fila de sqlite_stat1 es la cantidad de filas de la tabla al último ANALYZE
+    if not any(n == 'sqlite_stat1' for n, _, _ in objetos):
+        return {}
+    estimadas = {}
+    for tabla, stat in conn.execute(text('SELECT tbl, stat FROM sqlite_stat1')).all():
+        cifras = (stat or '').split()
+        if cifras and cifras[0].isdigit():
+            estimadas[tabla] = max(estimadas.get(tabla, 0), int(cifras[0]))
+    return estimadas
+
+
+def _reporte_sqlite(conn, exacto):
+    paginas = _pragma(conn, 'page_count') or 0
+    tamano_pagina = _pragma(conn, 'page_size') or 0
+    libres = _pragma(conn, 'freelist_count') or 0
+    objetos = conn.execute(text("SELECT name, tbl_name, type FROM sqlite_master WHERE type IN ('table', 'index')")).all()
+    tamanos = {}
+    if exacto:
+        try:
+            # dbstat da el tamaño de cada tabla e índice (si SQLite se compiló con esa tabla virtual); recorre todo el archivo
+            tamanos = dict(conn.execute(text('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')).all())
+        except OperationalError:
+            pass
+        estimadas = {}
+    else:
+        estimadas = _filas_estimadas(conn, objetos)
+    existentes = set(_tablas()) & {n for n, _, tipo in objetos if tipo == 'table'}
+    tablas = []
+    for tabla in _tablas():
+        if tabla not in existentes:
+            continue
+        if exacto:
+            filas = conn.execute(text(f'SELECT COUNT(*) FROM {conn.dialect.identifier_preparer.quote(tabla)}')).scalar()
+        else:
+            filas = estimadas.get(tabla)
+        tablas.append({
+            'tabla': tabla,
+            'filas': filas,
+            'bytes_tabla': tamanos.get(tabla),
+            'bytes_indices': sum(tamanos.get(n) or 0 for n, t, tipo in objetos if tipo == 'index' and t == tabla) if tamanos else None,
+        })
+    indices = [
+        {'indice': n, 'tabla': t, 'bytes': tamanos.get(n)}
+        for n, t, tipo in objetos if tipo == 'index' and t in existentes
+    ]
+    avisos = []
+    if paginas and libres / paginas > UMBRAL_ESPACIO_LIBRE:
+        aviso = f'{libres / paginas:.0%} del archivo son páginas libres (espacio de filas borradas)'
+        if _pragma(conn, 'auto_vacuum') != 2:
+            # Sin auto_vacuum incremental el mantenimiento automático no puede liberarlas
+            aviso += '; ejecutar flask mantenimiento-bd --completo en un momento sin uso'
+        avisos.append(aviso)
+    if not any(n == 'sqlite_stat1' for n, _, _ in objetos):
+        avisos.append('la base no tiene estadísticas (nunca se ejecutó ANALYZE)')
+    return {
+        'bytes_total': paginas * tamano_pagina,
+        'bytes_libres': libres * tamano_pagina,
+        'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(_pragma(conn, 'auto_vacuum')),
+        'tablas': tablas,
+        'indices': indices,
+    }, avisos
+
+
+def _reporte_postgres(conn):
+    filas = conn.execute(text(
+        'SELECT s.relname, pg_table_size(s.relid), pg_indexes_size(s.relid), s.n_live_tup, s.n_dead_tup, '
+        's.n_mod_since_analyze, GREATEST(s.last_analyze, s.last_autoanalyze), GREATEST(s.last_vacuum, s.last_autovacuum) '
+        'FROM pg_stat_user_tables s ORDER BY pg_total_relation_size(s.relid) DESC'
+    )).all()
+    existentes = set(_tablas())
+    tablas = []
+    avisos = []
+    for nombre, bytes_tabla, bytes_indices, vivas, muertas, cambios, analizada, vaciada in filas:
+        if nombre not in existentes:
+            continue
+        vivas, muertas, cambios = vivas or 0, muertas or 0, cambios or 0
+        proporcion_muertas = muertas / (vivas + muertas) if vivas + muertas else 0.0
+        tablas.append({
+            'tabla': nombre,
+            'filas': vivas,
+            'filas_muertas': muertas,
+            'proporcion_muertas': round(proporcion_muertas, 3),
+            'bytes_tabla': bytes_tabla,
+            'bytes_indices': bytes_indices,
+            'ultimo_analyze': analizada.isoformat() if analizada else None,
+            'ultimo_vacuum': vaciada.isoformat() if vaciada else None,
+        })
+        if vivas + muertas < MINIMO_FILAS_AVISO:
+            continue
+        if proporcion_muertas > UMBRAL_FILAS_MUERTAS:
+            avisos.append(f'{nombre}: {proporcion_muertas:.0%} de filas muertas')
+        if analizada is None or cambios > UMBRAL_CAMBIOS_SIN_ANALIZAR * max(vivas, 1):
+            avisos.append(f'{nombre}: estadísticas desactualizadas ({cambios} filas cambiadas desde el último ANALYZE)')
+    indices = [
+        {'indice': i, 'tabla': t, 'bytes': b, 'lecturas': lecturas}
+        for i, t, b, lecturas in conn.execute(text(
+            'SELECT indexrelname, relname, pg_relation_size(indexrelid), idx_scan FROM pg_stat_user_indexes '
+            'ORDER BY pg_relation_size(indexrelid) DESC'
+        )).all()
+        if t in existentes
+    ]
+    return {
+        'bytes_total': conn.execute(text('SELECT pg_database_size(current_database())')).scalar(),
+        'tablas': tablas,
+        'indices': indices,
+    }, avisos
+
+
+def _ultima_ejecucion():
+    tarea = TareaProgramada.query.filter_by(nombre=TAREA).first()
+    if tarea is None or tarea.ultima_ejecucion is None:
+        return None
+    return {
+        'fecha': tarea.ultima_ejecucion.isoformat(),
+        'segundos': tarea.duracion,
+        'resultado': json.loads(tarea.resultado) if tarea.resultado else None,
+    }
+
+
+def reporte_salud(exacto=False):
+    """
+    Tamaños de tablas e índices, espacio perdido, estadísticas y un resumen con los avisos.
+    Sin exacto (la ruta /salud/bd) en SQLite las filas son las estimadas por ANALYZE y no se miden tablas
+    ni índices uno por uno, así consultar el estado no recorre la base. exacto=True cuenta y mide todo (comando).
+    """
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            datos, avisos = _reporte_postgres(conn)
+        elif conn.dialect.name == 'sqlite':
+            datos, avisos = _reporte_sqlite(conn, exacto)
+        else:
+            datos, avisos = {'tablas': [], 'indices': []}, []
+    ultima = _ultima_ejecucion()
+    horas = current_app.config.get('MANTENIMIENTO_BD_HORAS') or 0
+    if horas and ultima and datetime.fromisoformat(ultima['fecha']) < datetime.utcnow() - timedelta(hours=2 * horas):
+        avisos.append('el mantenimiento programado no se ejecutó en el intervalo esperado')
+    if current_app.config.get('DATABASE_REPLICA_URL'):
+        from replica import estado_replica
+        replica = estado_replica()
+        datos['replica'] = replica
+        if replica['motivo']:
+            avisos.append(replica['motivo'])
+    datos.update(
+        motor=db.engine.dialect.name,
+        ultimo_mantenimiento=ultima,
+        avisos=avisos,
+        estado='ok' if not avisos else 'revisar',
+    )
+    return datos
+
+
+def reservar_tarea(nombre, intervalo):
+    """
+    Marca la tarea 'nombre' como ejecutada si le toca; devuelve False si otro worker ya la tomó.
+    """
+    ahora = datetime.utcnow()
+    if TareaProgramada.query.filter_by(nombre=nombre).first() is None:
+        try:
+            db.session.add(TareaProgramada(nombre=nombre))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+    # Un solo UPDATE condicional: solo un worker consigue cambiar la fecha
+    reservada = db.session.execute(
+        update(TareaProgramada)
+        .where(TareaProgramada.nombre == nombre)
+        .where(or_(TareaProgramada.ultima_ejecucion.is_(None), TareaProgramada.ultima_ejecucion < ahora - intervalo))
+        .values(ultima_ejecucion=ahora)
+    ).rowcount == 1
+    db.session.commit()
+    return reservada
+
+
+def ejecutar_mantenimiento(completo=False, forzar=False):
+    """
+    Ejecuta optimizar() si pasó el intervalo configurado (o si forzar=True) y guarda el resultado.
+    Devuelve el resumen, o None si no tocaba.
+    """
+    intervalo = timedelta(hours=current_app.config.get('MANTENIMIENTO_BD_HORAS') or 24)
+    if not reservar_tarea(TAREA, timedelta(0) if forzar else intervalo):
+        return None
+    purgadas = purgar_eliminaciones()
+    resultado = optimizar(completo)
+    resultado['marcas_borrado_purgadas'] = purgadas
+    resultado['sedes_predicciones_fresas'] = refrescar_sedes()
+    tarea = TareaProgramada.query.filter_by(nombre=TAREA).first()
+    tarea.duracion = resultado['segundos']
+    tarea.resultado = json.dumps(resultado)
+    db.session.commit()
+    current_app.logger.info('Mantenimiento de la base de datos: %s', ', '.join(resultado['acciones']) or 'nada que hacer')
+    return resultado
+
+
+def _ciclo(app):
+    while True:
+        time.sleep(INTERVALO_REVISION)
+        with app.app_context():
+            try:
+                ejecutar_mantenimiento()
+            except Exception:
+                app.logger.exception('Falló el mantenimiento programado de la base de datos')
+            finally:
+                db.session.remove()
+
+
+def init_mantenimiento_bd(app):
+    """
+    Registra el comando 'flask mantenimiento-bd' y arranca el hilo del mantenimiento programado.
+    """
+    @app.cli.command('mantenimiento-bd')
+    @click.option('--completo', is_flag=True, help='VACUUM FULL (Postgres) o VACUUM del archivo (SQLite).')
+    @click.option('--reporte', is_flag=True, help='Solo mostrar el reporte de salud.')
+    def comando_mantenimiento_bd(completo, reporte):
+        if not reporte:
+            click.echo(json.dumps(ejecutar_mantenimiento(completo, forzar=True), indent=2, default=str))
+        click.echo(json.dumps(reporte_salud(exacto=True), indent=2, default=str, ensure_ascii=False))
+
+    global _hilo
+    if not app.config.get('MANTENIMIENTO_BD_HORAS'):
+        return
+    with _hilo_lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_ciclo, args=(app,), name='mantenimiento-bd', daemon=True)
+            _hilo.start()
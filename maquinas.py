@@ -0,0 +1,203 @@
+"""
+Este archivo administra el registro de máquinas (tabla Maquina) de cada sede.
+
+Paso a paso:
+1. Cada máquina tiene un tipo (fresadora, horno, aspiradora), un nombre y sus datos de documentación
+   (modelo, serie, link). Las listas de Configuración guardan los nombres en este registro.
+2. Al guardar una orden, fresa o mantenimiento (before_flush) se completa maquina_id a partir del nombre,
+   así las consultas agrupan y filtran por una clave entera indexada. Los formularios solo aceptan máquinas activas
+   del registro (maquina_conocida); un nombre desconocido que llega por otra vía (datos viejos, logs) se
+   registra inactivo, así no aparece en las listas ni en el planificador hasta que alguien lo active.
+3. migrar_maquinas() pasa los datos anteriores al registro una sola vez por sede:
+   - las listas 'maquinas', 'hornos' y 'aspiradoras' de Configuración,
+   - los datos del JSON 'doc_maquinas',
+   - los nombres escritos en órdenes, fresas y mantenimientos, que reciben su maquina_id.
+   Después esas claves de Configuración se eliminan: el registro es la única fuente.
+   Una sede sin listas (también las que se crean después, ver registrar_sede_nueva) recibe las máquinas por defecto.
+4. Editar la documentación de una máquina modifica solo su fila.
+
+Así las máquinas tienen una identidad estable aunque se agreguen o quiten de las listas.
+"""
+
+import json
+from sqlalchemy import event
+from extensions import db
+from models import Maquina, Orden, FresaInstalada, FresaHistorial, Mantenimiento, Configuracion, Sede, SEDE_DEFECTO
+from sedes import sede_actual, en_sede
+
+# Tipos de máquina: clave de Configuración anterior, etiqueta para mostrar y lista por defecto
+TIPOS_MAQUINA = {
+    'fresadora': {'clave': 'maquinas', 'etiqueta': 'Milling Machines', 'defecto': ['A', 'B', 'C', 'D']},
+    'horno': {'clave': 'hornos', 'etiqueta': 'Furnaces', 'defecto': ['Horno 1', 'Horno 2', 'Horno 3']},
+    'aspiradora': {'clave': 'aspiradoras', 'etiqueta': 'Vacuum Cleaners', 'defecto': ['Aspiradora 1', 'Aspiradora 2', 'Aspiradora 3']},
+}
+# Modelos con columna maquina + maquina_id, y el tipo que se usa si el nombre no está registrado
+MODELOS_CON_MAQUINA = {Orden: 'fresadora', FresaInstalada: 'fresadora', FresaHistorial: 'fresadora', Mantenimiento: 'otro'}
+
+
+def maquinas_registradas(tipo=None, incluir_inactivas=False):
+    consulta = Maquina.query.filter_by(sede_id=sede_actual())
+    if tipo:
+        consulta = consulta.filter_by(tipo=tipo)
+    if not incluir_inactivas:
+        consulta = consulta.filter_by(activa=True)
+    return consulta.order_by(Maquina.tipo, Maquina.posicion, Maquina.id).all()
+
+
+def nombres_maquinas(tipo='fresadora', default=None):
+    """
+    Nombres de las máquinas activas de un tipo (reemplaza Configuracion.get_lista('maquinas'), etc.).
+    """
+    nombres = [m.nombre for m in maquinas_registradas(tipo)]
+    if nombres:
+        return nombres
+    return list(TIPOS_MAQUINA[tipo]['defecto'] if default is None else default)
+
+
+def maquina_conocida(nombre, tipo=None):
+    """
+    True si el nombre es una máquina activa registrada de ese tipo (o de cualquier tipo si no se indica).
+    """
+    nombre = (nombre or '').strip()
+    # Solo el registro: los nombres por defecto de nombres_maquinas() no son máquinas registradas
+    return any(m.nombre == nombre for m in maquinas_registradas(tipo))
+
+
+def guardar_nombres(tipo, nombres):
+    """
+    Actualiza la lista de un tipo: agrega las nuevas, reactiva las que vuelven y desactiva las que se quitaron.
+    """
+    existentes = {m.nombre: m for m in maquinas_registradas(tipo, incluir_inactivas=True)}
+    for posicion, nombre in enumerate(nombres):
+        maquina = existentes.pop(nombre, None)
+        if maquina is None:
+            db.session.add(Maquina(sede_id=sede_actual(), tipo=tipo, nombre=nombre, posicion=posicion))
+        else:
+            maquina.activa = True
+            maquina.posicion = posicion
+    for maquina in existentes.values():
+        maquina.activa = False
+    db.session.commit()
+
+
+def _buscar_o_crear(session, sede, nombre, tipo, cache):
+    clave = (sede, nombre)
+    if clave in cache:
+        return cache[clave]
+    candidatas = Maquina.query.filter_by(sede_id=sede, nombre=nombre).all()
+    # Si el nombre existe en varios tipos se prefiere el del modelo (una orden siempre es de una fresadora)
+    maquina = next((m for m in candidatas if m.tipo == tipo), candidatas[0] if candidatas else None)
+    if maquina is None:
+        # Nombre que no estaba en el registro: se registra inactivo (se guarda en este mismo flush)
+        maquina = Maquina(sede_id=sede, tipo=tipo, nombre=nombre, posicion=999, activa=False)
+        session.add(maquina)
+    cache[clave] = maquina
+    return maquina
+
+
+def _asignar_maquina(session, flush_context, instances):
+    pendientes = []
+    # session.new arma un conjunto nuevo en cada acceso: se lee una sola vez
+    nuevos = set(session.new)
+    for obj in list(nuevos) + list(session.dirty):
+        tipo = MODELOS_CON_MAQUINA.get(type(obj))
+        if tipo is None:
+            continue
+        if obj not in nuevos and not db.inspect(obj).attrs.maquina.history.has_changes():
+            continue
+        pendientes.append((obj, tipo))
+    if not pendientes:
+        return
+    cache = {}
+    with session.no_autoflush:
+        for obj, tipo in pendientes:
+            nombre = (obj.maquina or '').strip()
+            # Por la relación, el id se completa al guardar aunque la máquina sea nueva
+            obj.maquina_registro = _buscar_o_crear(session, obj.sede_id or sede_actual(), nombre, tipo, cache) if nombre else None
+
+
+def documentacion_maquinas():
+    """
+    Máquinas activas con sus datos de documentación, en el orden de los tipos.
+    """
+    orden_tipos = list(TIPOS_MAQUINA) + ['otro']
+    return sorted(maquinas_registradas(), key=lambda m: (orden_tipos.index(m.tipo) if m.tipo in orden_tipos else 99, m.posicion or 0, m.id))
+
+
+def guardar_documentacion(maquina, modelo, serie, link):
+    """
+    Actualiza los datos de una máquina; devuelve True si algo cambió.
+    """
+    cambio = (maquina.modelo or '', maquina.serie or '', maquina.link or '') != (modelo, serie, link)
+    if cambio:
+        maquina.modelo, maquina.serie, maquina.link = modelo, serie, link
+    return cambio
+
+
+def _migrar_sede(sede):
+    creadas = {}
+    registradas = Maquina.query.filter_by(sede_id=sede).count()
+    if not registradas:
+        doc = Configuracion.query.filter_by(sede_id=sede, clave='doc_maquinas').first()
+        try:
+            doc_maquinas = json.loads(doc.valor) if doc else {}
+        except ValueError:
+            doc_maquinas = {}
+        for tipo, datos in TIPOS_MAQUINA.items():
+            fila = Configuracion.query.filter_by(sede_id=sede, clave=datos['clave']).first()
+            nombres = [x.strip() for x in fila.valor.split(',') if x.strip()] if fila else []
+            if not nombres:
+                nombres = datos['defecto']
+            for posicion, nombre in enumerate(dict.fromkeys(nombres)):
+                extra = doc_maquinas.get(f"{datos['etiqueta']}:{nombre}", {})
+                maquina = Maquina(sede_id=sede, tipo=tipo, nombre=nombre, posicion=posicion, modelo=extra.get('modelo', ''),
+                                  serie=extra.get('serie', ''), link=extra.get('link', ''))
+                db.session.add(maquina)
+        db.session.flush()
+        Configuracion.query.filter(
+            Configuracion.sede_id == sede,
+            Configuracion.clave.in_([d['clave'] for d in TIPOS_MAQUINA.values()] + ['doc_maquinas'])
+        ).delete(synchronize_session=False)
+    # Nombres escritos en las tablas que todavía no tienen maquina_id
+    for modelo, tipo in MODELOS_CON_MAQUINA.items():
+        nombres = [
+            n for (n,) in db.session.query(modelo.maquina).filter(
+                modelo.sede_id == sede, modelo.maquina.isnot(None), modelo.maquina_id.is_(None)
+            ).distinct()
+        ]
+        for nombre in nombres:
+            if not nombre.strip():
+                continue
+            maquina = _buscar_o_crear(db.session, sede, nombre.strip(), tipo, creadas)
+            db.session.flush()
+            db.session.query(modelo).filter(
+                modelo.sede_id == sede, modelo.maquina == nombre, modelo.maquina_id.is_(None)
+            ).update({modelo.maquina_id: maquina.id}, synchronize_session=False)
+
+
+def registrar_sede_nueva(sede):
+    """
+    Registra las máquinas por defecto de una sede recién creada (las mismas que muestran las listas vacías).
+    """
+    with en_sede(sede):
+        _migrar_sede(sede)
+        db.session.commit()
+
+
+def migrar_maquinas():
+    """
+    Pasa las listas de Configuración, el JSON de documentación y los nombres de las tablas al registro de máquinas.
+    Solo hace trabajo la primera vez (o si quedaron filas sin maquina_id).
+    """
+    sedes = {s.id for s in Sede.query.all()} | {SEDE_DEFECTO}
+    for sede in sorted(sedes):
+        _migrar_sede(sede)
+    db.session.commit()
+
+
+def init_maquinas():
+    """
+    Registra el enlace automático de maquina_id en cada guardado de la sesión.
+    """
+    if not event.contains(db.session, 'before_flush', _asignar_maquina):
+        event.listen(db.session, 'before_flush', _asignar_maquina)
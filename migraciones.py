@@ -0,0 +1,143 @@
+"""
+Este archivo mantiene el esquema de la base de datos al día con los modelos.
+
+Paso a paso:
+1. db.create_all() crea las tablas nuevas, pero no agrega columnas a tablas que ya existen.
+2. La función actualizar_esquema() compara cada tabla de los modelos con la tabla real de la base de datos.
+3. Si falta una columna que admite nulos (o tiene valor por defecto), se agrega con ALTER TABLE ADD COLUMN
+   (con su REFERENCES si es una clave foránea).
+4. Si cambió una restricción UNIQUE (por ejemplo 'clave' pasó a ser única por sede) se reemplaza:
+   en Postgres con ALTER TABLE; en SQLite, que no puede borrar restricciones, se reconstruye la tabla copiando las filas.
+5. También se crean los índices definidos en los modelos que todavía no existen, y se borran los índices
+   de INDICES_REEMPLAZADOS (los que los modelos reemplazaron por otros). Los demás índices que no están en los
+   modelos (por ejemplo uno creado a mano por el administrador) no se tocan.
+
+Así las instalaciones existentes (SQLite o Postgres) reciben las columnas nuevas sin perder datos.
+"""
+
+from sqlalchemy import inspect, text, UniqueConstraint
+from sqlalchemy.schema import AddConstraint
+from extensions import db
+
+# Índices que los modelos ya no definen porque se reemplazaron por otros: se borran si todavía existen
+INDICES_REEMPLAZADOS = {
+    'ix_bloque_sede_estado_material',          # Por ix_bloque_sede_estado_catalogo (claves enteras)
+    'ix_evento_sede_id',                       # Por ix_evento_sede_transaccion
+    'ix_orden_sede_actualizacion',             # Los *_sede_actualizacion, por *_sede_transaccion
+    'ix_bloque_sede_actualizacion',
+    'ix_fresa_instalada_sede_actualizacion',
+    'ix_mantenimiento_sede_actualizacion',
+    'ix_orden_pendiente_sede_actualizacion',
+    'ix_eliminacion_sede_fecha',               # Por ix_eliminacion_sede_transaccion
+}
+
+
+def _default_sql(columna):
+    # Valor por defecto literal para que las filas existentes no queden con NULL en columnas con default
+    default = columna.default
+    if default is None or not default.is_scalar:
+        return ''
+    valor = default.arg
+    if isinstance(valor, bool):
+        return f' DEFAULT {int(valor)}'
+    if isinstance(valor, (int, float)):
+        return f' DEFAULT {valor}'
+    if isinstance(valor, str):
+        return " DEFAULT '{}'".format(valor.replace("'", "''"))
+    return ''
+
+
+def _referencia_sql(columna, quote):
+    # Clave foránea de una sola columna: se agrega junto con la columna
+    if len(columna.foreign_keys) != 1:
+        return ''
+    destino = next(iter(columna.foreign_keys)).column
+    return f' REFERENCES {quote(destino.table.name)} ({quote(destino.name)})'
+
+
+def _unicos_modelo(tabla):
+    return {
+        tuple(c.name for c in r.columns): r
+        for r in tabla.constraints if isinstance(r, UniqueConstraint)
+    }
+
+
+def _unicos_base(inspector, nombre):
+    unicos = {tuple(u['column_names']): ('constraint', u['name']) for u in inspector.get_unique_constraints(nombre)}
+    for i in inspector.get_indexes(nombre):
+        if i.get('unique') and tuple(i['column_names']) not in unicos:
+            unicos[tuple(i['column_names'])] = ('index', i['name'])
+    return unicos
+
+
+def _reconstruir_sqlite(conn, tabla, inspector, quote):
+    # SQLite no permite quitar restricciones: se renombra la tabla, se crea de nuevo y se copian las filas
+    viejo = f'{tabla.name}__viejo'
+    for indice in inspector.get_indexes(tabla.name):
+        conn.execute(text(f'DROP INDEX IF EXISTS {quote(indice["name"])}'))
+    conn.execute(text(f'ALTER TABLE {quote(tabla.name)} RENAME TO {quote(viejo)}'))
+    tabla.create(conn)
+    columnas = ', '.join(quote(c.name) for c in tabla.columns)
+    conn.execute(text(f'INSERT INTO {quote(tabla.name)} ({columnas}) SELECT {columnas} FROM {quote(viejo)}'))
+    conn.execute(text(f'DROP TABLE {quote(viejo)}'))
+
+
+def _actualizar_unicos(conn, tabla, inspector, quote):
+    """
+    Reemplaza las restricciones UNIQUE que ya no coinciden con el modelo. Devuelve True si reconstruyó la tabla.
+    """
+    modelo = _unicos_modelo(tabla)
+    base = _unicos_base(inspector, tabla.name)
+    sobrantes = {cols: origen for cols, origen in base.items() if cols not in modelo}
+    faltantes = [r for cols, r in modelo.items() if cols not in base]
+    if not sobrantes and not faltantes:
+        return False
+    if conn.dialect.name == 'sqlite':
+        if sobrantes:
+            _reconstruir_sqlite(conn, tabla, inspector, quote)
+            return True
+        for r in faltantes:
+            columnas = ', '.join(quote(c.name) for c in r.columns)
+            conn.execute(text(f'CREATE UNIQUE INDEX {quote(r.name)} ON {quote(tabla.name)} ({columnas})'))
+        return False
+    for tipo, nombre in sobrantes.values():
+        if tipo == 'constraint':
+            conn.execute(text(f'ALTER TABLE {quote(tabla.name)} DROP CONSTRAINT {quote(nombre)}'))
+        else:
+            conn.execute(text(f'DROP INDEX {quote(nombre)}'))
+    for r in faltantes:
+        conn.execute(AddConstraint(r))
+    return False
+
+
+def actualizar_esquema():
+    """
+    Agrega las columnas e índices que faltan en tablas existentes. Debe llamarse después de db.create_all().
+    """
+    engine = db.engine
+    quote = engine.dialect.identifier_preparer.quote
+    inspector = inspect(engine)
+    tablas_existentes = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for tabla in db.metadata.sorted_tables:
+            if tabla.name not in tablas_existentes:
+                continue
+            columnas = {c['name'] for c in inspector.get_columns(tabla.name)}
+            for columna in tabla.columns:
+                if columna.name in columnas:
+                    continue
+                tipo = columna.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE {quote(tabla.name)} ADD COLUMN {quote(columna.name)} {tipo}'
+                    f'{_default_sql(columna)}{_referencia_sql(columna, quote)}'
+                ))
+            if _actualizar_unicos(conn, tabla, inspector, quote):
+                continue  # La tabla se creó de nuevo con todos sus índices
+            indices = {i['name']: i for i in inspector.get_indexes(tabla.name)}
+            for indice in tabla.indexes:
+                if indice.name not in indices:
+                    indice.create(conn)
+            definidos = {indice.name for indice in tabla.indexes}
+            for nombre in indices:
+                if nombre in INDICES_REEMPLAZADOS and nombre not in definidos:
+                    conn.execute(text(f'DROP INDEX {quote(nombre)}'))
@@ -9,7 +9,23 @@ Paso a paso:
    - BloqueHistorial: guarda el historial de bloques eliminados o modificados.
    - FresaInventario: inventario de fresas nuevas.
    - FresaInstalada: fresas que están instaladas en las máquinas.
+   - FresaHistorial: fresas retiradas de las máquinas (sirven para estimar la vida de cada tipo de fresa).
    - Mantenimiento: registro de actividades de mantenimiento.
+   - Evento y EventoCheckpoint: registro de cambios (solo se agrega, con la sede de cada fila) y hasta dónde lo leyó
+     cada consumidor.
+   - Maquina: registro de máquinas (fresadoras, hornos, aspiradoras) con sus datos de documentación.
+     Orden, FresaInstalada, FresaHistorial y Mantenimiento la referencian con maquina_id (ver maquinas.py).
+   - Material, Marca y Shade: catálogos con un id entero y el nombre canónico de cada valor.
+     Orden, Bloque, BloqueHistorial y OrdenPendiente los referencian con material_id, marca_id y shade_id
+     (ver catalogos.py); la columna de texto se mantiene con el nombre canónico para mostrarlo.
+     Las listas, los CSV, los eventos y la sincronización de los clientes leen ese texto sin unir tablas,
+     y las fresas comparan sus materiales por nombre; los filtros e índices usan los ids.
+   - Eliminacion: marcas de las filas borradas, para que los clientes sincronizados también las borren.
+     Orden, Bloque, OrdenPendiente, FresaInstalada y Mantenimiento guardan fecha_actualizacion (ver sincronizacion.py).
+   - TareaProgramada: última ejecución de las tareas periódicas (por ejemplo el mantenimiento de la base de datos).
+   - ArchivoIngesta: hasta qué byte se leyó cada log de las fresadoras (ver ingesta_logs.py).
+   - Sede: laboratorios que comparten la instalación. Las tablas del laboratorio tienen sede_id (mixin PorSede)
+     y sus índices empiezan por la sede; sedes.py filtra cada consulta por la sede actual.
 3. Cada clase tiene atributos que corresponden a las columnas de la tabla.
 4. Algunas clases tienen métodos para procesar datos almacenados (por ejemplo, obtener los códigos de orden fresados).
 
@@ -19,37 +35,162 @@ En resumen, aquí se define cómo se almacena y organiza la información princip
 # Importamos la base de datos y la fecha/hora actual
 from extensions import db
 from datetime import datetime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+import threading
+import time
+
+SEDE_DEFECTO = 1  # Sede de las filas existentes y de las instalaciones con un solo laboratorio
+
+
+# Marca de la transacción que escribe una fila, calculada por la base de datos al ejecutar la sentencia.
+# Ordenar por (transaccion, id) y leer solo hasta el horizonte (ver bitacora.horizonte) no saltea filas
+# de transacciones que se confirman tarde:
+# - Postgres: el id de la transacción (txid_current()). Las transacciones con id menor que el xmin de la foto
+#   actual ya terminaron; las que siguen abiertas o empiezan después tienen un id mayor.
+# - SQLite: las escrituras se turnan (una transacción de escritura a la vez), así que basta con la posición
+#   del registro de eventos al escribir: la transacción siguiente siempre ve una posición mayor.
+class transaccion_actual(FunctionElement):
+    type = db.BigInteger()
+    name = 'transaccion_actual'
+    inherit_cache = True
+
+
+@compiles(transaccion_actual)
+def _transaccion_actual(elemento, compilador, **kw):
+    return '(SELECT COALESCE(MAX(id), 0) FROM evento)'
+
+
+@compiles(transaccion_actual, 'postgresql')
+def _transaccion_actual_postgres(elemento, compilador, **kw):
+    return 'txid_current()'
+
+
+# Índice para buscar códigos por prefijo con LIKE en Postgres (ver escaneo.py): varchar_pattern_ops compara
+# byte a byte, así LIKE 'p%' usa el índice con cualquier collation. En SQLite no se crea (usa el índice normal).
+def indice_prefijo(nombre, columna):
+    return db.Index(nombre, 'sede_id', columna, postgresql_ops={columna: 'varchar_pattern_ops'}).ddl_if(
+        dialect='postgresql'
+    )
+
+
+# Columna de sede compartida por todas las tablas de un laboratorio
+class PorSede:
+    sede_id = db.Column(db.Integer, nullable=False, default=SEDE_DEFECTO)
+
+
+# Fecha y transacción de la última modificación. La sincronización incremental de los clientes recorre
+# (transaccion, id): la fecha se calcula al guardar y no sigue el orden en que se confirman las transacciones
+class ConActualizacion:
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    transaccion = db.Column(db.BigInteger, default=transaccion_actual(), onupdate=transaccion_actual())
+
+
+# Modelo para el registro de máquinas de cada sede
+class Maquina(PorSede, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('sede_id', 'tipo', 'nombre', name='uq_maquina_sede_tipo_nombre'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False, default='fresadora')  # fresadora, horno, aspiradora, otro
+    nombre = db.Column(db.String(100), nullable=False)
+    modelo = db.Column(db.String(100))
+    serie = db.Column(db.String(100))
+    link = db.Column(db.String(300))
+    activa = db.Column(db.Boolean, nullable=False, default=True)  # Las máquinas quitadas se desactivan, no se borran
+    posicion = db.Column(db.Integer, default=0)  # Orden en las listas
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Columnas compartidas por los catálogos (material, marca, shade)
+# 'clave' es el nombre sin diferencias de mayúsculas ni espacios: dos variantes del mismo valor tienen la misma clave
+class Catalogo(PorSede):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(50), nullable=False)  # Nombre canónico que se muestra
+    clave = db.Column(db.String(50), nullable=False)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Catálogo de materiales
+class Material(Catalogo, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('sede_id', 'clave', name='uq_material_sede_clave'),
+    )
+
+# Catálogo de marcas
+class Marca(Catalogo, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('sede_id', 'clave', name='uq_marca_sede_clave'),
+    )
+
+# Catálogo de shades (colores)
+class Shade(Catalogo, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('sede_id', 'clave', name='uq_shade_sede_clave'),
+    )
+
+# Modelo para los laboratorios (sedes)
+class Sede(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(100), nullable=False, unique=True)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
 
 # Modelo para las órdenes de fresado
-class Orden(db.Model):
+class Orden(PorSede, ConActualizacion, db.Model):
+    __table_args__ = (
+        db.Index('ix_orden_sede_fecha', 'sede_id', 'fecha_creacion'),
+        db.Index('ix_orden_sede_maquina_fecha', 'sede_id', 'maquina_id', 'fecha_creacion'),
+        db.Index('ix_orden_sede_material_shade', 'sede_id', 'material_id', 'shade_id'),
+        db.Index('ix_orden_sede_transaccion', 'sede_id', 'transaccion', 'id'),
+        indice_prefijo('ix_orden_sede_codigo_orden_prefijo', 'codigo_orden'),
+        indice_prefijo('ix_orden_sede_codigo_barra_prefijo', 'codigo_barra'),
+    )
     # id único para cada orden
     id = db.Column(db.Integer, primary_key=True)
-    # Código de la orden
-    codigo_orden = db.Column(db.String(100))
+    # Código de la orden (indexado para resolver escaneos; ver escaneo.py)
+    codigo_orden = db.Column(db.String(100), index=True)
     # Material usado en la orden
     material = db.Column(db.String(50))
     # Marca del material
     marca = db.Column(db.String(50))
     # Color o shade del material
     shade = db.Column(db.String(20))
+    # Referencias a los catálogos (se completan al guardar a partir de los nombres)
+    material_id = db.Column(db.Integer, db.ForeignKey('material.id'))
+    marca_id = db.Column(db.Integer, db.ForeignKey('marca.id'))
+    shade_id = db.Column(db.Integer, db.ForeignKey('shade.id'))
+    material_registro = db.relationship('Material')
+    marca_registro = db.relationship('Marca')
+    shade_registro = db.relationship('Shade')
     # Código de barra del bloque usado
-    codigo_barra = db.Column(db.String(100))
-    # Máquina utilizada
+    codigo_barra = db.Column(db.String(100), index=True)
+    # Máquina utilizada (nombre y referencia al registro de máquinas)
     maquina = db.Column(db.String(50))
+    maquina_id = db.Column(db.Integer, db.ForeignKey('maquina.id'))
+    maquina_registro = db.relationship('Maquina')
     # Cantidad de modelos fresados en la orden
     cantidad_modelos = db.Column(db.Integer)
     # Fecha de creación de la orden
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
 
 # Modelo para los bloques de material
-class Bloque(db.Model):
+class Bloque(PorSede, ConActualizacion, db.Model):
+    __table_args__ = (
+        db.Index('ix_bloque_sede_estado_catalogo', 'sede_id', 'estado', 'material_id', 'shade_id'),
+        db.Index('ix_bloque_sede_transaccion', 'sede_id', 'transaccion', 'id'),
+        indice_prefijo('ix_bloque_sede_codigo_barra_prefijo', 'codigo_barra'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     material = db.Column(db.String(50), nullable=False)
     marca = db.Column(db.String(50))
     shade = db.Column(db.String(20))
+    material_id = db.Column(db.Integer, db.ForeignKey('material.id'))
+    marca_id = db.Column(db.Integer, db.ForeignKey('marca.id'))
+    shade_id = db.Column(db.Integer, db.ForeignKey('shade.id'))
+    material_registro = db.relationship('Material')
+    marca_registro = db.relationship('Marca')
+    shade_registro = db.relationship('Shade')
     grosor = db.Column(db.Integer)
     cantidad = db.Column(db.Integer, default=1)
-    codigo_barra = db.Column(db.String(100))
+    codigo_barra = db.Column(db.String(100), index=True)
     estado = db.Column(db.String(20), default='nuevo')
     modelos_fresados = db.Column(db.Integer, default=0)
     codigos_orden_fresados = db.Column(db.Text)
@@ -62,20 +203,32 @@ class Bloque(db.Model):
         return []
 
 # Modelo para el historial de bloques eliminados o modificados
-class BloqueHistorial(db.Model):
+class BloqueHistorial(PorSede, db.Model):
+    __table_args__ = (
+        db.Index('ix_bloque_historial_sede_fecha', 'sede_id', 'fecha_eliminacion'),
+        indice_prefijo('ix_bloque_historial_sede_codigo_barra_prefijo', 'codigo_barra'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     bloque_id = db.Column(db.Integer)
     material = db.Column(db.String(50))
     marca = db.Column(db.String(50))
     shade = db.Column(db.String(20))
+    material_id = db.Column(db.Integer, db.ForeignKey('material.id'))
+    marca_id = db.Column(db.Integer, db.ForeignKey('marca.id'))
+    shade_id = db.Column(db.Integer, db.ForeignKey('shade.id'))
+    material_registro = db.relationship('Material')
+    marca_registro = db.relationship('Marca')
+    shade_registro = db.relationship('Shade')
     grosor = db.Column(db.Integer)
     cantidad = db.Column(db.Integer)
-    codigo_barra = db.Column(db.String(100))
+    codigo_barra = db.Column(db.String(100), index=True)
     estado = db.Column(db.String(20))
     modelos_fresados = db.Column(db.Integer)
     codigos_orden_fresados = db.Column(db.Text)
     fecha_creacion = db.Column(db.DateTime)
     fecha_eliminacion = db.Column(db.DateTime, default=datetime.utcnow)
+    # Por qué salió de la tabla de bloques: 'manual' o la regla de retiro automático (ver retiro_bloques.py)
+    motivo_retiro = db.Column(db.String(20))
 
     def get_codigos_orden_fresados(self):
         # Devuelve una lista de los códigos de orden fresados en este bloque (historial)
@@ -84,7 +237,10 @@ class BloqueHistorial(db.Model):
         return []
 
 # Modelo para el inventario de fresas nuevas
-class FresaInventario(db.Model):
+class FresaInventario(PorSede, db.Model):
+    __table_args__ = (
+        db.Index('ix_fresa_inventario_sede_tipo', 'sede_id', 'tipo'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     tipo = db.Column(db.String(50))
     diametro = db.Column(db.Float)
@@ -93,19 +249,57 @@ class FresaInventario(db.Model):
     fecha_registro = db.Column(db.DateTime, default=datetime.utcnow)
 
 # Modelo para las fresas instaladas en las máquinas
-class FresaInstalada(db.Model):
+class FresaInstalada(PorSede, ConActualizacion, db.Model):
+    __table_args__ = (
+        db.Index('ix_fresa_instalada_sede_maquina', 'sede_id', 'maquina_id', 'fecha_instalacion'),
+        db.Index('ix_fresa_instalada_sede_transaccion', 'sede_id', 'transaccion', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     tipo = db.Column(db.String(50))
     diametro = db.Column(db.Float)
     maquina = db.Column(db.String(50))
+    maquina_id = db.Column(db.Integer, db.ForeignKey('maquina.id'))
+    maquina_registro = db.relationship('Maquina')
     materiales = db.Column(db.String(200))  # Materiales compatibles, separados por coma
     fecha_instalacion = db.Column(db.DateTime, default=datetime.utcnow)
     modelos_fresados = db.Column(db.Integer, default=0)
+    # Predicción de desgaste (se recalcula al guardar; ver desgaste.py)
+    vida_estimada = db.Column(db.Integer)
+    fecha_reemplazo_estimada = db.Column(db.DateTime)
+
+    def get_materiales(self):
+        # Devuelve la lista de materiales compatibles
+        if self.materiales:
+            return [m.strip() for m in self.materiales.split(',') if m.strip()]
+        return []
+
+# Modelo para el historial de fresas retiradas de las máquinas
+class FresaHistorial(PorSede, db.Model):
+    __table_args__ = (
+        db.Index('ix_fresa_historial_sede_tipo', 'sede_id', 'tipo'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    fresa_id = db.Column(db.Integer)
+    tipo = db.Column(db.String(50))
+    diametro = db.Column(db.Float)
+    maquina = db.Column(db.String(50))
+    maquina_id = db.Column(db.Integer, db.ForeignKey('maquina.id'))
+    maquina_registro = db.relationship('Maquina')
+    materiales = db.Column(db.String(200))
+    fecha_instalacion = db.Column(db.DateTime)
+    modelos_fresados = db.Column(db.Integer)
+    fecha_retiro = db.Column(db.DateTime, default=datetime.utcnow)
 
 # Modelo para el registro de mantenimiento de las máquinas
-class Mantenimiento(db.Model):
+class Mantenimiento(PorSede, ConActualizacion, db.Model):
+    __table_args__ = (
+        db.Index('ix_mantenimiento_sede_maquina_fecha', 'sede_id', 'maquina_id', 'fecha'),
+        db.Index('ix_mantenimiento_sede_transaccion', 'sede_id', 'transaccion', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     maquina = db.Column(db.String(100))
+    maquina_id = db.Column(db.Integer, db.ForeignKey('maquina.id'))
+    maquina_registro = db.relationship('Maquina')
     actividad = db.Column(db.String(200))
     descripcion = db.Column(db.String(200))
     fecha = db.Column(db.DateTime, default=datetime.utcnow)
@@ -116,31 +310,138 @@ Cada vez que se escanea un código (el escáner envía un ENTER), se agrega una
 Luego, el usuario puede seleccionar uno o varios códigos de esta lista para crear una orden grupal.
 Todas las órdenes agrupadas compartirán los mismos datos de shade, material, bloque, etc.
 """
-class OrdenPendiente(db.Model):
+class OrdenPendiente(PorSede, ConActualizacion, db.Model):
+    # Un código solo puede estar pendiente una vez por sede
+    __table_args__ = (
+        db.UniqueConstraint('sede_id', 'codigo_orden', name='uq_orden_pendiente_sede_codigo'),
+        indice_prefijo('ix_orden_pendiente_sede_codigo_prefijo', 'codigo_orden'),
+        db.Index('ix_orden_pendiente_sede_transaccion', 'sede_id', 'transaccion', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    codigo_orden = db.Column(db.String(100), unique=True)
+    codigo_orden = db.Column(db.String(100))
     fecha_escaneo = db.Column(db.DateTime, default=datetime.utcnow)
-    # Puedes agregar más campos si lo necesitas en el futuro
+    # Datos opcionales del caso, usados para planificar qué bloque usar antes de fresar
+    material = db.Column(db.String(50))
+    shade = db.Column(db.String(20))
+    material_id = db.Column(db.Integer, db.ForeignKey('material.id'))
+    shade_id = db.Column(db.Integer, db.ForeignKey('shade.id'))
+    material_registro = db.relationship('Material')
+    shade_registro = db.relationship('Shade')
+    cantidad_modelos = db.Column(db.Integer)
 
 # Modelo para almacenar configuraciones y listas editables
-class Configuracion(db.Model):
+class Configuracion(PorSede, db.Model):
+    # Cada sede tiene sus propias listas
+    __table_args__ = (
+        db.UniqueConstraint('sede_id', 'clave', name='uq_configuracion_sede_clave'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    clave = db.Column(db.String(50), unique=True, nullable=False)
+    clave = db.Column(db.String(50), nullable=False)
     valor = db.Column(db.Text, nullable=False)
 
+    # Caché por (sede, clave): las listas se leen en casi todas las páginas
+    CACHE_SEGUNDOS = 30
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    @staticmethod
+    def _sede():
+        from sedes import sede_actual
+        return sede_actual()
+
     @staticmethod
     def get_lista(clave, default=None):
-        c = Configuracion.query.filter_by(clave=clave).first()
-        if c:
-            return [x.strip() for x in c.valor.split(',') if x.strip()]
+        sede = Configuracion._sede()
+        ahora = time.monotonic()
+        with Configuracion._cache_lock:
+            guardado = Configuracion._cache.get((sede, clave))
+        if guardado and guardado[0] > ahora:
+            valores = guardado[1]
+        else:
+            c = Configuracion.query.filter_by(sede_id=sede, clave=clave).first()
+            valores = [x.strip() for x in c.valor.split(',') if x.strip()] if c else None
+            with Configuracion._cache_lock:
+                Configuracion._cache[(sede, clave)] = (ahora + Configuracion.CACHE_SEGUNDOS, valores)
+        if valores is not None:
+            return list(valores)
         return default or []
 
     @staticmethod
     def set_lista(clave, lista):
-        c = Configuracion.query.filter_by(clave=clave).first()
+        sede = Configuracion._sede()
+        c = Configuracion.query.filter_by(sede_id=sede, clave=clave).first()
         if not c:
-            c = Configuracion(clave=clave, valor=','.join(lista))
+            c = Configuracion(sede_id=sede, clave=clave, valor=','.join(lista))
             db.session.add(c)
         else:
             c.valor = ','.join(lista)
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+        with Configuracion._cache_lock:
+            Configuracion._cache.pop((sede, clave), None)
+
+    @staticmethod
+    def quitar(clave):
+        # Sin fila, get_lista vuelve a devolver el valor por defecto
+        sede = Configuracion._sede()
+        c = Configuracion.query.filter_by(sede_id=sede, clave=clave).first()
+        if c:
+            db.session.delete(c)
+            db.session.commit()
+        with Configuracion._cache_lock:
+            Configuracion._cache.pop((sede, clave), None)
+
+# Registro de eventos del dominio (solo se agregan filas; ver bitacora.py)
+# El id es la posición (offset): siempre crece y los consumidores recuerdan el último que procesaron
+# Cada evento lleva la sede de su fila: un laboratorio solo lee los suyos
+# El orden de lectura es (transaccion, id): los ids de Postgres no siguen el orden de confirmación
+class Evento(PorSede, db.Model):
+    __table_args__ = (
+        db.Index('ix_evento_transaccion', 'transaccion', 'id'),
+        db.Index('ix_evento_sede_transaccion', 'sede_id', 'transaccion', 'id'),
+        # En SQLite, AUTOINCREMENT evita que se reutilice un id aunque se borren filas
+        {'sqlite_autoincrement': True},
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False, index=True)  # tabla.accion, por ejemplo 'orden.creado'
+    entidad = db.Column(db.String(50), nullable=False)
+    entidad_id = db.Column(db.Integer)
+    datos = db.Column(db.Text)  # JSON con los valores (o los cambios) de la fila
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+    transaccion = db.Column(db.BigInteger, nullable=False, default=transaccion_actual())
+
+# Último evento procesado por cada consumidor del registro de eventos
+class EventoCheckpoint(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    consumidor = db.Column(db.String(100), unique=True, nullable=False)
+    posicion = db.Column(db.Integer, nullable=False, default=0)  # id del último evento procesado (ver bitacora.leer_eventos)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Marca de cada fila borrada de las tablas sincronizadas (tabla + id), para propagar los borrados
+class Eliminacion(PorSede, db.Model):
+    __table_args__ = (
+        db.Index('ix_eliminacion_sede_transaccion', 'sede_id', 'transaccion', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    tabla = db.Column(db.String(50), nullable=False)
+    entidad_id = db.Column(db.Integer, nullable=False)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+    transaccion = db.Column(db.BigInteger, default=transaccion_actual())
+
+# Última ejecución de cada tarea periódica (compartida por todos los workers; ver mantenimiento_bd.py)
+class TareaProgramada(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(100), unique=True, nullable=False)
+    ultima_ejecucion = db.Column(db.DateTime)
+    duracion = db.Column(db.Float)  # Segundos que tardó la última ejecución
+    resultado = db.Column(db.Text)  # JSON con el resumen de la última ejecución
+
+# Posición de lectura de cada archivo de log de las fresadoras (ver ingesta_logs.py)
+class ArchivoIngesta(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    ruta = db.Column(db.String(500), unique=True, nullable=False)
+    inodo = db.Column(db.BigInteger)      # Si cambia, el archivo se reemplazó (rotación) y se lee desde el inicio
+    posicion = db.Column(db.BigInteger, default=0)  # Bytes ya procesados
+    lineas = db.Column(db.Integer, default=0)
+    trabajos = db.Column(db.Integer, default=0)   # Órdenes creadas desde este archivo
+    errores = db.Column(db.Integer, default=0)    # Líneas que no se pudieron interpretar
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
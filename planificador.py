@@ -0,0 +1,196 @@
+"""
+Este archivo reparte los casos pendientes entre las fresadoras (balanceo de carga).
+
+Paso a paso:
+1. Para cada máquina se leen las fresas instaladas (materiales compatibles y modelos fresados)
+   y la carga reciente (modelos fresados en los últimos días según las órdenes).
+2. Una máquina solo puede recibir un caso si tiene instalada una fresa compatible con el material
+   y a esa fresa le queda vida suficiente para los modelos del caso (vida estimada en desgaste.py).
+3. Se usa un algoritmo voraz con montículos (heap): los casos grandes se asignan primero y cada caso
+   va a la máquina compatible con menos carga. Las máquinas con fresas casi gastadas solo se usan si no hay otra.
+4. El plan se guarda en memoria: cuando se escanean o se quitan casos solo se asignan o liberan esos casos,
+   y se recalcula todo únicamente si cambian las fresas, las órdenes o las máquinas.
+
+Así el operador recibe una propuesta de qué máquina usar para cada caso.
+"""
+
+import heapq
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from extensions import db
+from models import Orden, FresaInstalada, OrdenPendiente, Maquina
+from desgaste import vida_fresa_configurada
+from sedes import sede_actual
+from bitacora import ultima_posicion
+
+DIAS_CARGA_RECIENTE = 7      # Días de órdenes que cuentan como carga actual de la máquina
+UMBRAL_DESGASTE = 0.9        # A partir de este desgaste la máquina se evita
+# Tablas (entidades de la bitácora) cuyos cambios obligan a recalcular el plan
+ENTIDADES = ('fresa_instalada', 'orden', 'maquina', 'configuracion')
+
+
+def _materiales(texto):
+    return {m.strip().lower() for m in (texto or '').split(',') if m.strip()}
+
+
+class PlanMaquinas:
+    """
+    Plan incremental de casos por máquina.
+    fresas: {maquina: {material: {'vida_restante': n, 'vida': n}}}
+    carga_reciente: {maquina: modelos}
+    """
+
+    def __init__(self, fresas, carga_reciente):
+        self.fresas = fresas
+        self.carga_reciente = carga_reciente
+        self.maquinas = sorted(set(fresas) | set(carga_reciente))
+        self.carga = {m: carga_reciente.get(m, 0) for m in self.maquinas}
+        self.asignados = {}    # codigo -> (maquina, material, modelos)
+        self.entradas = {}     # codigo -> (material, modelos) tal como llegó el caso
+        self.sin_asignar = {}  # codigo -> motivo
+        self.heaps = {}        # material -> heap de (evitar, carga, maquina)
+        for maquina, por_material in fresas.items():
+            for material in por_material:
+                self._push(material, maquina)
+
+    def _evitar(self, maquina, material):
+        fresa = self.fresas[maquina][material]
+        return 1 if fresa['vida_restante'] <= fresa['vida'] * (1 - UMBRAL_DESGASTE) else 0
+
+    def _push(self, material, maquina):
+        entrada = (self._evitar(maquina, material), self.carga[maquina], maquina)
+        heapq.heappush(self.heaps.setdefault(material, []), entrada)
+
+    def asignar(self, codigo, material, modelos):
+        self.entradas[codigo] = (material, modelos)
+        material_norm = (material or '').strip().lower()
+        if not material_norm:
+            self.sin_asignar[codigo] = 'Falta el material del caso'
+            return None
+        heap = self.heaps.get(material_norm)
+        if not heap:
+            self.sin_asignar[codigo] = 'Ninguna máquina tiene una fresa compatible instalada'
+            return None
+        descartadas = []
+        elegida = None
+        while heap:
+            evitar, carga, maquina = heapq.heappop(heap)
+            # Entrada vieja: la carga o el desgaste cambiaron desde que se agregó
+            if carga != self.carga[maquina] or evitar != self._evitar(maquina, material_norm):
+                continue
+            if self.fresas[maquina][material_norm]['vida_restante'] < modelos:
+                descartadas.append((evitar, carga, maquina))
+                continue
+            elegida = maquina
+            break
+        for entrada in descartadas:
+            heapq.heappush(heap, entrada)
+        if elegida is None:
+            self.sin_asignar[codigo] = 'Las fresas compatibles no tienen vida suficiente'
+            return None
+        self.sin_asignar.pop(codigo, None)
+        self._mover(elegida, material_norm, modelos)
+        self.asignados[codigo] = (elegida, material_norm, modelos)
+        return elegida
+
+    def quitar(self, codigo):
+        self.entradas.pop(codigo, None)
+        self.sin_asignar.pop(codigo, None)
+        asignado = self.asignados.pop(codigo, None)
+        if asignado:
+            maquina, material, modelos = asignado
+            self._mover(maquina, material, -modelos)
+
+    def _mover(self, maquina, material, modelos):
+        self.carga[maquina] += modelos
+        self.fresas[maquina][material]['vida_restante'] -= modelos
+        # La carga de la máquina cambió: se agrega una entrada nueva en cada material que fresa
+        for mat in self.fresas[maquina]:
+            self._push(mat, maquina)
+
+    def resultado(self):
+        casos_por_maquina = {m: [] for m in self.maquinas}
+        for codigo, (maquina, material, modelos) in self.asignados.items():
+            casos_por_maquina[maquina].append({'codigo': codigo, 'material': material, 'modelos': modelos})
+        return {
+            'maquinas': [
+                {
+                    'maquina': m,
+                    'carga_reciente': self.carga_reciente.get(m, 0),
+                    'modelos_asignados': self.carga[m] - self.carga_reciente.get(m, 0),
+                    'carga_total': self.carga[m],
+                    'desgaste': {
+                        mat: round(1 - f['vida_restante'] / f['vida'], 3)
+                        for mat, f in self.fresas.get(m, {}).items()
+                    },
+                    'casos': sorted(casos_por_maquina[m], key=lambda c: -c['modelos']),
+                }
+                for m in self.maquinas
+            ],
+            'sin_asignar': [{'codigo': c, 'motivo': motivo} for c, motivo in self.sin_asignar.items()],
+        }
+
+
+def _cargar_estado():
+    vida = vida_fresa_configurada()
+    fresas = {}
+    # La fresa vigente para cada (máquina, material) es la instalada más recientemente, igual que al crear órdenes
+    for fresa in FresaInstalada.query.order_by(FresaInstalada.fecha_instalacion.desc()).all():
+        if not fresa.maquina:
+            continue
+        por_material = fresas.setdefault(fresa.maquina, {})
+        for material in _materiales(fresa.materiales):
+            if material not in por_material:
+                vida_fresa = fresa.vida_estimada or vida
+                por_material[material] = {'vida': vida_fresa, 'vida_restante': vida_fresa - (fresa.modelos_fresados or 0)}
+    desde = datetime.utcnow() - timedelta(days=DIAS_CARGA_RECIENTE)
+    carga = dict(
+        db.session.query(Maquina.nombre, func.sum(Orden.cantidad_modelos))
+        .join(Orden, Orden.maquina_id == Maquina.id)
+        .filter(Orden.fecha_creacion >= desde)
+        .group_by(Maquina.id, Maquina.nombre)
+        .all()
+    )
+    return fresas, {m: int(c or 0) for m, c in carga.items()}
+
+
+def _firma():
+    # Posición de la bitácora para fresas, órdenes, máquinas y configuración (incluye ediciones y borrados).
+    # Los casos pendientes no cuentan: esos se asignan o liberan sin recalcular el plan.
+    # La vida estimada de las fresas no genera eventos (desgaste.py la recalcula), por eso se suma aparte.
+    vidas = db.session.query(func.sum(FresaInstalada.vida_estimada)).scalar()
+    return (ultima_posicion(ENTIDADES), vidas, vida_fresa_configurada(), datetime.utcnow().date())
+
+
+# Un plan por sede: {sede: {'firma': ..., 'plan': PlanMaquinas}}
+_estado = {}
+_estado_lock = threading.Lock()
+
+
+def obtener_plan_maquinas():
+    """
+    Devuelve el plan por máquina para los casos pendientes.
+    Reutiliza el plan anterior y solo asigna/libera los casos que cambiaron.
+    """
+    firma = _firma()
+    pendientes = {
+        p.codigo_orden: p
+        for p in OrdenPendiente.query.order_by(OrdenPendiente.fecha_escaneo.asc()).all()
+    }
+    with _estado_lock:
+        estado = _estado.setdefault(sede_actual(), {'firma': None, 'plan': None})
+        plan = estado['plan']
+        if plan is None or estado['firma'] != firma:
+            plan = PlanMaquinas(*_cargar_estado())
+            estado.update(firma=firma, plan=plan)
+        # Se liberan los casos que ya no están pendientes o cuyos datos cambiaron
+        for codigo, entrada in list(plan.entradas.items()):
+            p = pendientes.get(codigo)
+            if p is None or entrada != (p.material, p.cantidad_modelos or 1):
+                plan.quitar(codigo)
+        # Casos nuevos: primero los de más modelos (LPT)
+        nuevos = [p for c, p in pendientes.items() if c not in plan.entradas]
+        for p in sorted(nuevos, key=lambda p: -(p.cantidad_modelos or 1)):
+            plan.asignar(p.codigo_orden, p.material, p.cantidad_modelos or 1)
+        return plan.resultado()
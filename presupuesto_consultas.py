@@ -0,0 +1,220 @@
+"""
+Este archivo controla cuántas consultas SQL hace cada ruta, para que no aparezcan patrones N+1 sin que nadie lo note.
+
+Paso a paso:
+1. Se crean dos bases SQLite temporales con los mismos tipos de datos: una chica y otra más grande
+   (más órdenes, bloques, pendientes, materiales y shades).
+2. Se piden todas las rutas GET de los blueprints (con ids y códigos de ejemplo) y algunos escenarios POST
+   (fresar con varios códigos a la vez). Con un evento del motor se cuentan las sentencias SQL de cada petición.
+   Antes de cada petición se vacían las cachés en memoria, así se mide el peor caso (caché fría).
+3. Se compara con el presupuesto guardado en presupuesto_consultas.json:
+   - falla si una ruta hace más lecturas (SELECT) con la base grande que con la chica (crece con los datos);
+     las escrituras pueden crecer cuando la petición guarda más filas (SQLite manda un INSERT por fila),
+   - falla si supera su presupuesto o si una ruta nueva no tiene presupuesto.
+4. Con --actualizar se escribe el presupuesto con los valores actuales (después de revisar el cambio).
+
+Uso:
+    python presupuesto_consultas.py             # revisa (sale con código 1 si algo falla)
+    python presupuesto_consultas.py --actualizar
+    python presupuesto_consultas.py --detalle "GET /ordenes/"   # muestra las sentencias de una ruta
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ARCHIVO_PRESUPUESTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'presupuesto_consultas.json')
+TAMANOS = (20, 200)  # Órdenes de la base chica y de la grande
+# Rutas que no se miden: streams que no terminan, archivos estáticos y rutas con SQL solo de Postgres (to_char)
+EXCLUIDAS = {'eventos.stream', 'static', 'ordenes.api_graficas_inventario'}
+# Valores de ejemplo para los parámetros de las rutas
+PARAMETROS = {'int': '1', 'path': 'C0001', 'default': 'C0001'}
+# Parámetros de consulta para las rutas que sin ellos no hacen nada
+CONSULTAS = {
+    'analitica.api_reporte': 'dimensiones=mes,maquina,shade&material=Material 0&pivote=maquina',
+    'bloques.etiquetas': 'ids=1,2,3,4,5&formato=pdf',
+}
+
+
+def _sembrar(n):
+    """
+    Carga una base con n órdenes y datos proporcionales (la cantidad de materiales y shades también crece).
+    """
+    from extensions import db
+    from models import (Bloque, BloqueHistorial, Orden, OrdenPendiente, FresaInstalada, FresaInventario,
+                        FresaHistorial, Mantenimiento, Configuracion)
+    # Los valores se reparten en forma fija (no al azar) para que las dos bases recorran las mismas ramas
+    ahora = datetime.utcnow()
+    materiales = [f'Material {i}' for i in range(2 + n // 50)]
+    shades = [f'S{i}' for i in range(3 + n // 40)]
+    maquinas = ['A', 'B', 'C', 'D']
+    Configuracion.set_lista('materiales', materiales)
+    Configuracion.set_lista('shades', shades)
+    Configuracion.set_lista('grosores', ['14', '18'])
+    for i in range(max(n // 10, 2)):
+        db.session.add(Bloque(material=materiales[i % len(materiales)], shade=shades[i % len(shades)], grosor=14,
+                              cantidad=1 + i % 5, estado='nuevo'))
+    for i in range(n):
+        material, shade = materiales[i % len(materiales)], shades[i % len(shades)]
+        fecha = ahora - timedelta(days=i % 61)
+        codigo_bloque = f'14X{i:04d}'
+        if i % 2 == 0:
+            db.session.add(Bloque(material=material, shade=shade, grosor=14, cantidad=1, codigo_barra=codigo_bloque,
+                                  estado='usado', modelos_fresados=2, codigos_orden_fresados=f'C{i:04d}', fecha_creacion=fecha))
+        db.session.add(Orden(codigo_orden=f'C{i:04d}', material=material, shade=shade, codigo_barra=codigo_bloque,
+                             maquina=maquinas[i % len(maquinas)], cantidad_modelos=2, fecha_creacion=fecha))
+    for i in range(n // 4):
+        db.session.add(BloqueHistorial(bloque_id=10000 + i, material=materiales[i % len(materiales)], shade=shades[i % len(shades)],
+                                       grosor=14, cantidad=1, codigo_barra=f'14H{i:04d}', estado='usado', modelos_fresados=3,
+                                       fecha_creacion=ahora - timedelta(days=90), fecha_eliminacion=ahora - timedelta(days=30)))
+    for i in range(max(n // 5, 2)):
+        db.session.add(OrdenPendiente(codigo_orden=f'P{i:04d}', material=materiales[i % len(materiales)],
+                                      shade=shades[i % len(shades)], cantidad_modelos=2))
+    for j, maquina in enumerate(maquinas):
+        db.session.add(FresaInstalada(tipo='T1', maquina=maquina, materiales=','.join(materiales),
+                                      modelos_fresados=100 * j, fecha_instalacion=ahora - timedelta(days=30)))
+        db.session.add(Mantenimiento(maquina=maquina, actividad='Limpieza (cada 1 semana)', fecha=ahora - timedelta(days=10)))
+    for i in range(max(n // 20, 2)):
+        db.session.add(FresaInventario(tipo=f'T{i}', diametro=1.0, cantidad=3, materiales=','.join(materiales)))
+        db.session.add(FresaHistorial(tipo='T1', maquina=maquinas[i % len(maquinas)], materiales=materiales[0],
+                                      fecha_instalacion=ahora - timedelta(days=90), modelos_fresados=400,
+                                      fecha_retiro=ahora - timedelta(days=60)))
+    db.session.commit()
+
+
+def _limpiar_caches():
+    from models import Configuracion
+    import pronostico
+    import utilizacion
+    import planificador
+    import reportes
+    with Configuracion._cache_lock:
+        Configuracion._cache.clear()
+    pronostico._cache.clear()
+    utilizacion._utilizacion_memo.cache_clear()
+    planificador._estado.clear()
+    reportes._cache.limpiar()
+
+
+def _rutas(app):
+    """
+    Rutas GET de la app con sus parámetros completados con valores de ejemplo.
+    """
+    rutas = []
+    for regla in app.url_map.iter_rules():
+        if regla.endpoint in EXCLUIDAS or 'GET' not in regla.methods:
+            continue
+        url = regla.rule
+        for conversor, nombre in [(a.split(':')[0] if ':' in a else 'default', a.split(':')[-1])
+                                  for a in [p[1:-1] for p in url.split('/') if p.startswith('<')]]:
+            parte = f'<{conversor}:{nombre}>' if conversor != 'default' else f'<{nombre}>'
+            url = url.replace(parte, PARAMETROS.get(conversor, PARAMETROS['default']))
+        if regla.endpoint in CONSULTAS:
+            url += '?' + CONSULTAS[regla.endpoint]
+        rutas.append((f'GET {regla.rule}', 'GET', url, None))
+    return sorted(rutas)
+
+
+def _escenarios_post(n):
+    # Fresar varios códigos a la vez: la cantidad de códigos crece con el tamaño de la base
+    codigos = [f'P{i:04d}' for i in range(max(n // 20, 1))]
+    return [
+        ('POST /ordenes/ (fresar pendientes con bloque nuevo)', 'POST', '/ordenes/',
+         {'codigo_orden': ','.join(codigos), 'cantidad_modelos': len(codigos), 'maquina': 'A', 'bloque_nuevo_id': '1'}),
+        ('POST /ordenes/ (fresado grupal con bloque usado)', 'POST', '/ordenes/',
+         {'codigos_seleccionados': codigos, 'material': 'Material 0', 'shade': 'S0', 'cantidad_modelos': '1',
+          'maquina': 'B', 'bloque_usado_id': str(max(n // 10, 2) + 1)}),
+    ]
+
+
+def medir(n, detalle=None):
+    """
+    Crea una base con n órdenes y devuelve {ruta: (sentencias, lecturas, estado_http)} (y las sentencias de 'detalle').
+    """
+    from sqlalchemy import event
+    directorio = tempfile.mkdtemp(prefix='consultas_')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directorio, "consultas.db")}'
+    os.environ['MANTENIMIENTO_BD_HORAS'] = '0'
+    from app import create_app
+    from extensions import db
+    app = create_app()
+    sentencias = []
+    with app.app_context():
+        _sembrar(n)
+        motor = db.engine
+
+        def contar(conn, cursor, sql, parametros, contexto, varias):
+            sentencias.append(sql)
+
+        event.listen(motor, 'before_cursor_execute', contar)
+        resultado = {}
+        sentencias_detalle = []
+        cliente = app.test_client()
+        for nombre, metodo, url, datos in _rutas(app) + _escenarios_post(n):
+            _limpiar_caches()
+            del sentencias[:]
+            respuesta = cliente.open(url, method=metodo, data=datos)
+            respuesta.get_data()  # Consumir los streams para contar también sus consultas
+            lecturas = sum(1 for sql in sentencias if sql.lstrip()[:6].upper() in ('SELECT', 'WITH ', 'PRAGMA'))
+            resultado[nombre] = (len(sentencias), lecturas, respuesta.status_code)
+            if nombre == detalle:
+                sentencias_detalle = list(sentencias)
+        event.remove(motor, 'before_cursor_execute', contar)
+        db.session.remove()
+        motor.dispose()
+    return resultado, sentencias_detalle
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Presupuesto de consultas SQL por ruta.')
+    parser.add_argument('--actualizar', action='store_true', help='Guardar los valores actuales como presupuesto')
+    parser.add_argument('--detalle', help='Mostrar las sentencias SQL de una ruta (nombre como en el presupuesto)')
+    args = parser.parse_args()
+
+    chica, _ = medir(TAMANOS[0])
+    grande, sentencias = medir(TAMANOS[1], args.detalle)
+    if args.detalle:
+        for sql in sentencias:
+            print(' '.join(sql.split())[:300])
+        print(f'{len(sentencias)} sentencias')
+        return
+
+    presupuesto = {}
+    if os.path.exists(ARCHIVO_PRESUPUESTO):
+        with open(ARCHIVO_PRESUPUESTO, encoding='utf-8') as f:
+            presupuesto = json.load(f)
+    fallas = []
+    print(f"{'ruta':<62}{'lect. chica':>12}{'lect. grande':>13}{'total':>7}{'presup.':>9}  estado")
+    for nombre in sorted(grande):
+        _, lecturas_chica, _ = chica.get(nombre, (0, 0, None))
+        consultas, lecturas, estado_http = grande[nombre]
+        limite = presupuesto.get(nombre)
+        problemas = []
+        if estado_http >= 500:
+            problemas.append(f'HTTP {estado_http}')
+        if lecturas > lecturas_chica:
+            problemas.append('crece con los datos')
+        if not args.actualizar and limite is None:
+            problemas.append('sin presupuesto')
+        elif not args.actualizar and consultas > limite:
+            problemas.append('supera el presupuesto')
+        if problemas:
+            fallas.append(nombre)
+        print(f"{nombre:<62}{lecturas_chica:>12}{lecturas:>13}{consultas:>7}{'' if limite is None else limite:>9}"
+              f"  {', '.join(problemas) or 'ok'}")
+
+    if args.actualizar:
+        with open(ARCHIVO_PRESUPUESTO, 'w', encoding='utf-8') as f:
+            json.dump({nombre: grande[nombre][0] for nombre in sorted(grande)}, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f'Presupuesto guardado en {ARCHIVO_PRESUPUESTO}')
+    if fallas:
+        print(f'{len(fallas)} rutas con problemas')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
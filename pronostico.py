@@ -0,0 +1,158 @@
+"""
+Este archivo calcula el pronóstico de consumo de bloques y las alertas de reposición.
+
+Paso a paso:
+1. Se leen como tablas (pandas) el stock de bloques nuevos, los bloques abiertos (bloques usados creados,
+   también los que ya pasaron al historial) y los modelos fresados de las órdenes.
+2. Para cada SKU (material, shade, grosor) se arma una matriz de bloques abiertos por día.
+3. Con operaciones vectorizadas se calculan: consumo diario, desviación, días de cobertura,
+   punto de reorden (consumo durante la reposición + stock de seguridad) y fecha estimada de agotamiento.
+4. El resultado se guarda en caché y solo se recalcula cuando cambian las órdenes o los bloques.
+
+Así se puede saber con anticipación qué material/shade/grosor se va a terminar.
+"""
+
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, union_all
+from sedes import leer_df, sede_actual
+from models import Orden, Bloque, BloqueHistorial
+from catalogos import nombres_por_id
+from bitacora import ultima_posicion
+
+# Parámetros por defecto del pronóstico
+VENTANA_DIAS = 60        # Días de historia usados para calcular el consumo
+DIAS_REPOSICION = 14     # Días que tarda el proveedor en entregar
+Z_SERVICIO = 1.65        # Nivel de servicio ~95% para el stock de seguridad
+
+CLAVES_SKU = ['material', 'shade', 'grosor']
+# Tablas (entidades de la bitácora) cuyos cambios invalidan el pronóstico
+ENTIDADES = ('orden', 'bloque', 'bloque_historial', 'material', 'shade')
+
+# Caché por sede y parámetros: {(sede, ventana, reposicion, z, dia): (firma, resultado)}
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def firma_datos():
+    """
+    Devuelve una firma barata de las tablas que alimentan el pronóstico: la posición del último evento
+    de esas tablas en la bitácora. Cambia con cada alta, edición o borrado (no solo con filas nuevas).
+    Si la firma no cambia, el pronóstico guardado sigue siendo válido.
+    """
+    return ultima_posicion(ENTIDADES)
+
+
+def obtener_pronostico(ventana_dias=VENTANA_DIAS, dias_reposicion=DIAS_REPOSICION, z=Z_SERVICIO):
+    """
+    Devuelve el pronóstico por SKU usando la caché si los datos no cambiaron.
+    """
+    clave = (sede_actual(), ventana_dias, dias_reposicion, z, datetime.utcnow().date())
+    firma = firma_datos()
+    with _cache_lock:
+        guardado = _cache.get(clave)
+        if guardado and guardado[0] == firma:
+            return guardado[1]
+    resultado = calcular_pronostico(ventana_dias, dias_reposicion, z)
+    with _cache_lock:
+        # Los días anteriores ya no sirven: solo se guardan las claves de hoy
+        for k in [k for k in _cache if k[4] != clave[4]]:
+            del _cache[k]
+        _cache[clave] = (firma, resultado)
+    return resultado
+
+
+def _leer(stmt, columnas_fecha=None):
+    # A través de la sesión para que la consulta quede filtrada por la sede actual
+    return leer_df(stmt, columnas_fecha)
+
+
+def calcular_pronostico(ventana_dias=VENTANA_DIAS, dias_reposicion=DIAS_REPOSICION, z=Z_SERVICIO, hoy=None):
+    """
+    Calcula consumo, cobertura y punto de reorden por SKU con operaciones vectorizadas.
+    """
+    hoy = pd.Timestamp(hoy or datetime.utcnow()).normalize()
+    desde = hoy - pd.Timedelta(days=ventana_dias - 1)
+
+    # Stock actual de bloques nuevos
+    stock = _leer(
+        select(Bloque.material, Bloque.shade, Bloque.grosor, Bloque.cantidad)
+        .where(Bloque.estado == 'nuevo')
+    )
+    # Bloques abiertos en la ventana: cada bloque usado nace al abrir un bloque nuevo
+    abiertos = _leer(
+        union_all(
+            select(Bloque.material, Bloque.shade, Bloque.grosor, Bloque.fecha_creacion)
+            .where(Bloque.estado == 'usado', Bloque.fecha_creacion >= desde.to_pydatetime()),
+            select(BloqueHistorial.material, BloqueHistorial.shade, BloqueHistorial.grosor, BloqueHistorial.fecha_creacion)
+            .where(BloqueHistorial.estado == 'usado', BloqueHistorial.fecha_creacion >= desde.to_pydatetime()),
+        ),
+        columnas_fecha=['fecha_creacion']
+    )
+    # Modelos fresados en la ventana por material y shade (las órdenes no guardan el grosor)
+    modelos = _leer(
+        select(Orden.material_id, Orden.shade_id, func.sum(Orden.cantidad_modelos).label('modelos_ventana'))
+        .where(Orden.fecha_creacion >= desde.to_pydatetime())
+        .group_by(Orden.material_id, Orden.shade_id)
+    )
+    # Se agrupa por los ids de los catálogos y después se ponen los nombres
+    modelos['material'] = modelos.pop('material_id').map(nombres_por_id('material'))
+    modelos['shade'] = modelos.pop('shade_id').map(nombres_por_id('shade'))
+
+    for df in (stock, abiertos, modelos):
+        for col in ('material', 'shade'):
+            df[col] = df[col].fillna('').astype(str).str.strip()
+    for df in (stock, abiertos):
+        df['grosor'] = pd.to_numeric(df['grosor'], errors='coerce').fillna(0).astype(int)
+
+    stock = stock.groupby(CLAVES_SKU, as_index=False)['cantidad'].sum().rename(columns={'cantidad': 'stock'})
+
+    # Matriz SKU x día con la cantidad de bloques abiertos (días sin consumo = 0)
+    dias = pd.date_range(desde, hoy, freq='D')
+    abiertos['dia'] = abiertos['fecha_creacion'].dt.normalize()
+    matriz = (
+        abiertos.groupby(CLAVES_SKU + ['dia']).size()
+        .unstack('dia', fill_value=0)
+        .reindex(columns=dias, fill_value=0)
+    )
+    consumo = pd.DataFrame({
+        'abiertos_ventana': matriz.sum(axis=1),
+        'consumo_diario': matriz.mean(axis=1),
+        'desviacion_diaria': matriz.std(axis=1, ddof=0),
+    }).reset_index()
+
+    df = stock.merge(consumo, on=CLAVES_SKU, how='outer')
+    df = df.merge(modelos, on=['material', 'shade'], how='left')
+    df[['stock', 'abiertos_ventana', 'consumo_diario', 'desviacion_diaria', 'modelos_ventana']] = (
+        df[['stock', 'abiertos_ventana', 'consumo_diario', 'desviacion_diaria', 'modelos_ventana']].fillna(0)
+    )
+
+    tasa = df['consumo_diario'].to_numpy(dtype=float)
+    existencias = df['stock'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cobertura = np.where(tasa > 0, existencias / tasa, np.inf)
+    seguridad = z * df['desviacion_diaria'].to_numpy(dtype=float) * np.sqrt(dias_reposicion)
+    punto_reorden = np.ceil(tasa * dias_reposicion + seguridad)
+
+    df['dias_cobertura'] = cobertura
+    df['stock_seguridad'] = np.round(seguridad, 2)
+    df['punto_reorden'] = punto_reorden.astype(int)
+    df['alerta'] = np.select(
+        [(tasa > 0) & (cobertura < dias_reposicion), (tasa > 0) & (existencias <= punto_reorden)],
+        ['critico', 'reordenar'],
+        default='ok'
+    )
+    agotamiento = hoy + pd.to_timedelta(np.where(np.isfinite(cobertura), cobertura, np.nan), unit='D')
+    df['fecha_agotamiento'] = pd.Series(agotamiento, index=df.index).dt.strftime('%Y-%m-%d')
+
+    df = df.sort_values(['dias_cobertura', 'material', 'shade', 'grosor'])
+    df['consumo_diario'] = df['consumo_diario'].round(3)
+    df['desviacion_diaria'] = df['desviacion_diaria'].round(3)
+    df['dias_cobertura'] = df['dias_cobertura'].round(1)
+    df = df.astype({'stock': int, 'abiertos_ventana': int, 'modelos_ventana': int})
+    # JSON no admite infinito ni NaN
+    df = df.replace([np.inf, -np.inf], np.nan)
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict('records')
@@ -0,0 +1,420 @@
+"""
+Este archivo es una prueba de carga del flujo de fresado con varios operadores trabajando a la vez.
+
+Paso a paso:
+1. Prepara una base de datos de prueba con bloques nuevos, bloques usados, máquinas y casos pendientes:
+   - SQLite: un archivo temporal en modo WAL (el que usan varias instalaciones chicas),
+   - Postgres: la URL indicada con --db (con --reiniciar se borran y crean las tablas; nunca se usa una base con datos).
+2. Levanta la app con gunicorn y varios workers locales (o usa un servidor ya levantado con --url).
+3. Cada operador virtual (un hilo) repite una mezcla realista de acciones:
+   - escanear: agrega casos pendientes (a veces el mismo código que otro operador),
+   - fresar: crea órdenes con un bloque nuevo o usado de un grupo chico, para que varios consuman el mismo bloque,
+   - eliminar pendiente: borra casos que otro operador puede estar fresando,
+   - navegar: páginas y APIs de consulta (órdenes, bloques, pronóstico, reportes, escaneo, sincronización).
+4. Al final informa por acción: cantidad, errores, rendimiento (peticiones por segundo) y latencias p50/p95/p99.
+   También las esperas por bloqueos (Postgres: consultas esperando un lock; SQLite: errores 'database is locked').
+5. Revisa los invariantes del inventario sobre la base:
+   - ningún bloque con cantidad negativa,
+   - cada unidad descontada de los bloques nuevos tiene su bloque usado (y al revés),
+   - los modelos fresados de cada bloque usado coinciden con la suma de sus órdenes,
+   - ningún código fresado dos veces ni pendiente después de fresado, y códigos de bloque únicos.
+
+Uso:
+    python prueba_carga.py --workers 4 --operadores 16 --duracion 60
+    python prueba_carga.py --db postgresql://localhost/fresado_carga --reiniciar --workers 4
+    python prueba_carga.py --url http://127.0.0.1:8000 --db sqlite:////ruta/a/la/base.db
+
+Sale con código 1 si hubo errores del servidor o invariantes violados.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlparse
+
+# Peso de cada acción en la mezcla de tráfico
+MEZCLA = {'escanear': 30, 'fresar': 25, 'eliminar_pendiente': 5, 'navegar': 40}
+PAGINAS = [
+    '/ordenes/', '/bloques/', '/analitica/api/pronostico-bloques', '/analitica/api/reporte?dimensiones=dia,maquina',
+    '/ordenes/api/plan-maquinas', '/api/sync', '/eventos/api/registro',
+]
+MATERIALES = ['Zirconia', 'PMMA']
+SHADES = ['A1', 'A2', 'A3']
+MAQUINAS = ['A', 'B', 'C', 'D']
+BLOQUES_NUEVOS = 6          # Grupo chico de bloques nuevos: varios operadores consumen el mismo
+UNIDADES_POR_BLOQUE = 40
+BLOQUES_USADOS = 4
+PENDIENTES_INICIALES = 50
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+class Cliente:
+    """
+    Conexión HTTP persistente de un operador (no sigue redirecciones: un 302 es un guardado correcto).
+    """
+
+    def __init__(self, url):
+        partes = urlparse(url)
+        self.host, self.puerto = partes.hostname, partes.port or 80
+        self.conexion = None
+
+    def pedir(self, metodo, ruta, datos=None):
+        cuerpo = urlencode(datos, doseq=True) if datos is not None else None
+        encabezados = {'Content-Type': 'application/x-www-form-urlencoded'} if cuerpo is not None else {}
+        for intento in range(2):
+            if self.conexion is None:
+                self.conexion = http.client.HTTPConnection(self.host, self.puerto, timeout=60)
+            try:
+                self.conexion.request(metodo, ruta, body=cuerpo, headers=encabezados)
+                respuesta = self.conexion.getresponse()
+                contenido = respuesta.read()
+                return respuesta.status, contenido
+            except (http.client.HTTPException, ConnectionError, socket.timeout):
+                self.conexion.close()
+                self.conexion = None
+                if intento:
+                    raise
+
+
+class Estado:
+    """
+    Datos compartidos por los operadores y métricas de la prueba.
+    """
+
+    def __init__(self, bloques_nuevos, bloques_usados, pendientes):
+        self.lock = threading.Lock()
+        self.bloques_nuevos = bloques_nuevos
+        self.bloques_usados = bloques_usados
+        self.pendientes = list(pendientes)
+        self.en_curso = set()  # Códigos que algún operador está fresando o borrando en este momento
+        self.contador = 0
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.bloqueos = 0
+        self.ejemplos_error = []
+
+    def nuevo_codigo(self):
+        with self.lock:
+            self.contador += 1
+            return f'LT{self.contador:06d}'
+
+    def tomar_pendientes(self, cantidad):
+        with self.lock:
+            # A veces un operador toma un código que otro está procesando (dos estaciones con el mismo caso)
+            if self.en_curso and random.random() < 0.1:
+                return [random.choice(sorted(self.en_curso))]
+            tomados = self.pendientes[:cantidad]
+            del self.pendientes[:cantidad]
+            self.en_curso.update(tomados)
+            return tomados
+
+    def liberar(self, codigos):
+        with self.lock:
+            self.en_curso.difference_update(codigos)
+
+    def registrar(self, accion, segundos, estado, contenido):
+        with self.lock:
+            self.latencias[accion].append(segundos)
+            if estado >= 500:
+                self.errores[accion] += 1
+                if b'locked' in contenido or b'deadlock' in contenido:
+                    self.bloqueos += 1
+                if len(self.ejemplos_error) < 5:
+                    self.ejemplos_error.append(f'{accion}: HTTP {estado}')
+
+
+def _accion(estado, cliente):
+    accion = random.choices(list(MEZCLA), weights=list(MEZCLA.values()))[0]
+    codigos = []
+    if accion == 'escanear':
+        codigo = estado.nuevo_codigo()
+        peticion = ('POST', '/ordenes/', {'codigo_orden_pendiente': codigo})
+    elif accion == 'fresar':
+        codigos = estado.tomar_pendientes(random.choice([1, 1, 1, 2, 3]))
+        if not codigos:
+            codigos = [estado.nuevo_codigo()]
+        datos = {
+            'codigo_orden': ','.join(codigos),
+            'cantidad_modelos': random.randint(1, 4) * len(codigos),
+            'maquina': random.choice(MAQUINAS),
+        }
+        if random.random() < 0.7:
+            datos['bloque_nuevo_id'] = random.choice(estado.bloques_nuevos)
+        else:
+            datos['bloque_usado_id'] = random.choice(estado.bloques_usados)
+        peticion = ('POST', '/ordenes/', datos)
+    elif accion == 'eliminar_pendiente':
+        codigos = estado.tomar_pendientes(1)
+        if not codigos:
+            return
+        # Con id 0 la ruta busca por código, igual que cuando la lista de la página quedó desactualizada
+        peticion = ('POST', '/ordenes/eliminar_pendiente/0', {'codigo_orden': codigos[0]})
+    else:
+        ruta = random.choice(PAGINAS + ['/scan/LT%06d' % random.randint(1, max(estado.contador, 1))])
+        peticion = ('GET', ruta, None)
+    inicio = time.perf_counter()
+    try:
+        codigo_http, contenido = cliente.pedir(*peticion)
+    except Exception as e:
+        codigo_http, contenido = 599, str(e).encode()
+    estado.registrar(accion, time.perf_counter() - inicio, codigo_http, contenido)
+    if accion == 'escanear' and codigo_http < 400:
+        # Recién escaneado se puede fresar (no antes: el caso todavía no existía)
+        with estado.lock:
+            estado.pendientes.append(codigo)
+    estado.liberar(codigos)
+
+
+def _operador(estado, url, fin):
+    cliente = Cliente(url)
+    while time.monotonic() < fin:
+        _accion(estado, cliente)
+
+
+def _esperas_postgres(url, fin, resultado):
+    # Cada 0,2 s cuenta las consultas que están esperando un lock
+    from sqlalchemy import create_engine, text
+    motor = create_engine(url)
+    muestras = []
+    with motor.connect() as conn:
+        deadlocks_antes = conn.execute(text('SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()')).scalar()
+        while time.monotonic() < fin:
+            muestras.append(conn.execute(text(
+                "SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock' AND datname = current_database()"
+            )).scalar())
+            conn.commit()
+            time.sleep(0.2)
+        deadlocks = conn.execute(text('SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()')).scalar()
+    resultado.update(
+        muestras=len(muestras),
+        esperando_max=max(muestras or [0]),
+        esperando_promedio=round(sum(muestras) / len(muestras), 2) if muestras else 0,
+        deadlocks=(deadlocks or 0) - (deadlocks_antes or 0),
+    )
+    motor.dispose()
+
+
+def preparar_base(url_db, reiniciar):
+    """
+    Crea las tablas y carga los datos iniciales. Devuelve (ids bloques nuevos, ids bloques usados, pendientes, unidades).
+    """
+    os.environ['DATABASE_URL'] = url_db
+    os.environ.setdefault('MANTENIMIENTO_BD_HORAS', '0')
+    from app import create_app
+    from extensions import db
+    from models import Bloque, Orden, OrdenPendiente, FresaInstalada
+    app = create_app()
+    with app.app_context():
+        if Orden.query.first() is not None or Bloque.query.first() is not None:
+            if not reiniciar:
+                sys.exit('La base ya tiene datos: use una base vacía o --reiniciar (borra todas las tablas).')
+            db.drop_all()
+            db.create_all()
+        nuevos = []
+        for i in range(BLOQUES_NUEVOS):
+            b = Bloque(material=MATERIALES[i % len(MATERIALES)], shade=SHADES[i % len(SHADES)], grosor=14,
+                       cantidad=UNIDADES_POR_BLOQUE, estado='nuevo')
+            db.session.add(b)
+            nuevos.append(b)
+        usados = []
+        for i in range(BLOQUES_USADOS):
+            b = Bloque(material=MATERIALES[i % len(MATERIALES)], shade=SHADES[i % len(SHADES)], grosor=14, cantidad=1,
+                       estado='usado', modelos_fresados=0, codigo_barra=f'14US{i:02d}', codigos_orden_fresados='')
+            db.session.add(b)
+            usados.append(b)
+        for maquina in MAQUINAS:
+            db.session.add(FresaInstalada(tipo='T1', maquina=maquina, materiales=','.join(MATERIALES), modelos_fresados=0))
+        pendientes = [f'INI{i:04d}' for i in range(PENDIENTES_INICIALES)]
+        for codigo in pendientes:
+            db.session.add(OrdenPendiente(codigo_orden=codigo))
+        db.session.commit()
+        return [b.id for b in nuevos], [b.id for b in usados], pendientes, BLOQUES_NUEVOS * UNIDADES_POR_BLOQUE
+
+
+def revisar_invariantes(unidades_iniciales, usados_iniciales):
+    """
+    Revisa la consistencia del inventario después de la carga. Devuelve la lista de violaciones.
+    """
+    from sqlalchemy import func
+    from extensions import db
+    from models import Bloque, Orden, OrdenPendiente
+    violaciones = []
+    negativos = Bloque.query.filter(Bloque.cantidad < 0).count()
+    if negativos:
+        violaciones.append(f'{negativos} bloques con cantidad negativa')
+    unidades = db.session.query(func.coalesce(func.sum(Bloque.cantidad), 0)).filter(Bloque.estado == 'nuevo').scalar()
+    usados = Bloque.query.filter(Bloque.estado == 'usado').count()
+    if unidades_iniciales - unidades != usados - usados_iniciales:
+        violaciones.append(
+            f'unidades descontadas ({unidades_iniciales - unidades}) distintas de bloques usados creados ({usados - usados_iniciales})'
+        )
+    modelos_por_bloque = dict(
+        db.session.query(Orden.codigo_barra, func.sum(Orden.cantidad_modelos)).group_by(Orden.codigo_barra).all()
+    )
+    desfasados = [
+        b.codigo_barra for b in Bloque.query.filter(Bloque.estado == 'usado')
+        if (b.modelos_fresados or 0) != (modelos_por_bloque.get(b.codigo_barra) or 0)
+    ]
+    if desfasados:
+        violaciones.append(f'{len(desfasados)} bloques usados con modelos_fresados distinto de la suma de sus órdenes')
+    duplicados = db.session.query(Orden.codigo_orden).group_by(Orden.codigo_orden).having(func.count() > 1).count()
+    if duplicados:
+        violaciones.append(f'{duplicados} códigos fresados más de una vez')
+    pendientes_fresados = (
+        db.session.query(func.count(OrdenPendiente.id))
+        .filter(OrdenPendiente.codigo_orden.in_(db.session.query(Orden.codigo_orden)))
+        .scalar()
+    )
+    if pendientes_fresados:
+        violaciones.append(f'{pendientes_fresados} casos siguen pendientes después de fresados')
+    codigos_repetidos = (
+        db.session.query(Bloque.codigo_barra).filter(Bloque.codigo_barra.isnot(None))
+        .group_by(Bloque.codigo_barra).having(func.count() > 1).count()
+    )
+    if codigos_repetidos:
+        violaciones.append(f'{codigos_repetidos} códigos de bloque repetidos')
+    return violaciones
+
+
+def _iniciar_gunicorn(url_db, workers, hilos, puerto, registro):
+    entorno = dict(os.environ, DATABASE_URL=url_db, MANTENIMIENTO_BD_HORAS='0')
+    proceso = subprocess.Popen(
+        ['gunicorn', 'app:create_app()', '--worker-class', 'gthread', '--threads', str(hilos),
+         '-w', str(workers), '-b', f'127.0.0.1:{puerto}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=entorno, stdout=registro, stderr=subprocess.STDOUT,
+    )
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            sys.exit('gunicorn terminó al iniciar; ver el registro')
+        try:
+            if Cliente(f'http://127.0.0.1:{puerto}').pedir('GET', '/')[0] == 200:
+                return proceso
+        except OSError:
+            time.sleep(0.3)
+    proceso.terminate()
+    sys.exit('gunicorn no respondió a tiempo')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga del flujo de escaneo y fresado.')
+    parser.add_argument('--db', help='URL de la base (por defecto un SQLite temporal en modo WAL)')
+    parser.add_argument('--reiniciar', action='store_true', help='Borrar y crear las tablas si la base tiene datos')
+    parser.add_argument('--url', help='Servidor ya levantado (no se inicia gunicorn)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--hilos', type=int, default=4, help='Hilos por worker de gunicorn')
+    parser.add_argument('--operadores', type=int, default=16, help='Operadores virtuales simultáneos')
+    parser.add_argument('--duracion', type=float, default=30, help='Segundos de carga')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+    args = parser.parse_args()
+    random.seed(args.semilla)
+
+    temporal = None
+    url_db = args.db
+    if not url_db:
+        temporal = tempfile.mkdtemp(prefix='carga_')
+        url_db = f'sqlite:///{os.path.join(temporal, "carga.db")}'
+    if url_db.startswith('sqlite:///'):
+        # WAL: los lectores no bloquean al que escribe (queda guardado en el archivo para todas las conexiones)
+        archivo = url_db[len('sqlite:///'):]
+        with sqlite3.connect(archivo) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+
+    nuevos, usados, pendientes, unidades = preparar_base(url_db, args.reiniciar)
+    estado = Estado(nuevos, usados, pendientes)
+
+    proceso = None
+    registro = tempfile.NamedTemporaryFile(prefix='gunicorn_', suffix='.log', delete=False)
+    url = args.url
+    if not url:
+        puerto = _puerto_libre()
+        proceso = _iniciar_gunicorn(url_db, args.workers, args.hilos, puerto, registro)
+        url = f'http://127.0.0.1:{puerto}'
+
+    inicio = time.monotonic()
+    fin = inicio + args.duracion
+    esperas = {}
+    hilos = [threading.Thread(target=_operador, args=(estado, url, fin)) for _ in range(args.operadores)]
+    if url_db.startswith('postgresql'):
+        hilos.append(threading.Thread(target=_esperas_postgres, args=(url_db, fin, esperas)))
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    transcurrido = time.monotonic() - inicio
+    if proceso:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+    registro.close()
+    with open(registro.name, 'rb') as f:
+        bloqueos_registro = f.read().count(b'database is locked')
+
+    from app import create_app
+    with create_app().app_context():
+        violaciones = revisar_invariantes(unidades, len(usados))
+
+    acciones = {}
+    for accion, valores in sorted(estado.latencias.items()):
+        acciones[accion] = {
+            'peticiones': len(valores),
+            'errores': estado.errores.get(accion, 0),
+            'por_segundo': round(len(valores) / transcurrido, 1),
+            'p50_ms': round(_percentil(valores, 50) * 1000, 1),
+            'p95_ms': round(_percentil(valores, 95) * 1000, 1),
+            'p99_ms': round(_percentil(valores, 99) * 1000, 1),
+        }
+    resultado = {
+        'base': url_db.split('@')[-1],
+        'workers': None if args.url else args.workers,
+        'operadores': args.operadores,
+        'segundos': round(transcurrido, 1),
+        'peticiones_por_segundo': round(sum(len(v) for v in estado.latencias.values()) / transcurrido, 1),
+        'acciones': acciones,
+        'bloqueos': {'respuestas_con_bloqueo': estado.bloqueos, 'database_is_locked_en_registro': bloqueos_registro, **esperas},
+        'ejemplos_error': estado.ejemplos_error,
+        'invariantes_violados': violaciones,
+        'registro_servidor': registro.name,
+    }
+    if args.json:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    else:
+        print(f"{resultado['peticiones_por_segundo']} peticiones/s en {resultado['segundos']} s ({resultado['base']})")
+        print(f"{'acción':<20}{'peticiones':>11}{'errores':>9}{'/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for accion, m in acciones.items():
+            print(f"{accion:<20}{m['peticiones']:>11}{m['errores']:>9}{m['por_segundo']:>8}{m['p50_ms']:>9}{m['p95_ms']:>9}{m['p99_ms']:>9}")
+        print('Bloqueos:', json.dumps(resultado['bloqueos'], ensure_ascii=False))
+        for e in estado.ejemplos_error:
+            print('Error:', e)
+        print('Invariantes:', 'ok' if not violaciones else f'{len(violaciones)} violados')
+        for v in violaciones:
+            print('  -', v)
+        print('Registro del servidor:', registro.name)
+    fallo = violaciones or any(m['errores'] for m in acciones.values())
+    sys.exit(1 if fallo else 0)
+
+
+if __name__ == '__main__':
+    main()
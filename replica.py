@@ -0,0 +1,127 @@
+"""
+Este archivo envía las consultas de solo lectura (paneles, exportaciones, analítica) a una réplica de la base de datos.
+
+Paso a paso:
+1. Si se configura DATABASE_REPLICA_URL, la réplica se agrega como bind 'replica' de Flask-SQLAlchemy.
+   Puede ser un Postgres réplica o, para pruebas, una copia del archivo SQLite.
+2. Las rutas marcadas con @solo_lectura activan la réplica para esa petición.
+3. La sesión (SesionEnrutada) decide el motor en cada consulta:
+   - durante un guardado (flush) o fuera de una ruta de solo lectura, siempre el principal,
+   - en una ruta de solo lectura, la réplica si está disponible y al día.
+4. Control de retraso (opcional, REPLICA_RETRASO_MAXIMO en segundos): se compara el último evento
+   (tabla Evento) de la réplica con el del principal. Si a la réplica le falta un evento más viejo que
+   el máximo permitido, se usa el principal. El resultado se guarda unos segundos para no consultar siempre.
+5. Si la réplica no responde se usa el principal y se vuelve a probar más tarde.
+
+Así una exportación grande no compite con la creación de órdenes por las conexiones del principal.
+"""
+
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+from flask import g, has_app_context, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+BIND_REPLICA = 'replica'
+INTERVALO_REVISION = 5   # Segundos que se reutiliza el resultado del control de la réplica
+
+_estado = {'revisado': 0.0, 'usable': False, 'motivo': None, 'retraso': None}
+_estado_lock = threading.Lock()
+
+
+class SesionEnrutada(Session):
+    """
+    Sesión que lee de la réplica en las rutas de solo lectura y escribe siempre en el principal.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _leer_de_replica():
+            motor = self._db.engines.get(BIND_REPLICA)
+            if motor is not None and replica_usable(self._db):
+                return motor
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _leer_de_replica():
+    return has_app_context() and g.get('solo_lectura', False)
+
+
+def solo_lectura(vista):
+    """
+    Decorador para rutas que solo leen datos: sus consultas van a la réplica si está disponible.
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        g.solo_lectura = True
+        return vista(*args, **kwargs)
+    return envoltura
+
+
+def _ultimo_evento(conexion):
+    return conexion.execute(text('SELECT MAX(id) FROM evento')).scalar() or 0
+
+
+def _revisar(db):
+    """
+    Prueba la réplica y mide su retraso. Devuelve (usable, motivo, retraso_en_segundos).
+    """
+    maximo = current_app.config.get('REPLICA_RETRASO_MAXIMO')
+    try:
+        with db.engines[BIND_REPLICA].connect() as replica:
+            ultimo_replica = _ultimo_evento(replica)
+    except Exception as e:
+        return False, f'réplica no disponible: {e.__class__.__name__}', None
+    if maximo is None:
+        return True, None, None
+    with db.engines[None].connect() as principal:
+        # Primer evento que todavía no llegó a la réplica: su antigüedad es el retraso
+        pendiente = principal.execute(
+            text('SELECT MIN(fecha) FROM evento WHERE id > :ultimo'), {'ultimo': ultimo_replica}
+        ).scalar()
+    if pendiente is None:
+        return True, None, 0.0
+    if isinstance(pendiente, str):
+        pendiente = datetime.fromisoformat(pendiente)
+    retraso = max((datetime.utcnow() - pendiente).total_seconds(), 0.0)
+    if retraso > maximo:
+        return False, f'réplica atrasada {retraso:.1f} s', retraso
+    return True, None, retraso
+
+
+def replica_usable(db):
+    """
+    Indica si la réplica se puede usar ahora (resultado guardado INTERVALO_REVISION segundos).
+    """
+    ahora = time.monotonic()
+    with _estado_lock:
+        if ahora - _estado['revisado'] < INTERVALO_REVISION:
+            return _estado['usable']
+        # Se marca como revisado antes de consultar para que otros hilos no repitan la revisión
+        _estado['revisado'] = ahora
+    usable, motivo, retraso = _revisar(db)
+    with _estado_lock:
+        _estado.update(usable=usable, motivo=motivo, retraso=retraso)
+    if not usable:
+        current_app.logger.warning('Lecturas en el principal: %s', motivo)
+    return usable
+
+
+def estado_replica():
+    """
+    Último resultado del control de la réplica (para diagnóstico).
+    """
+    with _estado_lock:
+        return {k: _estado[k] for k in ('usable', 'motivo', 'retraso')}
+
+
+def init_replica(app):
+    """
+    Agrega el bind de la réplica según la configuración (antes de db.init_app).
+    """
+    url = app.config.get('DATABASE_REPLICA_URL')
+    if url:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[BIND_REPLICA] = url
+        app.config['SQLALCHEMY_BINDS'] = binds
@@ -0,0 +1,215 @@
+"""
+Este archivo arma los reportes de producción a pedido (por ejemplo "modelos por shade y máquina por mes en el Q2").
+
+Paso a paso:
+1. El reporte se pide con dimensiones de agrupación (dia, semana, mes, maquina, material, shade, marca),
+   un rango de fechas y filtros opcionales (listas de máquinas, materiales, shades o marcas).
+2. Todo se traduce a una sola consulta SQL de agregación sobre las órdenes (GROUP BY de las claves enteras
+   de máquina y catálogos), con un límite de filas para que ningún pedido traiga la tabla entera.
+3. Opcionalmente una dimensión se pivotea a columnas en el servidor (pivote=maquina, por ejemplo).
+4. Los resultados se guardan en una caché LRU de tamaño fijo y con vencimiento. La clave incluye el pedido
+   y la posición del registro de eventos (bitacora.py), que avanza con cada cambio: un dato nuevo nunca
+   devuelve un reporte viejo.
+
+Así las preguntas de gestión se responden con una consulta en lugar de exportar todo a Excel.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import func, false
+from sqlalchemy.orm import aliased
+from extensions import db
+from models import Orden, Maquina, Material, Marca, Shade
+from catalogos import clave_catalogo
+from bitacora import ultima_posicion
+from sedes import sede_actual
+
+DIMENSIONES_FECHA = ('dia', 'semana', 'mes')
+DIMENSIONES = DIMENSIONES_FECHA + ('maquina', 'material', 'shade', 'marca')
+MEDIDAS = ('modelos', 'ordenes')
+LIMITE_FILAS = 5000       # Máximo de filas agregadas por reporte
+CACHE_ENTRADAS = 256      # Reportes guardados en la caché
+CACHE_SEGUNDOS = 300      # Vencimiento de cada reporte guardado
+
+# Catálogo y columna de la orden de cada dimensión que no es una fecha
+_CATALOGOS = {
+    'maquina': (Maquina, Orden.maquina_id),
+    'material': (Material, Orden.material_id),
+    'shade': (Shade, Orden.shade_id),
+    'marca': (Marca, Orden.marca_id),
+}
+
+
+class CacheLRU:
+    """
+    Caché con cantidad máxima de entradas (se descarta la menos usada) y vencimiento por entrada.
+    """
+
+    def __init__(self, maximo, segundos):
+        self.maximo = maximo
+        self.segundos = segundos
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            guardado = self._datos.get(clave)
+            if guardado is None:
+                return None
+            if guardado[0] < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return guardado[1]
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.segundos, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+_cache = CacheLRU(CACHE_ENTRADAS, CACHE_SEGUNDOS)
+
+
+def _fecha_agrupada(dimension):
+    """
+    Expresión SQL con el día, el lunes de la semana o el mes de la orden, como texto.
+    """
+    columna = Orden.fecha_creacion
+    if db.session.get_bind().dialect.name == 'postgresql':
+        if dimension == 'dia':
+            return func.to_char(columna, 'YYYY-MM-DD')
+        if dimension == 'semana':
+            return func.to_char(func.date_trunc('week', columna), 'YYYY-MM-DD')
+        return func.to_char(columna, 'YYYY-MM')
+    if dimension == 'dia':
+        return func.date(columna)
+    if dimension == 'semana':
+        # 'weekday 0' lleva al domingo siguiente (o el mismo día); 6 días antes es el lunes de esa semana
+        return func.date(columna, 'weekday 0', '-6 days')
+    return func.strftime('%Y-%m', columna)
+
+
+def _ids_filtro(dimension, nombres):
+    modelo = _CATALOGOS[dimension][0]
+    consulta = db.session.query(modelo.id).filter(modelo.sede_id == sede_actual())
+    if dimension == 'maquina':
+        consulta = consulta.filter(modelo.nombre.in_(nombres))
+    else:
+        consulta = consulta.filter(modelo.clave.in_([clave_catalogo(n) for n in nombres]))
+    return [i for (i,) in consulta.all()]
+
+
+def validar(dimensiones, pivote=None, medida='modelos'):
+    """
+    Revisa el pedido y lanza ValueError con un mensaje para el usuario si algo no es válido.
+    """
+    if not dimensiones:
+        raise ValueError('Hay que indicar al menos una dimensión de agrupación')
+    desconocidas = [d for d in dimensiones if d not in DIMENSIONES]
+    if desconocidas:
+        raise ValueError(f"Dimensiones desconocidas: {', '.join(desconocidas)} (válidas: {', '.join(DIMENSIONES)})")
+    if len([d for d in dimensiones if d in DIMENSIONES_FECHA]) > 1:
+        raise ValueError('Solo se puede agrupar por una dimensión de fecha (dia, semana o mes)')
+    if pivote and pivote not in dimensiones:
+        raise ValueError('La dimensión del pivote tiene que estar entre las dimensiones de agrupación')
+    if pivote and len(dimensiones) < 2:
+        raise ValueError('Para pivotear hacen falta al menos dos dimensiones')
+    if medida not in MEDIDAS:
+        raise ValueError(f"Medida desconocida: {medida} (válidas: {', '.join(MEDIDAS)})")
+
+
+def _consultar(dimensiones, desde, hasta, filtros, limite):
+    columnas = []
+    agrupacion = []
+    uniones = []
+    for dimension in dimensiones:
+        if dimension in DIMENSIONES_FECHA:
+            expresion = _fecha_agrupada(dimension)
+            columnas.append(expresion.label(dimension))
+            agrupacion.append(expresion)
+        else:
+            modelo, columna_id = _CATALOGOS[dimension]
+            alias = aliased(modelo, name=f'd_{dimension}')
+            uniones.append((alias, alias.id == columna_id))
+            columnas.append(alias.nombre.label(dimension))
+            # Se agrupa por la clave entera; el nombre va en el GROUP BY solo porque se selecciona
+            agrupacion.extend([columna_id, alias.nombre])
+    consulta = db.session.query(
+        *columnas,
+        func.coalesce(func.sum(Orden.cantidad_modelos), 0).label('modelos'),
+        func.count(Orden.id).label('ordenes'),
+    ).select_from(Orden)
+    for alias, condicion in uniones:
+        consulta = consulta.outerjoin(alias, condicion)
+    consulta = consulta.filter(Orden.fecha_creacion >= desde, Orden.fecha_creacion < hasta)
+    for dimension, nombres in filtros.items():
+        ids = _ids_filtro(dimension, nombres)
+        consulta = consulta.filter(_CATALOGOS[dimension][1].in_(ids) if ids else false())
+    filas = (
+        consulta.group_by(*agrupacion)
+        .order_by(*agrupacion)
+        .limit(limite + 1)
+        .all()
+    )
+    truncado = len(filas) > limite
+    return [
+        {**{d: getattr(f, d) for d in dimensiones}, 'modelos': int(f.modelos or 0), 'ordenes': int(f.ordenes or 0)}
+        for f in filas[:limite]
+    ], truncado
+
+
+def _pivotear(filas, dimensiones, pivote, medida):
+    """
+    Pasa los valores de la dimensión 'pivote' a columnas; cada fila queda con un valor por columna y el total.
+    """
+    resto = [d for d in dimensiones if d != pivote]
+    columnas = sorted({f[pivote] for f in filas}, key=lambda v: (v is None, str(v)))
+    agrupadas = OrderedDict()
+    for fila in filas:
+        clave = tuple(fila[d] for d in resto)
+        destino = agrupadas.setdefault(clave, {**{d: fila[d] for d in resto}, 'valores': {}, 'total': 0})
+        nombre = fila[pivote] if fila[pivote] is not None else ''
+        destino['valores'][nombre] = destino['valores'].get(nombre, 0) + fila[medida]
+        destino['total'] += fila[medida]
+    return ['' if c is None else c for c in columnas], list(agrupadas.values())
+
+
+def generar_reporte(dimensiones, desde, hasta, filtros=None, pivote=None, medida='modelos', limite=LIMITE_FILAS):
+    """
+    Reporte agregado de órdenes entre desde (incluido) y hasta (excluido), guardado en caché.
+    filtros: {'maquina': [...], 'material': [...], 'shade': [...], 'marca': [...]} con nombres.
+    """
+    validar(dimensiones, pivote, medida)
+    filtros = {d: sorted(set(v)) for d, v in (filtros or {}).items() if v and d in _CATALOGOS}
+    limite = max(1, min(limite, LIMITE_FILAS))
+    version = ultima_posicion()
+    clave = (
+        sede_actual(), tuple(dimensiones), desde, hasta, tuple(sorted((d, tuple(v)) for d, v in filtros.items())),
+        pivote, medida, limite, version,
+    )
+    guardado = _cache.obtener(clave)
+    if guardado is not None:
+        return {**guardado, 'en_cache': True}
+    filas, truncado = _consultar(dimensiones, desde, hasta, filtros, limite)
+    resultado = {
+        'dimensiones': list(dimensiones),
+        'filtros': filtros,
+        'medida': medida,
+        'truncado': truncado,
+        'limite': limite,
+        'version': version,
+    }
+    if pivote:
+        columnas, filas = _pivotear(filas, dimensiones, pivote, medida)
+        resultado.update(pivote=pivote, columnas=columnas)
+    resultado['filas'] = filas
+    _cache.guardar(clave, resultado)
+    return {**resultado, 'en_cache': False}
@@ -0,0 +1,426 @@
+"""
+Este archivo hace los respaldos de la base de datos sin detener la carga de órdenes.
+
+Paso a paso:
+1. SQLite: se copia el archivo con la API de respaldo en línea de SQLite (backup), de a RESPALDOS_PAGINAS_POR_PASO
+   páginas con una pausa de RESPALDOS_PAUSA segundos entre pasos. Copiar el archivo tal cual mientras los workers
+   escriben puede dejar una copia corrupta; la API copia página por página y suelta el bloqueo entre pasos.
+   - Con journal_mode=WAL se mantiene abierta una transacción de lectura: la copia es una foto fija de la base
+     y los workers siguen escribiendo mientras tanto.
+   - Sin WAL, si alguien escribe entre dos pasos SQLite reinicia la copia. Después de RESPALDOS_REINICIOS
+     reinicios se copia todo en un solo paso (las escrituras esperan solo lo que dura esa copia).
+   La copia se revisa con PRAGMA quick_check antes de guardarla.
+2. Postgres: se ejecuta pg_dump (formato custom, ya comprimido). pg_dump lee una foto consistente y no bloquea
+   las escrituras. La contraseña va por variable de entorno, no en la línea de comandos.
+3. Los respaldos de SQLite se comprimen con gzip y pueden ser:
+   - completos: el archivo entero, más la huella (hash) de cada página,
+   - diferenciales: solo las páginas que cambiaron desde el último completo (comparando las huellas).
+   Se hace un completo cada RESPALDOS_DIFERENCIALES diferenciales, o antes si cambió más de la mitad de las páginas.
+   Postgres no permite respaldos incrementales con pg_dump: ahí todos son completos.
+4. Se conservan los últimos RESPALDOS_CONSERVAR completos con sus diferenciales; los anteriores se borran.
+5. Un hilo revisa cada tanto si toca respaldar (RESPALDOS_HORAS, 0 lo desactiva); la ejecución se reserva
+   en TareaProgramada para que corra en un solo worker.
+6. También se puede ejecutar a mano: flask respaldar [--completo] [--listar], y reconstruir una base desde
+   un respaldo con flask restaurar-respaldo ARCHIVO DESTINO (nunca se escribe sobre la base en uso).
+
+Así siempre hay una copia reciente de todo el historial del laboratorio en RESPALDOS_DIR.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from extensions import db
+from models import TareaProgramada
+from mantenimiento_bd import reservar_tarea
+
+TAREA = 'respaldos'
+INTERVALO_REVISION = 600    # Segundos entre revisiones del hilo
+PREFIJO = 'respaldo-'
+COMPLETO_SQLITE = '-completo.db.gz'
+HUELLAS = '-completo.paginas'
+DIFERENCIAL = '-diferencial.gz'
+COMPLETO_POSTGRES = '-completo.dump'
+BYTES_HUELLA = 16           # blake2b de 16 bytes por página
+PROPORCION_COMPLETO = 0.5   # Si cambia más de esta fracción de páginas, el diferencial no ahorra: se hace un completo
+BLOQUE_COPIA = 1024 * 1024  # Bytes por lectura al comprimir o restaurar
+
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+class ErrorRespaldo(Exception):
+    pass
+
+
+class _Reinicio(Exception):
+    pass
+
+
+def _directorio():
+    directorio = current_app.config.get('RESPALDOS_DIR')
+    if not directorio:
+        raise ErrorRespaldo('RESPALDOS_DIR no está configurado.')
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def _nombre_nuevo():
+    return PREFIJO + datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')
+
+
+def listar_respaldos(directorio=None):
+    """
+    Respaldos del directorio en orden cronológico: [{'archivo', 'tipo', 'bytes', 'base'}].
+    Cada diferencial depende del último completo anterior (su 'base').
+    """
+    directorio = directorio or _directorio()
+    respaldos = []
+    base = None
+    for nombre in sorted(os.listdir(directorio)):
+        if not nombre.startswith(PREFIJO):
+            continue
+        if nombre.endswith(COMPLETO_SQLITE) or nombre.endswith(COMPLETO_POSTGRES):
+            tipo = 'completo'
+            base = nombre
+        elif nombre.endswith(DIFERENCIAL):
+            tipo = 'diferencial'
+        else:
+            continue
+        respaldos.append({
+            'archivo': nombre,
+            'tipo': tipo,
+            'bytes': os.path.getsize(os.path.join(directorio, nombre)),
+            'base': base if tipo == 'diferencial' else None,
+        })
+    return respaldos
+
+
+def _rotar(directorio, conservar):
+    """
+    Borra los completos más viejos que los últimos 'conservar', con sus huellas y diferenciales.
+    """
+    respaldos = listar_respaldos(directorio)
+    completos = [r['archivo'] for r in respaldos if r['tipo'] == 'completo']
+    if len(completos) <= conservar:
+        return []
+    vigentes = set(completos[-conservar:]) if conservar > 0 else set()
+    borrados = []
+    for respaldo in respaldos:
+        base = respaldo['base'] or respaldo['archivo']
+        if base in vigentes:
+            continue
+        rutas = [respaldo['archivo']]
+        if respaldo['archivo'].endswith(COMPLETO_SQLITE):
+            rutas.append(respaldo['archivo'][:-len(COMPLETO_SQLITE)] + HUELLAS)
+        for nombre in rutas:
+            try:
+                os.remove(os.path.join(directorio, nombre))
+            except FileNotFoundError:
+                pass
+        borrados.append(respaldo['archivo'])
+    return borrados
+
+
+def _copiar_sqlite(origen, destino, paginas_por_paso, pausa, reinicios_maximos):
+    """
+    Copia la base con la API de respaldo de SQLite. Devuelve (páginas, reinicios).
+    """
+    fuente = sqlite3.connect(origen, timeout=30, isolation_level=None)
+    try:
+        wal = fuente.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+        if wal:
+            # La transacción de lectura fija la foto: la copia no se reinicia y los escritores no esperan
+            fuente.execute('BEGIN')
+            fuente.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        reinicios = [0]
+        copiadas = [0]
+
+        def progreso(estado, restantes, total):
+            hechas = total - restantes
+            if estado == sqlite3.SQLITE_OK and hechas <= copiadas[0]:
+                # Otra conexión escribió entre dos pasos y SQLite empezó de nuevo (un paso sin avance)
+                reinicios[0] += 1
+                if reinicios[0] > reinicios_maximos:
+                    raise _Reinicio()
+            copiadas[0] = hechas
+            if pausa and restantes:
+                time.sleep(pausa)
+
+        copia = sqlite3.connect(destino)
+        try:
+            try:
+                fuente.backup(copia, pages=max(1, paginas_por_paso), progress=progreso)
+            except _Reinicio:
+                fuente.backup(copia)  # Un solo paso: termina aunque la base siga recibiendo escrituras
+            paginas = copia.execute('PRAGMA page_count').fetchone()[0]
+            revision = copia.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            copia.close()
+        if revision != 'ok':
+            raise ErrorRespaldo(f'La copia de la base no pasó quick_check: {revision}')
+        return paginas, reinicios[0]
+    finally:
+        if fuente.in_transaction:
+            fuente.execute('ROLLBACK')
+        fuente.close()
+
+
+def _huellas_base(directorio, base):
+    ruta = os.path.join(directorio, base[:-len(COMPLETO_SQLITE)] + HUELLAS)
+    if not os.path.exists(ruta):
+        return None, None
+    with open(ruta, 'rb') as archivo:
+        tamano_pagina = struct.unpack('>I', archivo.read(4))[0]
+        datos = archivo.read()
+    return tamano_pagina, [datos[i:i + BYTES_HUELLA] for i in range(0, len(datos), BYTES_HUELLA)]
+
+
+def _reemplazar(temporal, ruta):
+    os.replace(temporal, ruta)
+    return os.path.getsize(ruta)
+
+
+def _guardar_completo(directorio, nombre, copia, tamano_pagina, nivel):
+    """
+    Comprime la copia y guarda la huella de cada página (para los diferenciales siguientes).
+    """
+    ruta = os.path.join(directorio, nombre + COMPLETO_SQLITE)
+    ruta_huellas = os.path.join(directorio, nombre + HUELLAS)
+    huellas = [struct.pack('>I', tamano_pagina)]
+    with open(copia, 'rb') as entrada, gzip.open(ruta + '.tmp', 'wb', compresslevel=nivel) as salida:
+        for pagina in iter(lambda: entrada.read(tamano_pagina), b''):
+            huellas.append(hashlib.blake2b(pagina, digest_size=BYTES_HUELLA).digest())
+            salida.write(pagina)
+    with open(ruta_huellas + '.tmp', 'wb') as archivo:
+        archivo.write(b''.join(huellas))
+    # Primero las huellas: un completo nunca queda a la vista sin ellas
+    _reemplazar(ruta_huellas + '.tmp', ruta_huellas)
+    return nombre + COMPLETO_SQLITE, _reemplazar(ruta + '.tmp', ruta)
+
+
+def _guardar_diferencial(directorio, nombre, copia, base, tamano_pagina, huellas, nivel):
+    """
+    Guarda solo las páginas distintas de las del completo 'base'. Devuelve (archivo, bytes, páginas cambiadas),
+    o None si cambiaron tantas páginas que conviene un completo.
+    """
+    ruta = os.path.join(directorio, nombre + DIFERENCIAL)
+    paginas = os.path.getsize(copia) // tamano_pagina
+    limite = PROPORCION_COMPLETO * paginas
+    cabecera = {'base': base, 'tamano_pagina': tamano_pagina, 'paginas': paginas}
+    cambiadas = 0
+    with open(copia, 'rb') as entrada, gzip.open(ruta + '.tmp', 'wb', compresslevel=nivel) as salida:
+        salida.write(json.dumps(cabecera).encode('utf-8') + b'\n')
+        for numero, pagina in enumerate(iter(lambda: entrada.read(tamano_pagina), b'')):
+            if numero < len(huellas) and hashlib.blake2b(pagina, digest_size=BYTES_HUELLA).digest() == huellas[numero]:
+                continue
+            cambiadas += 1
+            if cambiadas > limite:
+                break
+            salida.write(struct.pack('>I', numero) + pagina)
+    if cambiadas > limite:
+        os.remove(ruta + '.tmp')
+        return None
+    return nombre + DIFERENCIAL, _reemplazar(ruta + '.tmp', ruta), cambiadas
+
+
+def _respaldar_sqlite(directorio, completo):
+    config = current_app.config
+    origen = db.engine.url.database
+    if not origen or origen == ':memory:':
+        raise ErrorRespaldo('La base SQLite está en memoria: no hay archivo que respaldar.')
+    nombre = _nombre_nuevo()
+    copia = os.path.join(directorio, nombre + '.copia.tmp')
+    nivel = config.get('RESPALDOS_NIVEL') or 6
+    try:
+        paginas, reinicios = _copiar_sqlite(
+            origen, copia,
+            config.get('RESPALDOS_PAGINAS_POR_PASO') or 256,
+            config.get('RESPALDOS_PAUSA') or 0,
+            config.get('RESPALDOS_REINICIOS') or 0,
+        )
+        with sqlite3.connect(copia) as conn:
+            tamano_pagina = conn.execute('PRAGMA page_size').fetchone()[0]
+        resultado = {'paginas': paginas, 'reinicios': reinicios, 'bytes_base_datos': paginas * tamano_pagina}
+        respaldos = listar_respaldos(directorio)
+        base = next((r['archivo'] for r in reversed(respaldos) if r['tipo'] == 'completo'), None)
+        if base and not base.endswith(COMPLETO_SQLITE):
+            base = None  # El último completo es de Postgres (se cambió de motor)
+        diferenciales = sum(1 for r in respaldos if r['base'] == base) if base else 0
+        if base and not completo and diferenciales < (config.get('RESPALDOS_DIFERENCIALES') or 0):
+            tamano_base, huellas = _huellas_base(directorio, base)
+            if tamano_base == tamano_pagina:
+                guardado = _guardar_diferencial(directorio, nombre, copia, base, tamano_pagina, huellas, nivel)
+                if guardado:
+                    archivo, tamano, cambiadas = guardado
+                    resultado.update(tipo='diferencial', archivo=archivo, bytes=tamano, base=base,
+                                     paginas_cambiadas=cambiadas)
+                    return resultado
+        archivo, tamano = _guardar_completo(directorio, nombre, copia, tamano_pagina, nivel)
+        resultado.update(tipo='completo', archivo=archivo, bytes=tamano)
+        return resultado
+    finally:
+        for ruta in (copia, copia + '-journal'):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+
+def _respaldar_postgres(directorio):
+    url = db.engine.url
+    ruta = os.path.join(directorio, _nombre_nuevo() + COMPLETO_POSTGRES)
+    entorno = dict(os.environ)
+    for variable, valor in (('PGHOST', url.host), ('PGPORT', url.port), ('PGUSER', url.username),
+                            ('PGPASSWORD', url.password), ('PGDATABASE', url.database)):
+        if valor is not None:
+            entorno[variable] = str(valor)
+    comando = [
+        current_app.config.get('RESPALDOS_PG_DUMP') or 'pg_dump',
+        '--format=custom', f'--compress={current_app.config.get("RESPALDOS_NIVEL") or 6}',
+        '--no-password', f'--file={ruta}.tmp',
+    ]
+    try:
+        proceso = subprocess.run(comando, env=entorno, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise ErrorRespaldo(f'No se encontró {comando[0]}; instala el cliente de Postgres o ajusta RESPALDOS_PG_DUMP.')
+    if proceso.returncode != 0:
+        if os.path.exists(ruta + '.tmp'):
+            os.remove(ruta + '.tmp')
+        raise ErrorRespaldo(f'pg_dump terminó con error {proceso.returncode}: {proceso.stderr.strip()[-500:]}')
+    return {'tipo': 'completo', 'archivo': os.path.basename(ruta), 'bytes': _reemplazar(ruta + '.tmp', ruta)}
+
+
+def respaldar(completo=False):
+    """
+    Hace un respaldo (diferencial si se puede, salvo completo=True) y rota los viejos. Devuelve el resumen.
+    """
+    inicio = time.perf_counter()
+    directorio = _directorio()
+    db.session.close()  # La copia usa su propia conexión: que la sesión no deje una transacción abierta
+    motor = db.engine.dialect.name
+    if motor == 'sqlite':
+        resultado = _respaldar_sqlite(directorio, completo)
+    elif motor == 'postgresql':
+        resultado = _respaldar_postgres(directorio)
+    else:
+        raise ErrorRespaldo(f'No hay respaldo para el motor {motor}.')
+    resultado['borrados'] = _rotar(directorio, current_app.config.get('RESPALDOS_CONSERVAR') or 1)
+    resultado.update(motor=motor, segundos=round(time.perf_counter() - inicio, 3))
+    return resultado
+
+
+def restaurar(archivo, destino):
+    """
+    Reconstruye en 'destino' (un archivo nuevo) la base SQLite de un respaldo completo o diferencial.
+    """
+    if os.path.exists(destino):
+        raise ErrorRespaldo(f'{destino} ya existe: la restauración no escribe sobre archivos existentes.')
+    if archivo.endswith(COMPLETO_POSTGRES):
+        raise ErrorRespaldo(f'Los respaldos de Postgres se restauran con pg_restore: pg_restore -d <base> {archivo}')
+    directorio = os.path.dirname(os.path.abspath(archivo))
+    cabecera = None
+    base = archivo
+    if archivo.endswith(DIFERENCIAL):
+        with gzip.open(archivo, 'rb') as diferencial:
+            cabecera = json.loads(diferencial.readline())
+        base = os.path.join(directorio, cabecera['base'])
+        if not os.path.exists(base):
+            raise ErrorRespaldo(f'Falta el respaldo completo {cabecera["base"]} del que depende este diferencial.')
+    elif not archivo.endswith(COMPLETO_SQLITE):
+        raise ErrorRespaldo(f'{archivo} no es un respaldo reconocido.')
+    temporal = destino + '.tmp'
+    try:
+        with gzip.open(base, 'rb') as entrada, open(temporal, 'wb') as salida:
+            shutil.copyfileobj(entrada, salida, BLOQUE_COPIA)
+        if cabecera:
+            tamano_pagina = cabecera['tamano_pagina']
+            with gzip.open(archivo, 'rb') as diferencial, open(temporal, 'r+b') as salida:
+                diferencial.readline()
+                salida.truncate(cabecera['paginas'] * tamano_pagina)
+                while True:
+                    numero = diferencial.read(4)
+                    if not numero:
+                        break
+                    salida.seek(struct.unpack('>I', numero)[0] * tamano_pagina)
+                    salida.write(diferencial.read(tamano_pagina))
+        with sqlite3.connect(temporal) as conn:
+            revision = conn.execute('PRAGMA quick_check').fetchone()[0]
+        if revision != 'ok':
+            raise ErrorRespaldo(f'La base restaurada no pasó quick_check: {revision}')
+        os.replace(temporal, destino)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return {'archivo': destino, 'base': os.path.basename(base), 'bytes': os.path.getsize(destino)}
+
+
+def ejecutar_respaldo(completo=False, forzar=False):
+    """
+    Ejecuta respaldar() si pasó el intervalo configurado (o si forzar=True) y guarda el resultado.
+    Devuelve el resumen, o None si no tocaba.
+    """
+    intervalo = timedelta(hours=current_app.config.get('RESPALDOS_HORAS') or 24)
+    if not reservar_tarea(TAREA, timedelta(0) if forzar else intervalo):
+        return None
+    resultado = respaldar(completo)
+    tarea = TareaProgramada.query.filter_by(nombre=TAREA).first()
+    tarea.duracion = resultado['segundos']
+    tarea.resultado = json.dumps(resultado)
+    db.session.commit()
+    current_app.logger.info('Respaldo %s de la base de datos: %s (%s bytes)',
+                            resultado['tipo'], resultado['archivo'], resultado['bytes'])
+    return resultado
+
+
+def _ciclo(app):
+    while True:
+        time.sleep(INTERVALO_REVISION)
+        with app.app_context():
+            try:
+                ejecutar_respaldo()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Falló el respaldo programado de la base de datos')
+            finally:
+                db.session.remove()
+
+
+def init_respaldos(app):
+    """
+    Registra los comandos 'flask respaldar' y 'flask restaurar-respaldo' y arranca el hilo de los respaldos programados.
+    """
+    @app.cli.command('respaldar')
+    @click.option('--completo', is_flag=True, help='Respaldo completo aunque toque un diferencial.')
+    @click.option('--listar', is_flag=True, help='Solo mostrar los respaldos guardados.')
+    def comando_respaldar(completo, listar):
+        try:
+            resultado = listar_respaldos() if listar else ejecutar_respaldo(completo, forzar=True)
+        except ErrorRespaldo as e:
+            raise click.ClickException(str(e))
+        click.echo(json.dumps(resultado, indent=2, ensure_ascii=False, default=str))
+
+    @app.cli.command('restaurar-respaldo')
+    @click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+    @click.argument('destino', type=click.Path(dir_okay=False))
+    def comando_restaurar(archivo, destino):
+        try:
+            resultado = restaurar(archivo, destino)
+        except ErrorRespaldo as e:
+            raise click.ClickException(str(e))
+        click.echo(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+    global _hilo
+    if not app.config.get('RESPALDOS_HORAS'):
+        return
+    with _hilo_lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_ciclo, args=(app,), name='respaldos', daemon=True)
+            _hilo.start()
@@ -0,0 +1,215 @@
+"""
+Este archivo retira los bloques usados que ya no se pueden fresar: pasan de la tabla Bloque a BloqueHistorial.
+
+Paso a paso:
+1. Un bloque usado se retira si cumple alguna de las reglas configuradas:
+   - agotado: fresó un número fijo de modelos (RETIRO_BLOQUES_MODELOS) o, con RETIRO_BLOQUES_MODELOS=capacidad,
+     tantos como su capacidad según el grosor. Esa regla solo usa la 'capacidad_grosores' que el laboratorio
+     cargó en Configuración; los valores de ejemplo del planificador (asignacion.py) no retiran bloques,
+   - viejo: se abrió hace más de RETIRO_BLOQUES_DIAS días,
+   - inactivo: no se usó ni modificó en RETIRO_BLOQUES_INACTIVO_DIAS días.
+   Las reglas con valor 0 no se aplican (ninguna está activa por defecto). Los bloques nuevos (stock cerrado)
+   nunca se retiran.
+2. Un hilo revisa cada tanto si toca una pasada (RETIRO_BLOQUES_HORAS, por defecto 0: desactivado). La pasada se reserva
+   en TareaProgramada (igual que el mantenimiento de la base), así con varios workers corre en uno solo.
+3. La pasada recorre cada sede (su configuración de capacidades es propia) y mueve los bloques en lotes
+   de LOTE_RETIRO con un guardado por lote: las transacciones son cortas y no frenan el fresado.
+   Se usa la sesión del ORM, así quedan el registro de eventos y las marcas de borrado de la sincronización.
+4. vigentes() aplica las mismas reglas a una consulta: los desplegables y el planificador muestran solo
+   bloques que todavía se pueden fresar aunque la próxima pasada no haya corrido.
+5. También se puede ejecutar a mano: flask retirar-bloques [--simular].
+
+Así la tabla de bloques y los desplegables no crecen sin límite con bloques físicamente terminados.
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import and_, or_, not_, case, func, literal
+from extensions import db
+from models import Bloque, BloqueHistorial, Sede, TareaProgramada
+from asignacion import capacidades_por_grosor
+from mantenimiento_bd import reservar_tarea
+from sedes import en_sede
+
+TAREA = 'retiro_bloques'
+LOTE_RETIRO = 200           # Bloques movidos por guardado
+INTERVALO_REVISION = 600    # Segundos entre revisiones del hilo
+
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+def _reglas():
+    """
+    Reglas activas según la configuración: {'modelos': 'capacidad' | int, 'dias': int, 'inactivo_dias': int}.
+    """
+    config = current_app.config
+    return {
+        'modelos': config.get('RETIRO_BLOQUES_MODELOS') or 0,
+        'dias': config.get('RETIRO_BLOQUES_DIAS') or 0,
+        'inactivo_dias': config.get('RETIRO_BLOQUES_INACTIVO_DIAS') or 0,
+    }
+
+
+def _condiciones(ahora=None):
+    """
+    Condición SQL de cada regla activa, {motivo: condición}. Ninguna da NULL, así se pueden negar sin sorpresas.
+    """
+    ahora = ahora or datetime.utcnow()
+    reglas = _reglas()
+    condiciones = {}
+    modelos = func.coalesce(Bloque.modelos_fresados, 0)
+    if reglas['modelos'] == 'capacidad':
+        capacidades = capacidades_por_grosor(solo_configuradas=True)
+        if capacidades:
+            condiciones['agotado'] = and_(
+                Bloque.grosor.isnot(None),
+                Bloque.grosor.in_(list(capacidades)),
+                modelos >= case(capacidades, value=Bloque.grosor),
+            )
+    elif reglas['modelos']:
+        condiciones['agotado'] = modelos >= int(reglas['modelos'])
+    if reglas['dias']:
+        condiciones['viejo'] = and_(
+            Bloque.fecha_creacion.isnot(None),
+            Bloque.fecha_creacion < ahora - timedelta(days=reglas['dias']),
+        )
+    if reglas['inactivo_dias']:
+        ultima_actividad = func.coalesce(Bloque.fecha_actualizacion, Bloque.fecha_creacion, literal(ahora))
+        condiciones['inactivo'] = ultima_actividad < ahora - timedelta(days=reglas['inactivo_dias'])
+    return condiciones
+
+
+def vigentes(consulta):
+    """
+    Quita de una consulta de bloques usados los que cumplen alguna regla de retiro.
+    """
+    condiciones = _condiciones()
+    if not condiciones:
+        return consulta
+    return consulta.filter(not_(or_(*condiciones.values())))
+
+
+def archivar_bloque(bloque, motivo='manual', fecha=None):
+    """
+    Copia el bloque a BloqueHistorial y lo borra (sin confirmar: lo hace quien llama).
+    """
+    db.session.add(BloqueHistorial(
+        sede_id=bloque.sede_id,
+        bloque_id=bloque.id,
+        material=bloque.material,
+        marca=bloque.marca,
+        shade=bloque.shade,
+        material_id=bloque.material_id,
+        marca_id=bloque.marca_id,
+        shade_id=bloque.shade_id,
+        grosor=bloque.grosor,
+        cantidad=bloque.cantidad,
+        codigo_barra=bloque.codigo_barra,
+        estado=bloque.estado,
+        modelos_fresados=bloque.modelos_fresados,
+        codigos_orden_fresados=bloque.codigos_orden_fresados,
+        fecha_creacion=bloque.fecha_creacion,
+        fecha_eliminacion=fecha or datetime.utcnow(),
+        motivo_retiro=motivo,
+    ))
+    db.session.delete(bloque)
+
+
+def _retirar_sede(simular, lote):
+    ahora = datetime.utcnow()
+    condiciones = _condiciones(ahora)
+    retirados = Counter()
+    if not condiciones:
+        return retirados
+    # El motivo se calcula en la misma consulta (la primera regla que se cumple)
+    motivo = case(*[(c, literal(m)) for m, c in condiciones.items()], else_=literal('')).label('motivo')
+    filtro = and_(Bloque.estado == 'usado', or_(*condiciones.values()))
+    if simular:
+        retirados.update(dict(db.session.query(motivo, func.count(Bloque.id)).filter(filtro).group_by(motivo).all()))
+        return retirados
+    consulta = db.session.query(Bloque, motivo).filter(filtro).order_by(Bloque.id)
+    ultimo_id = 0
+    while True:
+        filas = consulta.filter(Bloque.id > ultimo_id).limit(lote).all()
+        if not filas:
+            break
+        for bloque, m in filas:
+            archivar_bloque(bloque, m, ahora)
+            retirados[m] += 1
+        ultimo_id = filas[-1][0].id
+        db.session.commit()
+        if len(filas) < lote:
+            break
+    return retirados
+
+
+def retirar_bloques(simular=False, lote=LOTE_RETIRO):
+    """
+    Pasada de retiro en todas las sedes. Devuelve {'retirados': total, 'por_motivo': {...}, 'segundos': ...}.
+    """
+    inicio = time.perf_counter()
+    total = Counter()
+    for (sede_id,) in db.session.query(Sede.id).order_by(Sede.id).all():
+        with en_sede(sede_id):
+            total.update(_retirar_sede(simular, max(1, lote)))
+    return {
+        'retirados': sum(total.values()),
+        'por_motivo': dict(total),
+        'simulado': simular,
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+
+
+def ejecutar_retiro(forzar=False):
+    """
+    Ejecuta una pasada si pasó el intervalo configurado (o si forzar=True). Devuelve el resumen o None.
+    """
+    intervalo = timedelta(hours=current_app.config.get('RETIRO_BLOQUES_HORAS') or 1)
+    if not reservar_tarea(TAREA, timedelta(0) if forzar else intervalo):
+        return None
+    resultado = retirar_bloques()
+    tarea = TareaProgramada.query.filter_by(nombre=TAREA).first()
+    tarea.duracion = resultado['segundos']
+    tarea.resultado = json.dumps(resultado)
+    db.session.commit()
+    if resultado['retirados']:
+        current_app.logger.info('Bloques usados retirados al historial: %s', resultado['por_motivo'])
+    return resultado
+
+
+def _ciclo(app):
+    while True:
+        time.sleep(INTERVALO_REVISION)
+        with app.app_context():
+            try:
+                ejecutar_retiro()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Falló el retiro programado de bloques usados')
+            finally:
+                db.session.remove()
+
+
+def init_retiro_bloques(app):
+    """
+    Registra el comando 'flask retirar-bloques' y arranca el hilo del retiro programado.
+    """
+    @app.cli.command('retirar-bloques')
+    @click.option('--simular', is_flag=True, help='Solo contar los bloques que se retirarían.')
+    def comando_retirar_bloques(simular):
+        resultado = retirar_bloques(simular=simular)
+        click.echo(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+    global _hilo
+    if not app.config.get('RETIRO_BLOQUES_HORAS'):
+        return
+    with _hilo_lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_ciclo, args=(app,), name='retiro-bloques', daemon=True)
+            _hilo.start()
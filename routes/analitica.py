@@ -0,0 +1,94 @@
+"""
+Este archivo contiene las rutas de analítica (pronósticos y estadísticas calculadas).
+
+Paso a paso:
+1. Se define un blueprint para las rutas de analítica.
+2. Se expone el pronóstico de consumo de bloques y las alertas de reposición como API JSON.
+3. Se expone la utilización de las máquinas (modelos por día, paradas, efecto de fresas y mantenimientos).
+4. Los cálculos pesados viven en módulos aparte (pronostico.py, utilizacion.py) y se guardan en caché.
+5. Se exponen los reportes de producción a pedido (agrupación, filtros y pivote; ver reportes.py).
+6. Todas las rutas son de solo lectura y leen de la réplica si está configurada (replica.py).
+
+Este archivo sirve los datos que usa el panel de inicio para mostrar pronósticos.
+"""
+
+from flask import Blueprint, request, jsonify
+from datetime import datetime, timedelta
+from pronostico import obtener_pronostico, VENTANA_DIAS, DIAS_REPOSICION, Z_SERVICIO
+from utilizacion import obtener_utilizacion, RANGO_MAXIMO_DIAS
+from reportes import generar_reporte, LIMITE_FILAS
+from replica import solo_lectura
+
+analitica_bp = Blueprint('analitica', __name__, url_prefix='/analitica')
+
+# API con el pronóstico de consumo por material/shade/grosor
+@analitica_bp.route('/api/pronostico-bloques')
+@solo_lectura
+def api_pronostico_bloques():
+    ventana = max(request.args.get('ventana', VENTANA_DIAS, type=int), 1)
+    reposicion = max(request.args.get('reposicion', DIAS_REPOSICION, type=int), 0)
+    z = request.args.get('z', Z_SERVICIO, type=float)
+    skus = obtener_pronostico(ventana, reposicion, z)
+    # Con ?alertas=1 solo se devuelven los SKUs que hay que reponer
+    if request.args.get('alertas') == '1':
+        skus = [s for s in skus if s['alerta'] != 'ok']
+    return jsonify({
+        'generado': datetime.utcnow().isoformat(),
+        'ventana_dias': ventana,
+        'dias_reposicion': reposicion,
+        'skus': skus,
+    })
+
+def _leer_fecha(nombre, defecto):
+    valor = request.args.get(nombre)
+    if not valor:
+        return defecto
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        return defecto
+
+# API de utilización por máquina: ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD&maquina=A
+@analitica_bp.route('/api/utilizacion-maquinas')
+@solo_lectura
+def api_utilizacion_maquinas():
+    hasta = _leer_fecha('hasta', datetime.utcnow().date())
+    desde = _leer_fecha('desde', hasta - timedelta(days=29))
+    if desde > hasta:
+        desde, hasta = hasta, desde
+    # Limitamos el rango para que la consulta no crezca sin control
+    desde = max(desde, hasta - timedelta(days=RANGO_MAXIMO_DIAS - 1))
+    maquina = request.args.get('maquina') or None
+    return jsonify({
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'maquinas': obtener_utilizacion(desde, hasta, maquina),
+    })
+
+def _leer_lista(nombre):
+    return [v.strip() for v in request.args.get(nombre, '').split(',') if v.strip()]
+
+# API de reportes a pedido:
+# ?dimensiones=mes,shade,maquina&desde=2025-04-01&hasta=2025-06-30&material=Zirconia&pivote=maquina&medida=modelos
+@analitica_bp.route('/api/reporte')
+@solo_lectura
+def api_reporte():
+    hasta = _leer_fecha('hasta', datetime.utcnow().date())
+    desde = _leer_fecha('desde', hasta - timedelta(days=29))
+    if desde > hasta:
+        desde, hasta = hasta, desde
+    filtros = {d: _leer_lista(d) for d in ('maquina', 'material', 'shade', 'marca')}
+    try:
+        reporte = generar_reporte(
+            _leer_lista('dimensiones'),
+            datetime.combine(desde, datetime.min.time()),
+            # 'hasta' se incluye completo: se consulta hasta el inicio del día siguiente
+            datetime.combine(hasta + timedelta(days=1), datetime.min.time()),
+            filtros=filtros,
+            pivote=request.args.get('pivote') or None,
+            medida=request.args.get('medida', 'modelos'),
+            limite=request.args.get('limite', LIMITE_FILAS, type=int),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'desde': desde.isoformat(), 'hasta': hasta.isoformat(), **reporte})
@@ -7,16 +7,21 @@ Paso a paso:
 3. Se definen constantes para los tipos de material, grosores y marcas.
 4. Se maneja la ruta principal para ver, filtrar y agregar bloques nuevos.
 5. Se permite editar y eliminar bloques, guardando historial cuando se elimina un bloque.
-6. Se actualiza la base de datos según las acciones del usuario.
+6. Se permite importar una entrega completa desde un archivo CSV/XLSX (ver importacion.py).
+7. Se imprimen las etiquetas con código de barras de varios bloques a la vez, en PDF o ZPL (ver etiquetas.py).
+8. Se actualiza la base de datos según las acciones del usuario.
 
 Este archivo organiza toda la lógica para el manejo de bloques en el sistema.
 """
 
 # Importamos los módulos necesarios y los modelos de datos
-from flask import Blueprint, render_template, request, redirect, url_for
-from models import Bloque, BloqueHistorial, Configuracion
+import io
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, send_file
+from models import Bloque, Configuracion
 from extensions import db
-from datetime import datetime
+from importacion import importar_bloques, leer_filas, ErrorImportacion
+from retiro_bloques import archivar_bloque
+from etiquetas import etiquetas_bloques, FORMATOS
 
 # Definimos el blueprint para las rutas de bloques
 bloques_bp = Blueprint('bloques', __name__, url_prefix='/bloques')
@@ -132,21 +137,51 @@ def editar_bloque(bloque_id):
 def eliminar_bloque(bloque_id):
     bloque = Bloque.query.get_or_404(bloque_id)
     # Guardamos el bloque en el historial antes de eliminarlo
-    historial = BloqueHistorial(
-        bloque_id=bloque.id,
-        material=bloque.material,
-        marca=bloque.marca,
-        shade=bloque.shade,
-        grosor=bloque.grosor,
-        cantidad=bloque.cantidad,
-        codigo_barra=bloque.codigo_barra,
-        estado=bloque.estado,
-        modelos_fresados=bloque.modelos_fresados,
-        codigos_orden_fresados=bloque.codigos_orden_fresados,
-        fecha_creacion=bloque.fecha_creacion,
-        fecha_eliminacion=datetime.utcnow()
-    )
-    db.session.add(historial)
-    db.session.delete(bloque)
+    archivar_bloque(bloque, 'manual')
     db.session.commit()
-    return redirect(url_for('bloques.bloques'))
\ No newline at end of file
+    return redirect(url_for('bloques.bloques'))
+
+# Ruta para importar una entrega de bloques desde un archivo CSV o XLSX
+@bloques_bp.route('/importar', methods=['GET', 'POST'])
+def importar():
+    reporte = None
+    error = None
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        simular = request.form.get('simular') == '1'
+        if not archivo or not archivo.filename:
+            error = 'Selecciona un archivo para importar.'
+        else:
+            try:
+                reporte = importar_bloques(leer_filas(archivo.stream, archivo.filename), simular=simular)
+            except ErrorImportacion as e:
+                db.session.rollback()
+                error = str(e)
+        # Los clientes que piden JSON (por ejemplo scripts) reciben el reporte directamente
+        if request.accept_mimetypes.best == 'application/json' or request.args.get('formato') == 'json':
+            return jsonify({'error': error, 'reporte': reporte}), (400 if error else 200)
+    return render_template('importar_bloques.html', reporte=reporte, error=error)
+
+# Ruta para imprimir las etiquetas con código de barras de varios bloques (PDF o ZPL)
+@bloques_bp.route('/etiquetas', methods=['GET', 'POST'])
+def etiquetas():
+    valores = request.values.getlist('ids')
+    formato = request.values.get('formato', 'pdf')
+    try:
+        ids = [int(v) for texto in valores for v in texto.split(',') if v.strip()]
+    except ValueError:
+        return jsonify({'error': 'Los ids de bloque deben ser números.'}), 400
+    if formato not in FORMATOS:
+        return jsonify({'error': f'Formato desconocido: {formato}'}), 400
+    contenido, cantidad, omitidos = etiquetas_bloques(ids, formato)
+    if not cantidad:
+        return jsonify({'error': 'Ningún bloque pedido tiene código de barras.', 'omitidos': omitidos}), 400
+    respuesta = send_file(
+        io.BytesIO(contenido),
+        mimetype=FORMATOS[formato],
+        # El PDF se abre en el navegador para imprimirlo; el ZPL se descarga para enviarlo a la impresora
+        as_attachment=formato == 'zpl',
+        download_name=f'etiquetas_bloques.{formato}',
+    )
+    respuesta.headers['X-Etiquetas-Omitidas'] = ','.join(str(i) for i in omitidos)
+    return respuesta
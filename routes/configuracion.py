@@ -1,25 +1,30 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from models import Configuracion
 from extensions import db
+from asignacion import CAPACIDAD_GROSORES_DEFECTO
+from maquinas import nombres_maquinas, guardar_nombres
 
 configuracion_bp = Blueprint('configuracion', __name__, url_prefix='/configuracion')
 
 @configuracion_bp.route('/', methods=['GET', 'POST'])
 def configuracion():
-    maquinas = Configuracion.get_lista('maquinas', default=['A','B','C','D'])
+    # Las máquinas viven en su propio registro (maquinas.py)
+    maquinas = nombres_maquinas('fresadora')
     materiales = Configuracion.get_lista('materiales', default=['Zirconia','Disilicato','PMMA','Cera','Wax','Composite'])
     shades = Configuracion.get_lista('shades', default=['A1','A2','A3','B1','B2','C1','C2'])
     marcas = Configuracion.get_lista('marcas', default=['Vita','Ivoclar','Aidite'])
     grosores = Configuracion.get_lista('grosores', default=['14','16','18','20','22','25'])
-    hornos = Configuracion.get_lista('hornos', default=['Horno 1','Horno 2','Horno 3'])
-    aspiradoras = Configuracion.get_lista('aspiradoras', default=['Aspiradora 1','Aspiradora 2','Aspiradora 3'])
+    hornos = nombres_maquinas('horno')
+    aspiradoras = nombres_maquinas('aspiradora')
+    # Solo lo que cargó el laboratorio: los valores de ejemplo no se guardan al enviar el formulario
+    capacidad_grosores = Configuracion.get_lista('capacidad_grosores')
     if request.method == 'POST':
         nuevas_maquinas = [m.strip() for m in request.form.get('maquinas','').split(',') if m.strip()]
-        Configuracion.set_lista('maquinas', nuevas_maquinas)
+        guardar_nombres('fresadora', nuevas_maquinas)
         nuevos_hornos = [h.strip() for h in request.form.get('hornos','').split(',') if h.strip()]
-        Configuracion.set_lista('hornos', nuevos_hornos)
+        guardar_nombres('horno', nuevos_hornos)
         nuevos_aspiradoras = [a.strip() for a in request.form.get('aspiradoras','').split(',') if a.strip()]
-        Configuracion.set_lista('aspiradoras', nuevos_aspiradoras)
+        guardar_nombres('aspiradora', nuevos_aspiradoras)
         nuevos_materiales = [m.strip() for m in request.form.get('materiales','').split(',') if m.strip()]
         Configuracion.set_lista('materiales', nuevos_materiales)
         nuevos_shades = [s.strip() for s in request.form.get('shades','').split(',') if s.strip()]
@@ -28,6 +33,11 @@ def configuracion():
         Configuracion.set_lista('marcas', nuevas_marcas)
         nuevos_grosores = [g.strip() for g in request.form.get('grosores','').split(',') if g.strip()]
         Configuracion.set_lista('grosores', nuevos_grosores)
+        nuevas_capacidades = [c.replace(' ', '') for c in request.form.get('capacidad_grosores','').split(',') if c.strip()]
+        if nuevas_capacidades:
+            Configuracion.set_lista('capacidad_grosores', nuevas_capacidades)
+        else:
+            Configuracion.quitar('capacidad_grosores')
         flash('Configuración actualizada correctamente.')
         return redirect(url_for('configuracion.configuracion'))
-    return render_template('configuracion.html', maquinas=maquinas, materiales=materiales, shades=shades, marcas=marcas, grosores=grosores, hornos=hornos, aspiradoras=aspiradoras)
+    return render_template('configuracion.html', maquinas=maquinas, materiales=materiales, shades=shades, marcas=marcas, grosores=grosores, hornos=hornos, aspiradoras=aspiradoras, capacidad_grosores=capacidad_grosores, capacidad_ejemplo=CAPACIDAD_GROSORES_DEFECTO)
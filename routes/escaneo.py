@@ -0,0 +1,24 @@
+"""
+Este archivo contiene la ruta que resuelve cualquier código escaneado.
+
+Paso a paso:
+1. Se define un blueprint con el prefijo /scan.
+2. /scan/<codigo> devuelve en JSON qué es el código (caso pendiente, orden, bloque o bloque del historial)
+   junto con sus bloques, órdenes y fresa relacionados.
+3. Con ?prefijo=1 también se devuelven los códigos que empiezan igual (útil con lecturas incompletas).
+
+La búsqueda vive en escaneo.py.
+"""
+
+from flask import Blueprint, request, jsonify
+from escaneo import resolver_codigo, LIMITE_PREFIJO
+
+escaneo_bp = Blueprint('escaneo', __name__, url_prefix='/scan')
+
+# API para resolver un código escaneado
+@escaneo_bp.route('/<path:codigo>')
+def resolver(codigo):
+    limite = min(max(request.args.get('limite', LIMITE_PREFIJO, type=int), 1), 100)
+    resultado = resolver_codigo(codigo, prefijo=request.args.get('prefijo') == '1', limite=limite)
+    hay_sugerencias = any((resultado['sugerencias'] or {}).values())
+    return jsonify(resultado), (200 if resultado['encontrado'] or hay_sugerencias else 404)
@@ -0,0 +1,75 @@
+"""
+Este archivo contiene la ruta de Server-Sent Events (SSE) que empuja los cambios a las páginas abiertas.
+
+Paso a paso:
+1. El navegador abre una conexión con EventSource a /eventos/stream.
+2. La ruta lee los eventos publicados por eventos.py (pendientes, órdenes, bloques) y los envía a medida que llegan.
+3. Si el navegador se reconecta, envía Last-Event-ID y se continúa desde ese punto sin perder eventos.
+4. Cada conexión dura un tiempo máximo y envía latidos (comentarios) para que los proxies no la corten.
+5. /eventos/api/registro devuelve el registro de eventos del dominio (tabla Evento) a partir de una posición,
+   para consumidores externos que guardan su propio checkpoint. Solo incluye los eventos de la sede del cliente.
+   La posición es el id del último evento recibido ('siguiente'); los ids no siempre crecen (ver bitacora.py).
+
+Nota: con gunicorn conviene usar workers con hilos (--threads) para que las conexiones abiertas no bloqueen peticiones.
+"""
+
+import json
+import time
+from flask import Blueprint, Response, request, jsonify
+from eventos import difusor
+from bitacora import leer_eventos, ultima_posicion, LOTE_CONSUMIDOR
+from sedes import sede_actual
+
+eventos_bp = Blueprint('eventos', __name__, url_prefix='/eventos')
+
+DURACION_MAXIMA = 300     # Segundos por conexión; después el navegador se reconecta solo
+INTERVALO_LATIDO = 15     # Segundos entre latidos
+INTERVALO_REVISION = 0.5  # Segundos entre revisiones del archivo (eventos de otros workers)
+
+@eventos_bp.route('/stream')
+def stream():
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('desde') or difusor.posicion_actual()
+    tipos = set(filter(None, request.args.get('tipos', '').split(',')))
+    sede = sede_actual()
+
+    def generar(cursor):
+        inicio = ultimo_envio = time.monotonic()
+        # retry: milisegundos que espera el navegador antes de reconectarse
+        yield 'retry: 2000\n\n'
+        while time.monotonic() - inicio < DURACION_MAXIMA:
+            eventos, cursor = difusor.leer_desde(cursor)
+            for ev in eventos:
+                if tipos and ev['tipo'] not in tipos:
+                    continue
+                if ev['datos'].get('sede_id') != sede:
+                    continue
+                datos = json.dumps({'fecha': ev['fecha'], **ev['datos']}, ensure_ascii=False)
+                yield f"id: {ev['id']}\nevent: {ev['tipo']}\ndata: {datos}\n\n"
+                ultimo_envio = time.monotonic()
+            if time.monotonic() - ultimo_envio >= INTERVALO_LATIDO:
+                yield ': latido\n\n'
+                ultimo_envio = time.monotonic()
+            difusor.esperar(INTERVALO_REVISION)
+        # Al cerrar se indica el cursor para que la reconexión siga desde aquí
+        yield f'id: {cursor}\n\n'
+
+    return Response(generar(cursor), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+# API del registro de eventos: ?desde=<id>&limite=<n>&tipos=orden.creado,bloque.eliminado
+@eventos_bp.route('/api/registro')
+def api_registro():
+    desde = max(request.args.get('desde', 0, type=int), 0)
+    limite = min(max(request.args.get('limite', LOTE_CONSUMIDOR, type=int), 1), 5000)
+    tipos = [t for t in request.args.get('tipos', '').split(',') if t]
+    eventos = leer_eventos(desde, limite, tipos)
+    return jsonify({
+        'desde': desde,
+        # Posición desde la que debe seguir el consumidor en la próxima llamada
+        'siguiente': eventos[-1]['id'] if eventos else desde,
+        'ultima_posicion': ultima_posicion(),
+        'eventos': eventos,
+    })
@@ -6,15 +6,19 @@ Paso a paso:
 2. Se define un blueprint para las rutas de fresas.
 3. Se permite agregar fresas al inventario y registrar su instalación en máquinas.
 4. Se pueden editar y eliminar fresas tanto del inventario como de las instaladas.
-5. Se actualiza la base de datos según las acciones del usuario.
+5. Al retirar una fresa instalada se guarda en el historial (sirve para estimar la vida de las fresas).
+6. Se muestra el desgaste estimado y se expone una API con las fresas que hay que reemplazar pronto.
+7. Se actualiza la base de datos según las acciones del usuario.
 
 Este archivo organiza toda la lógica para el manejo de fresas en el sistema.
 """
 
 # Importamos los módulos necesarios y los modelos de datos
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from models import FresaInventario, FresaInstalada, Configuracion
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from models import FresaInventario, FresaInstalada, FresaHistorial, Configuracion
 from extensions import db
+from maquinas import nombres_maquinas, maquina_conocida
+from desgaste import refrescar_predicciones, resumen, fresas_por_reemplazar
 from datetime import datetime
 
 # Definimos el blueprint para las rutas de fresas
@@ -26,7 +30,7 @@ def fresas():
     error = None
     # Obtener materiales y máquinas desde configuración dinámica
     tipos_material = Configuracion.get_lista('materiales', default=['Zirconia', 'Disilicato', 'PMMA', 'Cera', 'Wax', 'Composite'])
-    maquinas = Configuracion.get_lista('maquinas', default=['A', 'B', 'C', 'D'])
+    maquinas = nombres_maquinas('fresadora')
 
     # Si se envía el formulario para agregar una fresa al inventario
     if request.method == 'POST' and 'agregar_inventario' in request.form:
@@ -49,7 +53,9 @@ def fresas():
         tipo = request.form['tipo_diametro_instalar']
         maquina = request.form['maquina_instalar']
         inventario = FresaInventario.query.filter_by(tipo=tipo).filter(FresaInventario.cantidad > 0).first()
-        if inventario and inventario.cantidad > 0:
+        if maquina not in maquinas:
+            flash(f"La máquina '{maquina}' no está registrada. Agrégala en Configuración.", 'danger')
+        elif inventario and inventario.cantidad > 0:
             inventario.cantidad -= 1
             nueva_instalada = FresaInstalada(
                 tipo=tipo,
@@ -64,13 +70,17 @@ def fresas():
             error = "No hay suficiente inventario para instalar esa fresa."
         return redirect(url_for('fresas.fresas'))
 
+    # Solo lectura: las predicciones ya están guardadas (ver desgaste.py)
     fresas_inventario = FresaInventario.query.order_by(FresaInventario.tipo).all()
     fresas_instaladas = FresaInstalada.query.order_by(FresaInstalada.fecha_instalacion.desc()).all()
+    # Desgaste estimado de cada fresa instalada
+    desgaste = {f.id: resumen(f) for f in fresas_instaladas}
 
     return render_template(
         'fresas.html',
         fresas_inventario=fresas_inventario,
         fresas_instaladas=fresas_instaladas,
+        desgaste=desgaste,
         maquinas=maquinas,
         tipos_material=tipos_material,
         error=error
@@ -83,8 +93,22 @@ def eliminar_instalada(fresa_id):
     tipo = fresa.tipo
     diametro = fresa.diametro
     materiales = fresa.materiales
+    # Guardamos la fresa retirada en el historial antes de eliminarla
+    historial = FresaHistorial(
+        fresa_id=fresa.id,
+        tipo=fresa.tipo,
+        diametro=fresa.diametro,
+        maquina=fresa.maquina,
+        materiales=fresa.materiales,
+        fecha_instalacion=fresa.fecha_instalacion,
+        modelos_fresados=fresa.modelos_fresados,
+        fecha_retiro=datetime.utcnow()
+    )
+    db.session.add(historial)
     db.session.delete(fresa)
     db.session.commit()
+    # El historial cambió el modelo de vida útil: se recalculan las demás fresas instaladas
+    refrescar_predicciones()
 
     # Si el usuario quiere reinstalar una igual, lo hacemos aquí
     inventario = FresaInventario.query.filter_by(tipo=tipo, diametro=diametro, materiales=materiales).filter(FresaInventario.cantidad > 0).first()
@@ -120,6 +144,9 @@ def editar_inventario(fresa_id):
 @fresas_bp.route('/editar_instalada/<int:fresa_id>', methods=['POST'])
 def editar_instalada(fresa_id):
     fresa = FresaInstalada.query.get_or_404(fresa_id)
+    if request.form['maquina'] != fresa.maquina and not maquina_conocida(request.form['maquina'], 'fresadora'):
+        flash(f"La máquina '{request.form['maquina']}' no está registrada. Agrégala en Configuración.", 'danger')
+        return redirect(url_for('fresas.fresas'))
     fresa.tipo = request.form['tipo']
     fresa.diametro = float(request.form['diametro'])
     fresa.maquina = request.form['maquina']
@@ -127,4 +154,10 @@ def editar_instalada(fresa_id):
     fresa.materiales = ','.join(materiales)
     db.session.commit()
     flash('Fresa instalada editada correctamente.')
-    return redirect(url_for('fresas.fresas'))
\ No newline at end of file
+    return redirect(url_for('fresas.fresas'))
+
+# API con las fresas que hay que reemplazar pronto (?dias=14 por defecto)
+@fresas_bp.route('/api/reemplazos')
+def api_reemplazos():
+    dias = request.args.get('dias', 14, type=int)
+    return jsonify({'dias': dias, 'fresas': fresas_por_reemplazar(dias)})
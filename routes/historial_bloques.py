@@ -10,11 +10,14 @@ Paso a paso:
 Este archivo permite consultar fácilmente los cambios y eliminaciones de bloques en el sistema.
 """
 
-# Importamos Blueprint para crear un grupo de rutas y render_template para mostrar páginas HTML
-from flask import Blueprint, render_template, send_file, request
+# Importamos Blueprint para crear un grupo de rutas
+from flask import Blueprint, send_file, request
 # Importamos el modelo que representa el historial de bloques en la base de datos
 from models import BloqueHistorial, Orden, Bloque, FresaInventario, FresaInstalada, Mantenimiento, OrdenPendiente
 from extensions import db
+from compresion import render_lista, filas
+from replica import solo_lectura
+from sedes import leer_df
 import io
 import pandas as pd
 
@@ -23,13 +26,15 @@ historial_bp = Blueprint('historial', __name__, url_prefix='/historial')
 
 # Definimos la ruta '/bloques' dentro del blueprint
 @historial_bp.route('/bloques')
+@solo_lectura
 def historial_bloques():
     # Consultamos todos los registros del historial de bloques, ordenados por fecha de eliminación descendente
-    historial = BloqueHistorial.query.order_by(BloqueHistorial.fecha_eliminacion.desc()).all()
+    bloques_historial = filas(BloqueHistorial.query.order_by(BloqueHistorial.fecha_eliminacion.desc()))
     # Renderizamos la plantilla HTML y le pasamos la lista de bloques del historial
-    return render_template('historial_bloques.html', historial=historial)
+    return render_lista('historial_bloques.html', bloques_historial=bloques_historial)
 
 @historial_bp.route('/descargar', methods=['GET'])
+@solo_lectura
 def descargar_historial():
     tablas = {
         'bloques_historial': BloqueHistorial,
@@ -48,7 +53,8 @@ def descargar_historial():
     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
         for nombre, modelo in tablas.items():
             if nombre in seleccionadas:
-                df = pd.read_sql(modelo.query.statement, db.session.bind)
+                # A través de la sesión: la exportación lee de la réplica si existe y solo trae la sede actual
+                df = leer_df(modelo.query.statement)
                 df.to_excel(writer, sheet_name=nombre, index=False)
     output.seek(0)
     return send_file(output, as_attachment=True, download_name='historial_fresado.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
\ No newline at end of file
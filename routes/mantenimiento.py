@@ -15,9 +15,10 @@ Este archivo permite llevar un control de las actividades de mantenimiento reali
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from models import Mantenimiento, Orden, Bloque, Configuracion
 from extensions import db
+from compresion import render_lista, filas
+from maquinas import nombres_maquinas, documentacion_maquinas, guardar_documentacion, maquina_conocida, TIPOS_MAQUINA
 from datetime import datetime, timedelta
 import re
-import json
 
 mantenimiento_bp = Blueprint('mantenimiento', __name__, url_prefix='/mantenimiento')
 
@@ -26,14 +27,46 @@ ACTIVIDADES = [
     {'nombre': 'Limpieza general', 'intervalo': 1, 'unidad': 'semana'}
 ]
 
+def _anotar(reg):
+    # Calcular próxima fecha del registro y extraer intervalo/unidad para edición
+    match = re.search(r'cada (\d+) (semana|mes|año)', reg.actividad)
+    if match:
+        intervalo_int = int(match.group(1))
+        unidad = match.group(2)
+        reg.intervalo_edit = intervalo_int
+        reg.unidad_edit = unidad
+        # Próxima fecha
+        if unidad == 'semana':
+            reg.proxima_fecha = reg.fecha + timedelta(weeks=intervalo_int)
+        elif unidad == 'mes':
+            reg.proxima_fecha = reg.fecha + timedelta(days=30*intervalo_int)
+        elif unidad == 'año':
+            reg.proxima_fecha = reg.fecha + timedelta(days=365*intervalo_int)
+        else:
+            reg.proxima_fecha = None
+    else:
+        reg.intervalo_edit = 1
+        reg.unidad_edit = 'semana'
+        reg.proxima_fecha = None
+    return reg
+
+
+def _registros():
+    # Registros anotados, leídos por lotes si se usa streaming (ver compresion.filas)
+    consulta = filas(Mantenimiento.query.order_by(Mantenimiento.fecha.desc()))
+    if isinstance(consulta, list):
+        return [_anotar(reg) for reg in consulta]
+    return (_anotar(reg) for reg in consulta)
+
+
 # Ruta principal para ver y registrar actividades de mantenimiento
 @mantenimiento_bp.route('/', methods=['GET', 'POST'])
 def mantenimiento():
     error = None
     grupo = request.args.get('grupo', 'fresadoras')
-    FRESADORAS = Configuracion.get_lista('maquinas', default=['A', 'B', 'C', 'D'])
-    hornos = Configuracion.get_lista('hornos', default=['Horno 1', 'Horno 2', 'Horno 3', 'Horno 4'])
-    aspiradoras = Configuracion.get_lista('aspiradoras', default=['Aspiradora 1', 'Aspiradora 2', 'Aspiradora 3', 'Aspiradora 4', 'Aspiradora 5'])
+    FRESADORAS = nombres_maquinas('fresadora')
+    hornos = nombres_maquinas('horno', default=['Horno 1', 'Horno 2', 'Horno 3', 'Horno 4'])
+    aspiradoras = nombres_maquinas('aspiradora', default=['Aspiradora 1', 'Aspiradora 2', 'Aspiradora 3', 'Aspiradora 4', 'Aspiradora 5'])
     if grupo == 'fresadoras':
         maquinas = FRESADORAS
     elif grupo == 'hornos':
@@ -53,6 +86,8 @@ def mantenimiento():
         descripcion = request.form.get('descripcion')
         if not maquina or not actividad:
             error = "La máquina y la actividad son obligatorias."
+        elif maquina not in FRESADORAS + hornos + aspiradoras:
+            error = f"La máquina '{maquina}' no está registrada. Agrégala en Configuración."
         else:
             fecha = datetime.utcnow()
             try:
@@ -79,40 +114,19 @@ def mantenimiento():
             flash('Mantenimiento registrado correctamente.')
             return redirect(url_for('mantenimiento.mantenimiento', grupo=grupo))
 
-    registros = Mantenimiento.query.order_by(Mantenimiento.fecha.desc()).all()
-    # Calcular próxima fecha para cada registro y extraer intervalo/unidad para edición
-    for reg in registros:
-        match = re.search(r'cada (\d+) (semana|mes|año)', reg.actividad)
-        if match:
-            intervalo_int = int(match.group(1))
-            unidad = match.group(2)
-            reg.intervalo_edit = intervalo_int
-            reg.unidad_edit = unidad
-            # Próxima fecha
-            if unidad == 'semana':
-                reg.proxima_fecha = reg.fecha + timedelta(weeks=intervalo_int)
-            elif unidad == 'mes':
-                reg.proxima_fecha = reg.fecha + timedelta(days=30*intervalo_int)
-            elif unidad == 'año':
-                reg.proxima_fecha = reg.fecha + timedelta(days=365*intervalo_int)
-            else:
-                reg.proxima_fecha = None
-        else:
-            reg.intervalo_edit = 1
-            reg.unidad_edit = 'semana'
-            reg.proxima_fecha = None
-
     # --- Próximas actividades pendientes ---
     # Para cada máquina y actividad, mostrar la próxima a realizar (la más próxima en el futuro)
+    registros = _registros()
+    # Con streaming los registros se leen dos veces por lotes (aquí y en la tabla) en vez de guardarlos todos
     proximas = {}
-    for reg in registros:
+    for reg in (registros if isinstance(registros, list) else _registros()):
         if reg.proxima_fecha and reg.proxima_fecha >= datetime.utcnow():
             key = (reg.maquina, reg.actividad)
             if key not in proximas or reg.proxima_fecha < proximas[key].proxima_fecha:
                 proximas[key] = reg
     proximas_actividades = sorted(proximas.values(), key=lambda r: r.proxima_fecha)
 
-    return render_template(
+    return render_lista(
         'mantenimiento.html',
         registros=registros,
         maquinas=maquinas,
@@ -170,6 +184,9 @@ def editar_mantenimiento(mant_id):
     intervalo = request.form.get('intervalo')
     unidad = request.form.get('unidad')
     descripcion = request.form.get('descripcion')
+    if maquina != mant.maquina and not maquina_conocida(maquina):
+        flash(f"La máquina '{maquina}' no está registrada. Agrégala en Configuración.", 'danger')
+        return redirect(url_for('mantenimiento.mantenimiento'))
     # Actualizar campos
     mant.maquina = maquina
     # Guardar actividad con formato: "nombre (cada X unidad)"
@@ -192,46 +209,28 @@ def eliminar_mantenimiento(mant_id):
 
 @mantenimiento_bp.route('/documentacion', methods=['GET', 'POST'])
 def documentacion():
-    # Cargar todas las máquinas de los tres tipos
-    fresadoras = Configuracion.get_lista('maquinas', default=['A', 'B', 'C', 'D'])
-    hornos = Configuracion.get_lista('hornos', default=['Horno 1', 'Horno 2', 'Horno 3'])
-    aspiradoras = Configuracion.get_lista('aspiradoras', default=['Aspiradora 1', 'Aspiradora 2', 'Aspiradora 3'])
-    # Guardar/leer datos extendidos en la tabla Configuracion (clave: doc_maquinas)
-    doc_data = Configuracion.query.filter_by(clave='doc_maquinas').first()
-    if doc_data:
-        doc_maquinas = json.loads(doc_data.valor)
-    else:
-        doc_maquinas = {}
-    # Construir lista de máquinas
-    maquinas = []
-    id_counter = 1
-    for tipo, lista in [('Milling Machines', fresadoras), ('Furnaces', hornos), ('Vacuum Cleaners', aspiradoras)]:
-        for nombre in lista:
-            key = f"{tipo}:{nombre}"
-            datos = doc_maquinas.get(key, {'modelo': '', 'serie': '', 'link': ''})
-            maquinas.append({
-                'id': id_counter,
-                'tipo': tipo,
-                'nombre': nombre,
-                'modelo': datos.get('modelo', ''),
-                'serie': datos.get('serie', ''),
-                'link': datos.get('link', '')
-            })
-            id_counter += 1
+    # Máquinas del registro (fresadoras, hornos y aspiradoras) con sus datos de documentación
+    registros = documentacion_maquinas()
     if request.method == 'POST':
-        # Actualizar datos
-        for m in maquinas:
-            modelo = request.form.get(f"modelo_{m['id']}", '')
-            serie = request.form.get(f"serie_{m['id']}", '')
-            link = request.form.get(f"link_{m['id']}", '')
-            key = f"{m['tipo']}:{m['nombre']}"
-            doc_maquinas[key] = {'modelo': modelo, 'serie': serie, 'link': link}
-        # Guardar en la base de datos
-        if not doc_data:
-            doc_data = Configuracion(clave='doc_maquinas', valor=json.dumps(doc_maquinas))
-            db.session.add(doc_data)
-        else:
-            doc_data.valor = json.dumps(doc_maquinas)
+        # Solo se modifican las filas de las máquinas que cambiaron
+        for m in registros:
+            guardar_documentacion(
+                m,
+                request.form.get(f"modelo_{m.id}", ''),
+                request.form.get(f"serie_{m.id}", ''),
+                request.form.get(f"link_{m.id}", ''),
+            )
         db.session.commit()
         return redirect(url_for('mantenimiento.documentacion'))
-    return render_template('documentacion.html', maquinas=maquinas)
\ No newline at end of file
+    maquinas = [
+        {
+            'id': m.id,
+            'tipo': TIPOS_MAQUINA.get(m.tipo, {}).get('etiqueta', 'Other'),
+            'nombre': m.nombre,
+            'modelo': m.modelo or '',
+            'serie': m.serie or '',
+            'link': m.link or '',
+        }
+        for m in registros
+    ]
+    return render_template('documentacion.html', maquinas=maquinas)
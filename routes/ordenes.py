@@ -16,8 +16,15 @@ Este archivo gestiona toda la lógica relacionada con la creación y visualizaci
 
 # Importamos los módulos necesarios y los modelos de datos
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from models import Orden, Bloque, BloqueHistorial, FresaInstalada, OrdenPendiente, Configuracion
+from models import Orden, Bloque, BloqueHistorial, FresaInstalada, OrdenPendiente, Configuracion, Material, Shade, Maquina
 from extensions import db
+from compresion import render_lista, filas
+from asignacion import planificar_pendientes
+from planificador import obtener_plan_maquinas
+from replica import solo_lectura
+from maquinas import nombres_maquinas
+from catalogos import filtro_catalogo
+from retiro_bloques import vigentes
 from datetime import datetime
 import random
 import string
@@ -56,7 +63,13 @@ def ordenes():
     if request.method == 'POST' and 'codigo_orden_pendiente' in request.form:
         codigo_orden_pendiente = request.form.get('codigo_orden_pendiente', '').strip()
         if codigo_orden_pendiente and not OrdenPendiente.query.filter_by(codigo_orden=codigo_orden_pendiente).first():
-            nuevo = OrdenPendiente(codigo_orden=codigo_orden_pendiente)
+            # Material, shade y modelos son opcionales (el escáner solo envía el código); los usa el planificador
+            nuevo = OrdenPendiente(
+                codigo_orden=codigo_orden_pendiente,
+                material=request.form.get('material_pendiente', '').strip() or None,
+                shade=request.form.get('shade_pendiente', '').strip() or None,
+                cantidad_modelos=request.form.get('modelos_pendiente', type=int)
+            )
             db.session.add(nuevo)
             db.session.commit()
             flash('Código agregado a la lista de pendientes.')
@@ -76,46 +89,51 @@ def ordenes():
             shade = shade_post
 
     # Obtener máquinas y materiales desde configuración
-    maquinas = Configuracion.get_lista('maquinas')
-    tipos_material = Configuracion.get_lista('materiales')
+    maquinas = nombres_maquinas('fresadora')
 
-    # Obtenemos los tipos de material disponibles
-    tipos_material = db.session.query(Bloque.material).distinct().all()
+    # Obtenemos los tipos de material disponibles (catálogo de los materiales con bloques)
+    tipos_material = db.session.query(Material.nombre).join(Bloque, Bloque.material_id == Material.id).distinct().all()
     tipos_material = [type[0] for type in tipos_material if type[0]]
     if not tipos_material:
         tipos_material = TIPOS_MATERIAL_FIJOS
 
-    # --- FILTRO ROBUSTO DE SHADES ---
-    # Normaliza el material para evitar problemas de espacios o mayúsculas
+    # --- FILTRO DE SHADES ---
+    # El catálogo ya une las variantes de mayúsculas y espacios: se filtra por el id del material
     material_normalizado = material.strip() if material else None
+    todos_los_shades = db.session.query(Shade.nombre).join(Bloque, Bloque.shade_id == Shade.id).distinct()
     if material_normalizado:
-        # Busca shades para el material normalizado
-        shades_disponibles = db.session.query(Bloque.shade).filter(
-            db.func.lower(Bloque.material) == material_normalizado.lower()
-        ).distinct().all()
-        shades_disponibles = [s[0] for s in shades_disponibles if s[0]]
+        # Busca shades para el material seleccionado
+        shades_disponibles = [s[0] for s in todos_los_shades.filter(filtro_catalogo(Bloque.material_id, 'material', material_normalizado)).all()]
         # Si no hay shades, fallback: mostrar todos los shades
         if not shades_disponibles:
-            shades_disponibles = [s[0] for s in db.session.query(Bloque.shade).distinct().all() if s[0]]
+            shades_disponibles = [s[0] for s in todos_los_shades.all()]
     else:
-        shades_disponibles = [s[0] for s in db.session.query(Bloque.shade).distinct().all() if s[0]]
+        shades_disponibles = [s[0] for s in todos_los_shades.all()]
 
     # Filtrar bloques usados y nuevos según material y shade seleccionados
-    bloques_usados_query = Bloque.query.filter_by(estado='usado')
+    # Los usados que ya cumplen una regla de retiro no se ofrecen (ver retiro_bloques.py)
+    bloques_usados_query = vigentes(Bloque.query.filter_by(estado='usado'))
     bloques_nuevos_query = Bloque.query.filter_by(estado='nuevo')
     if material_normalizado:
-        bloques_usados_query = bloques_usados_query.filter(Bloque.material == material_normalizado)
-        bloques_nuevos_query = bloques_nuevos_query.filter(Bloque.material == material_normalizado)
+        por_material = filtro_catalogo(Bloque.material_id, 'material', material_normalizado)
+        bloques_usados_query = bloques_usados_query.filter(por_material)
+        bloques_nuevos_query = bloques_nuevos_query.filter(por_material)
     if shade:
-        bloques_usados_query = bloques_usados_query.filter(Bloque.shade == shade)
-        bloques_nuevos_query = bloques_nuevos_query.filter(Bloque.shade == shade)
+        por_shade = filtro_catalogo(Bloque.shade_id, 'shade', shade)
+        bloques_usados_query = bloques_usados_query.filter(por_shade)
+        bloques_nuevos_query = bloques_nuevos_query.filter(por_shade)
     bloques_usados = bloques_usados_query.all()
     bloques_nuevos = bloques_nuevos_query.all()
 
+    # La máquina tiene que ser una de la lista: un nombre desconocido no se guarda (ver maquinas.py)
+    maquina_form = request.form.get('maquina')
+    if request.method == 'POST' and maquina_form and maquina_form not in maquinas:
+        error = f"La máquina '{maquina_form}' no está registrada. Agrégala en Configuración."
+
     # Si el formulario viene de la selección de casos pendientes (fresado grupal)
     codigos_seleccionados = request.form.getlist('codigos_seleccionados')
     # Solo procesar fresado grupal si también vienen los datos compartidos (material, shade, etc.)
-    if codigos_seleccionados and request.method == 'POST' and 'material' in request.form:
+    if not error and codigos_seleccionados and request.method == 'POST' and 'material' in request.form:
         material_form = request.form.get('material')
         shade_form = request.form.get('shade')
         cantidad_modelos = int(request.form.get('cantidad_modelos', 1))
@@ -169,10 +187,9 @@ def ordenes():
                     fecha_creacion=datetime.utcnow()
                 )
                 db.session.add(nueva_orden)
-                # Eliminamos el código de la lista de pendientes
-                pendiente = OrdenPendiente.query.filter_by(codigo_orden=codigo_orden).first()
-                if pendiente:
-                    db.session.delete(pendiente)
+            # Eliminamos los códigos de la lista de pendientes (una sola consulta para todos)
+            for pendiente in OrdenPendiente.query.filter(OrdenPendiente.codigo_orden.in_(codigos_seleccionados)).all():
+                db.session.delete(pendiente)
             # Actualizamos la fresa instalada
             fresa_instalada = FresaInstalada.query.filter(
                 FresaInstalada.maquina == maquina,
@@ -185,7 +202,7 @@ def ordenes():
             return redirect(url_for('ordenes.ordenes', material=material_form, shade=shade_form))
 
     # Si el formulario es para crear una orden individual o múltiple (códigos separados por coma)
-    if request.method == 'POST' and 'codigo_orden' in request.form:
+    if not error and request.method == 'POST' and 'codigo_orden' in request.form:
         print("DEBUG POST DATA:", dict(request.form))
         codigos_orden = request.form.get('codigo_orden', '').strip()
         if codigos_orden:
@@ -271,9 +288,8 @@ def ordenes():
                         fecha_creacion=datetime.utcnow()
                     )
                     db.session.add(nueva_orden)
-                    pendiente = OrdenPendiente.query.filter_by(codigo_orden=codigo_orden).first()
-                    if pendiente:
-                        db.session.delete(pendiente)
+                for pendiente in OrdenPendiente.query.filter(OrdenPendiente.codigo_orden.in_(codigos_lista)).all():
+                    db.session.delete(pendiente)
                 fresa_instalada = FresaInstalada.query.filter(
                     FresaInstalada.maquina == maquina,
                     FresaInstalada.materiales.like(f"%{bloque.material}%")
@@ -284,17 +300,24 @@ def ordenes():
                 flash('Órdenes creadas correctamente.')
                 return redirect(url_for('ordenes.ordenes', material=material_form, shade=shade_form))
 
-    # Obtenemos todas las órdenes para mostrarlas en la tabla
-    ordenes = Orden.query.order_by(Orden.fecha_creacion.desc()).all()
+    # Obtenemos todas las órdenes para mostrarlas en la tabla (por lotes si se usa streaming)
+    ordenes = filas(Orden.query.order_by(Orden.fecha_creacion.desc()))
 
-    # Construir shades por material para el JS
-    shades_por_material = {}
-    for tipo in tipos_material:
-        shades = db.session.query(Bloque.shade).filter(Bloque.material == tipo).distinct().all()
-        shades_por_material[tipo] = [s[0] for s in shades if s[0]]
+    # Construir shades por material para el JS (una sola consulta agrupada por los catálogos)
+    shades_por_material = {tipo: [] for tipo in tipos_material}
+    pares = (
+        db.session.query(Material.nombre, Shade.nombre)
+        .join(Bloque, Bloque.material_id == Material.id)
+        .join(Shade, Bloque.shade_id == Shade.id)
+        .distinct()
+        .all()
+    )
+    for tipo, shade_nombre in pares:
+        if tipo in shades_por_material and shade_nombre:
+            shades_por_material[tipo].append(shade_nombre)
 
     # Renderizamos la plantilla HTML con los datos necesarios
-    return render_template(
+    return render_lista(
         'ordenes.html',
         ordenes=ordenes,
         tipos_material=tipos_material,
@@ -306,7 +329,10 @@ def ordenes():
         shade=shade,
         error=error,
         pendientes_orden=pendientes_orden,
-        shades_por_material=shades_por_material
+        shades_por_material=shades_por_material,
+        # Listas completas para los datos de los casos pendientes (pueden ser de un material sin stock)
+        materiales_pendiente=Configuracion.get_lista('materiales'),
+        shades_pendiente=Configuracion.get_lista('shades')
     )
 
 @ordenes_bp.route('/eliminar/<int:orden_id>', methods=['POST'])
@@ -353,8 +379,11 @@ def editar_orden(orden_id):
     materiales = Configuracion.get_lista('materiales')
     marcas = Configuracion.get_lista('marcas')
     shades = Configuracion.get_lista('shades')
-    maquinas = Configuracion.get_lista('maquinas')
+    maquinas = nombres_maquinas('fresadora')
     if request.method == 'POST':
+        if request.form['maquina'] != orden.maquina and request.form['maquina'] not in maquinas:
+            flash(f"La máquina '{request.form['maquina']}' no está registrada. Agrégala en Configuración.", 'danger')
+            return redirect(url_for('ordenes.editar_orden', orden_id=orden.id))
         orden.codigo_orden = request.form['codigo_orden']
         orden.material = request.form['material']
         orden.marca = request.form['marca']
@@ -372,30 +401,66 @@ def editar_pendiente(pendiente_id):
     nuevo_codigo = request.form.get('codigo_orden', '').strip()
     if nuevo_codigo:
         pendiente.codigo_orden = nuevo_codigo
+        # Datos opcionales del caso para el planificador de bloques
+        if 'material' in request.form:
+            pendiente.material = request.form.get('material', '').strip() or None
+        if 'shade' in request.form:
+            pendiente.shade = request.form.get('shade', '').strip() or None
+        if 'cantidad_modelos' in request.form:
+            pendiente.cantidad_modelos = request.form.get('cantidad_modelos', type=int)
         db.session.commit()
         flash('Caso pendiente editado correctamente.')
     else:
         flash('El código de orden no puede estar vacío.', 'danger')
     return redirect(url_for('ordenes.ordenes'))
 
+# API que sugiere en qué bloque fresar cada caso pendiente, abriendo la menor cantidad de bloques nuevos
+# GET: usa los casos pendientes guardados. POST (JSON): {"casos": [{"codigo", "material", "shade", "modelos"}, ...]}
+@ordenes_bp.route('/api/plan-bloques', methods=['GET', 'POST'])
+def api_plan_bloques():
+    casos = None
+    if request.method == 'POST':
+        datos = request.get_json(silent=True) or {}
+        casos = []
+        for caso in datos.get('casos', []):
+            try:
+                modelos = int(caso.get('modelos') or 0)
+            except (TypeError, ValueError):
+                modelos = 0
+            casos.append({
+                'codigo': str(caso.get('codigo', '')).strip(),
+                'material': caso.get('material'),
+                'shade': caso.get('shade'),
+                'modelos': modelos,
+            })
+    return jsonify(planificar_pendientes(casos))
+
+# API que reparte los casos pendientes entre las máquinas con fresas compatibles
+@ordenes_bp.route('/api/plan-maquinas')
+def api_plan_maquinas():
+    return jsonify(obtener_plan_maquinas())
+
 @ordenes_bp.route('/api/graficas-inventario')
+@solo_lectura
 def api_graficas_inventario():
     # Bloques por shade
     from models import Bloque, Orden
-    # Bloques por shade (solo inventario actual)
+    # Bloques por shade (solo inventario actual); se agrupa por el id del catálogo
     bloques_shade = (
-        db.session.query(Bloque.shade, func.sum(Bloque.cantidad))
-        .group_by(Bloque.shade)
+        db.session.query(Shade.nombre, func.sum(Bloque.cantidad))
+        .join(Bloque, Bloque.shade_id == Shade.id)
+        .group_by(Shade.id, Shade.nombre)
         .all()
     )
     # Modelos fresados por máquina por semana (últimas 8 semanas)
     modelos_maquina = (
         db.session.query(
             func.to_char(Orden.fecha_creacion, 'IYYY-IW'),
-            Orden.maquina,
+            Maquina.nombre,
             func.sum(Orden.cantidad_modelos)
         )
-        .group_by(func.to_char(Orden.fecha_creacion, 'IYYY-IW'), Orden.maquina)
+        .join(Maquina, Orden.maquina_id == Maquina.id)
+        .group_by(func.to_char(Orden.fecha_creacion, 'IYYY-IW'), Maquina.id, Maquina.nombre)
         .order_by(func.to_char(Orden.fecha_creacion, 'IYYY-IW').desc())
         .limit(32)
         .all()
@@ -405,16 +470,18 @@ def api_graficas_inventario():
     hoy = datetime.utcnow()
     primer_dia_semana = hoy - timedelta(days=hoy.weekday())
     modelos_shade_semana = (
-        db.session.query(Orden.shade, func.sum(Orden.cantidad_modelos))
+        db.session.query(Shade.nombre, func.sum(Orden.cantidad_modelos))
+        .join(Orden, Orden.shade_id == Shade.id)
         .filter(Orden.fecha_creacion >= primer_dia_semana)
-        .group_by(Orden.shade)
+        .group_by(Shade.id, Shade.nombre)
         .all()
     )
     # Modelos fresados por material esta semana
     modelos_material_semana = (
-        db.session.query(Orden.material, func.sum(Orden.cantidad_modelos))
+        db.session.query(Material.nombre, func.sum(Orden.cantidad_modelos))
+        .join(Orden, Orden.material_id == Material.id)
         .filter(Orden.fecha_creacion >= primer_dia_semana)
-        .group_by(Orden.material)
+        .group_by(Material.id, Material.nombre)
         .all()
     )
     # Modelos fresados por día (últimos 14 días)
@@ -19,7 +19,13 @@ def pendientes():
         codigo_orden = request.form.get('codigo_orden', '').strip()
         # Si el campo no está vacío y no existe ya en la lista, lo agregamos
         if codigo_orden and not OrdenPendiente.query.filter_by(codigo_orden=codigo_orden).first():
-            nuevo = OrdenPendiente(codigo_orden=codigo_orden)
+            # Material, shade y cantidad de modelos son opcionales (el escáner solo envía el código)
+            nuevo = OrdenPendiente(
+                codigo_orden=codigo_orden,
+                material=request.form.get('material', '').strip() or None,
+                shade=request.form.get('shade', '').strip() or None,
+                cantidad_modelos=request.form.get('cantidad_modelos', type=int)
+            )
             db.session.add(nuevo)
             db.session.commit()
             flash('Código agregado a la lista de pendientes.')
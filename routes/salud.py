@@ -0,0 +1,22 @@
+"""
+Este archivo contiene la ruta con el estado de salud de la base de datos.
+
+Paso a paso:
+1. Se define un blueprint con el prefijo /salud.
+2. /salud/bd devuelve en JSON el tamaño de cada tabla e índice, el espacio perdido, las estadísticas,
+   el último mantenimiento y un resumen ('ok' o 'revisar' con la lista de avisos).
+   Las filas son estimaciones de las estadísticas (no se recorre ninguna tabla): los conteos exactos
+   los da flask mantenimiento-bd --reporte.
+
+El mantenimiento y el reporte viven en mantenimiento_bd.py.
+"""
+
+from flask import Blueprint, jsonify
+from mantenimiento_bd import reporte_salud
+
+salud_bp = Blueprint('salud', __name__, url_prefix='/salud')
+
+# API con el reporte de salud de la base de datos
+@salud_bp.route('/bd')
+def salud_bd():
+    return jsonify(reporte_salud())
@@ -0,0 +1,24 @@
+"""
+Este archivo contiene la ruta de sincronización incremental para los clientes con copia local.
+
+Paso a paso:
+1. Se define un blueprint con el prefijo /api.
+2. /api/sync?since=<cursor> devuelve las filas creadas o modificadas y los borrados posteriores al cursor,
+   junto con el cursor nuevo. La primera vez se llama sin cursor y se recibe todo, en lotes.
+3. Si la respuesta trae hay_mas=true el cliente vuelve a pedir enseguida con el cursor nuevo;
+   si trae reiniciar=true borra su copia y empieza de nuevo.
+
+La lógica vive en sincronizacion.py.
+"""
+
+from flask import Blueprint, request, jsonify
+from sincronizacion import cambios_desde, LOTE_SYNC
+
+sincronizacion_bp = Blueprint('sincronizacion', __name__, url_prefix='/api')
+
+# API de cambios desde un cursor (?since=<cursor>&limite=500)
+@sincronizacion_bp.route('/sync')
+def sync():
+    cursor = request.args.get('since') or request.args.get('desde')
+    limite = min(max(request.args.get('limite', LOTE_SYNC, type=int), 1), LOTE_SYNC)
+    return jsonify(cambios_desde(cursor, limite))
@@ -0,0 +1,107 @@
+"""
+Este archivo separa los datos de cada laboratorio (sede) cuando varios comparten la misma instalación.
+
+Paso a paso:
+1. La sede de cada petición se toma del encabezado X-Sede o de la sesión del usuario (se elige en Configuración).
+   Si no hay ninguna se usa la sede por defecto (SEDE_DEFECTO), la de las instalaciones con un solo laboratorio.
+2. Cada consulta del ORM durante la petición se filtra por la sede (with_loader_criteria), así ninguna
+   página ni API lee filas de otro laboratorio aunque la consulta no lo diga.
+3. Las filas nuevas reciben la sede actual al guardarse.
+4. leer_df() ejecuta consultas para pandas a través de la sesión, para que también queden filtradas.
+5. Fuera de una petición (scripts, tareas) no se filtra; con en_sede() se trabaja dentro de una sede concreta.
+
+Los índices de las tablas empiezan por sede_id, así cada consulta solo recorre las filas de su laboratorio.
+"""
+
+from contextlib import contextmanager
+import pandas as pd
+from flask import g, has_app_context, request, session
+from sqlalchemy import event
+from sqlalchemy.orm import with_loader_criteria
+from extensions import db
+from models import PorSede, Sede, SEDE_DEFECTO
+
+
+def sede_actual():
+    """
+    Sede de la petición actual (o la de en_sede()); SEDE_DEFECTO si no hay ninguna.
+    """
+    if has_app_context():
+        return g.get('sede_id') or SEDE_DEFECTO
+    return SEDE_DEFECTO
+
+
+@contextmanager
+def en_sede(sede_id):
+    """
+    Ejecuta un bloque de código filtrado por una sede (para scripts y tareas fuera de una petición).
+    """
+    anterior = g.get('sede_id')
+    g.sede_id = sede_id
+    try:
+        yield
+    finally:
+        g.sede_id = anterior
+
+
+def _elegir_sede():
+    sede = request.headers.get('X-Sede', type=int) or session.get('sede_id')
+    g.sede_id = sede or SEDE_DEFECTO
+
+
+def _filtrar_por_sede(estado):
+    # Solo consultas del ORM y solo cuando hay una sede activa (petición o en_sede)
+    if not (estado.is_select or estado.is_update or estado.is_delete):
+        return
+    if estado.execution_options.get('todas_las_sedes') or not has_app_context():
+        return
+    sede = g.get('sede_id')
+    if not sede:
+        return
+    estado.statement = estado.statement.options(
+        with_loader_criteria(PorSede, lambda cls: cls.sede_id == sede, include_aliases=True)
+    )
+
+
+def _asignar_sede(session, flush_context, instances):
+    sede = sede_actual()
+    for obj in session.new:
+        if isinstance(obj, PorSede) and obj.sede_id is None:
+            obj.sede_id = sede
+
+
+def leer_df(stmt, columnas_fecha=None):
+    """
+    Ejecuta una consulta con la sesión (filtrada por sede) y devuelve un DataFrame.
+    """
+    resultado = db.session.execute(stmt)
+    df = pd.DataFrame(resultado.all(), columns=list(resultado.keys()))
+    for columna in columnas_fecha or []:
+        df[columna] = pd.to_datetime(df[columna])
+    return df
+
+
+def lista_sedes():
+    return Sede.query.order_by(Sede.id.asc()).all()
+
+
+def asegurar_sede_defecto():
+    """
+    Crea la sede por defecto si no existe (instalaciones nuevas o actualizadas).
+    """
+    if db.session.get(Sede, SEDE_DEFECTO) is None:
+        db.session.add(Sede(id=SEDE_DEFECTO, nombre='Principal'))
+        db.session.commit()
+
+
+def init_sedes(app):
+    """
+    Registra la elección de sede por petición y el filtro de las consultas.
+    """
+    app.before_request(_elegir_sede)
+    for nombre, funcion in (
+        ('do_orm_execute', _filtrar_por_sede),
+        ('before_flush', _asignar_sede),
+    ):
+        if not event.contains(db.session, nombre, funcion):
+            event.listen(db.session, nombre, funcion)
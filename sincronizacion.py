@@ -0,0 +1,195 @@
+"""
+Este archivo entrega los cambios incrementales para los clientes que mantienen una copia local (tablets, paneles).
+
+Paso a paso:
+1. Orden, Bloque, OrdenPendiente, FresaInstalada y Mantenimiento guardan en cada inserción o modificación
+   (también en las masivas) la transacción que las escribió (columna transaccion, ver models.transaccion_actual).
+   Cada tabla tiene un índice (sede_id, transaccion, id).
+2. Los borrados se anotan en la tabla Eliminacion (tabla + id) en el mismo guardado que los borra.
+3. El cliente envía el cursor que recibió la vez anterior (vacío la primera vez) y recibe solo las filas
+   cambiadas después de ese punto, en lotes de tamaño máximo. 'hay_mas' indica que debe pedir otra vez enseguida.
+4. El cursor es opaco: guarda por tabla la última (transaccion, id) entregada, así el recorrido sigue
+   el índice y no se repite ni se salta ninguna fila.
+5. Solo se entregan las filas anteriores al horizonte (bitacora.horizonte): las transacciones que siguen abiertas
+   tienen una marca mayor, así que una transacción que se confirma tarde queda después del cursor.
+   No depende de la hora del servidor ni de cuánto dure la transacción.
+6. Las marcas de borrado se guardan RETENCION_DIAS; un cursor más viejo recibe 'reiniciar' y vuelve a bajar todo
+   (también un cursor que no se puede leer, por ejemplo uno de una versión anterior).
+
+Las consultas van siempre al principal: una réplica atrasada podría hacer que el cursor saltee filas.
+"""
+
+import base64
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import event, and_, or_, inspect, select, update
+from extensions import db
+from models import Orden, Bloque, OrdenPendiente, FresaInstalada, Mantenimiento, Eliminacion, transaccion_actual
+from bitacora import horizonte, COLUMNAS_INTERNAS
+
+# Tablas sincronizadas, en el orden en que se recorren
+TABLAS_SYNC = {
+    'orden_pendiente': OrdenPendiente,
+    'orden': Orden,
+    'bloque': Bloque,
+    'fresa_instalada': FresaInstalada,
+    'mantenimiento': Mantenimiento,
+}
+ELIMINADOS = 'eliminacion'
+LOTE_SYNC = 500          # Máximo de filas (cambios + borrados) por respuesta
+RETENCION_DIAS = 90      # Días que se guardan las marcas de borrado
+
+
+def _anotar_eliminaciones(session, flush_context, instances):
+    for obj in session.deleted:
+        tabla = getattr(obj, '__tablename__', None)
+        if tabla in TABLAS_SYNC and obj.id is not None:
+            session.add(Eliminacion(sede_id=obj.sede_id, tabla=tabla, entidad_id=obj.id))
+
+
+def _valor(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+
+def _fila(obj):
+    return {
+        a.key: _valor(getattr(obj, a.key))
+        for a in inspect(obj).mapper.column_attrs if a.key not in COLUMNAS_INTERNAS
+    }
+
+
+def leer_cursor(cursor):
+    """
+    Decodifica el cursor del cliente: ({tabla: (transaccion, id)}, fecha de los borrados leídos).
+    Un cursor vacío da ({}, None); uno inválido, None.
+    """
+    if not cursor:
+        return {}, None
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        posiciones = {t: (int(m), int(i)) for t, (m, i) in datos['posiciones'].items()}
+        return posiciones, datetime.fromisoformat(datos['fecha'])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+def crear_cursor(posiciones, fecha):
+    datos = {'posiciones': {t: [m, i] for t, (m, i) in posiciones.items()}, 'fecha': fecha.isoformat()}
+    return base64.urlsafe_b64encode(json.dumps(datos, sort_keys=True).encode()).decode()
+
+
+def _despues_de(modelo, posicion, tope):
+    # (transaccion, id) > (transaccion_cursor, id_cursor) y antes del horizonte: sigue el índice sin repetir filas
+    condicion = modelo.transaccion.isnot(None) if tope is None else modelo.transaccion < tope
+    if posicion is None:
+        return condicion
+    transaccion, ultimo_id = posicion
+    return and_(condicion, or_(
+        modelo.transaccion > transaccion, and_(modelo.transaccion == transaccion, modelo.id > ultimo_id)
+    ))
+
+
+def cambios_desde(cursor=None, limite=LOTE_SYNC):
+    """
+    Filas creadas o modificadas y filas borradas después del cursor, como máximo 'limite' en total.
+    """
+    leido = leer_cursor(cursor)
+    ahora = datetime.utcnow()
+    tope = horizonte()
+    reiniciar = leido is None
+    posiciones, fecha = leido or ({}, None)
+    if fecha is not None and fecha < ahora - timedelta(days=RETENCION_DIAS):
+        # Pueden faltar borrados ya purgados: el cliente tiene que empezar de nuevo
+        posiciones, reiniciar = {}, True
+    completo = not posiciones
+    restante = max(1, limite)
+    cambios = {}
+    hay_mas = False
+    for tabla, modelo in TABLAS_SYNC.items():
+        if restante <= 0:
+            hay_mas = True
+            break
+        filas = (
+            modelo.query
+            .filter(_despues_de(modelo, posiciones.get(tabla), tope))
+            .order_by(modelo.transaccion.asc(), modelo.id.asc())
+            .limit(restante + 1)
+            .all()
+        )
+        if len(filas) > restante:
+            filas, hay_mas = filas[:restante], True
+        if filas:
+            cambios[tabla] = [_fila(f) for f in filas]
+            posiciones[tabla] = (filas[-1].transaccion, filas[-1].id)
+            restante -= len(filas)
+    eliminados = []
+    if completo:
+        # En la primera sincronización no hacen falta los borrados anteriores: el cliente no tiene esas filas.
+        # Sin horizonte (SQLite) la marca actual ya es mayor que la de todo lo confirmado
+        inicio = tope if tope is not None else db.session.scalar(select(transaccion_actual()))
+        posiciones[ELIMINADOS], fecha = (inicio, 0), ahora
+    elif restante > 0:
+        marcas = (
+            Eliminacion.query
+            .filter(_despues_de(Eliminacion, posiciones.get(ELIMINADOS), tope))
+            .order_by(Eliminacion.transaccion.asc(), Eliminacion.id.asc())
+            .limit(restante + 1)
+            .all()
+        )
+        if len(marcas) > restante:
+            marcas, hay_mas = marcas[:restante], True
+        eliminados = [{'tabla': m.tabla, 'id': m.entidad_id, 'fecha': m.fecha.isoformat()} for m in marcas]
+        if marcas:
+            posiciones[ELIMINADOS] = (marcas[-1].transaccion, marcas[-1].id)
+        if hay_mas:
+            # Quedan borrados sin leer: la retención se cuenta desde el último entregado
+            fecha = max(fecha, marcas[-1].fecha)
+        else:
+            # Se leyó todo hasta el horizonte: la fecha avanza aunque no haya borrados (así no vence la retención)
+            fecha = ahora
+    else:
+        hay_mas = True
+    return {
+        'cambios': cambios,
+        'eliminados': eliminados,
+        'cursor': crear_cursor(posiciones, fecha or ahora),
+        'hay_mas': hay_mas,
+        'reiniciar': reiniciar,
+        'generado': ahora.isoformat(),
+    }
+
+
+def purgar_eliminaciones(dias=RETENCION_DIAS):
+    """
+    Borra las marcas de borrado más viejas que la retención. Devuelve cuántas se borraron.
+    """
+    borradas = Eliminacion.query.filter(
+        Eliminacion.fecha < datetime.utcnow() - timedelta(days=dias)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return borradas
+
+
+def completar_fechas():
+    """
+    Las filas anteriores a las columnas fecha_actualizacion y transaccion las reciben ahora (una sola vez).
+    Con transaccion 0 quedan antes de todo lo que se escriba después.
+    """
+    ahora = datetime.utcnow()
+    for modelo in TABLAS_SYNC.values():
+        db.session.execute(
+            update(modelo).where(modelo.fecha_actualizacion.is_(None)).values(fecha_actualizacion=ahora)
+        )
+        db.session.execute(update(modelo).where(modelo.transaccion.is_(None)).values(transaccion=0))
+    db.session.execute(update(Eliminacion).where(Eliminacion.transaccion.is_(None)).values(transaccion=0))
+    db.session.commit()
+
+
+def init_sincronizacion():
+    """
+    Registra la anotación de los borrados en cada guardado de la sesión.
+    """
+    if not event.contains(db.session, 'before_flush', _anotar_eliminaciones):
+        event.listen(db.session, 'before_flush', _anotar_eliminaciones)
@@ -0,0 +1,40 @@
+"""
+Pruebas de la lectura de archivos de importación de bloques (importacion.py).
+"""
+
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from importacion import leer_filas, ErrorImportacion
+
+
+def test_csv_windows_1252():
+    # Nota de entrega exportada por Excel en español: Windows-1252, separada por punto y coma
+    contenido = 'material;shade;grosor;cantidad\nZirconía;A1;14;3\n'.encode('cp1252')
+    filas = list(leer_filas(io.BytesIO(contenido), 'entrega.csv'))
+    assert filas == [['material', 'shade', 'grosor', 'cantidad'], ['Zirconía', 'A1', '14', '3']]
+
+
+def test_csv_utf8_con_bom():
+    contenido = '\ufeffmaterial,shade,grosor,cantidad\nZirconía,A1,14,3\n'.encode('utf-8')
+    filas = list(leer_filas(io.BytesIO(contenido), 'entrega.csv'))
+    assert filas[0][0] == 'material'
+    assert filas[1][0] == 'Zirconía'
+
+
+def test_csv_ilegible():
+    # 0x81 no existe en Windows-1252 ni es UTF-8 válido
+    contenido = b'material,shade,grosor,cantidad\nZirconia\x81,A1,14,3\n'
+    with pytest.raises(ErrorImportacion):
+        list(leer_filas(io.BytesIO(contenido), 'entrega.csv'))
+
+
+def test_xlsx_danado():
+    pytest.importorskip('openpyxl')
+    with pytest.raises(ErrorImportacion):
+        list(leer_filas(io.BytesIO(b'esto no es un libro de Excel'), 'entrega.xlsx'))
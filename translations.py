@@ -41,6 +41,7 @@ TRANSLATIONS = {
         'Are you sure?': '¿Estás seguro?',
         'Confirm': 'Confirmar',
         'Close': 'Cerrar',
+        'Edit pending case': 'Editar caso pendiente',
         'Select': 'Seleccionar',
         'Filter': 'Filtrar',
         'Search': 'Buscar',
@@ -66,6 +67,37 @@ TRANSLATIONS = {
         'Furnaces': 'Hornos',
         'Milling Machines': 'Fresadoras',
         'Vacuum Cleaners': 'Aspiradoras',
+        'Import delivery (CSV/XLSX)': 'Importar entrega (CSV/XLSX)',
+        'Print labels (PDF)': 'Imprimir etiquetas (PDF)',
+        'Labels (ZPL)': 'Etiquetas (ZPL)',
+        'Import Blocks': 'Importar Bloques',
+        'Upload a supplier delivery note. Columns: material, shade, grosor, cantidad and optionally marca.': 'Sube una nota de entrega del proveedor. Columnas: material, shade, grosor, cantidad y opcionalmente marca.',
+        'File (CSV or XLSX)': 'Archivo (CSV o XLSX)',
+        'Validate only (do not save)': 'Solo validar (no guardar)',
+        'Import': 'Importar',
+        'Import Report': 'Reporte de Importación',
+        'validation only': 'solo validación',
+        'Rows read': 'Filas leídas',
+        'Valid rows': 'Filas válidas',
+        'Rows with errors': 'Filas con errores',
+        'Existing blocks updated': 'Bloques existentes actualizados',
+        'New block rows': 'Filas de bloques nuevos',
+        'Total units': 'Unidades totales',
+        'Row': 'Fila',
+        'Errors': 'Errores',
+        'Values': 'Valores',
+        'Models per block by thickness (thickness:models, comma separated)': 'Modelos por bloque según grosor (grosor:modelos, separados por coma)',
+        'Empty: the planner uses the example and used blocks are not retired by capacity.': 'Vacío: el planificador usa el ejemplo y los bloques usados no se retiran por capacidad.',
+        'Lab (site)': 'Laboratorio (sede)',
+        'New lab': 'Nuevo laboratorio',
+        'Wear': 'Desgaste',
+        'Replace by': 'Reemplazo estimado',
+        'Block Stock Forecast': 'Pronóstico de Stock de Bloques',
+        'Stock': 'Stock',
+        'Blocks/day': 'Bloques/día',
+        'Days of cover': 'Días de cobertura',
+        'Reorder point': 'Punto de reorden',
+        'Runs out': 'Se agota',
         'week': 'semana',
         'month': 'mes',
         'year': 'año',
@@ -118,6 +150,7 @@ TRANSLATIONS = {
         'Are you sure?': 'Are you sure?',
         'Confirm': 'Confirm',
         'Close': 'Close',
+        'Edit pending case': 'Edit pending case',
         'Select': 'Select',
         'Filter': 'Filter',
         'Search': 'Search',
@@ -146,6 +179,37 @@ TRANSLATIONS = {
         'Furnaces': 'Furnaces',
         'Milling Machines': 'Milling Machines',
         'Vacuum Cleaners': 'Vacuum Cleaners',
+        'Import delivery (CSV/XLSX)': 'Import delivery (CSV/XLSX)',
+        'Print labels (PDF)': 'Print labels (PDF)',
+        'Labels (ZPL)': 'Labels (ZPL)',
+        'Import Blocks': 'Import Blocks',
+        'Upload a supplier delivery note. Columns: material, shade, grosor, cantidad and optionally marca.': 'Upload a supplier delivery note. Columns: material, shade, grosor, cantidad and optionally marca.',
+        'File (CSV or XLSX)': 'File (CSV or XLSX)',
+        'Validate only (do not save)': 'Validate only (do not save)',
+        'Import': 'Import',
+        'Import Report': 'Import Report',
+        'validation only': 'validation only',
+        'Rows read': 'Rows read',
+        'Valid rows': 'Valid rows',
+        'Rows with errors': 'Rows with errors',
+        'Existing blocks updated': 'Existing blocks updated',
+        'New block rows': 'New block rows',
+        'Total units': 'Total units',
+        'Row': 'Row',
+        'Errors': 'Errors',
+        'Values': 'Values',
+        'Models per block by thickness (thickness:models, comma separated)': 'Models per block by thickness (thickness:models, comma separated)',
+        'Empty: the planner uses the example and used blocks are not retired by capacity.': 'Empty: the planner uses the example and used blocks are not retired by capacity.',
+        'Lab (site)': 'Lab (site)',
+        'New lab': 'New lab',
+        'Wear': 'Wear',
+        'Replace by': 'Replace by',
+        'Block Stock Forecast': 'Block Stock Forecast',
+        'Stock': 'Stock',
+        'Blocks/day': 'Blocks/day',
+        'Days of cover': 'Days of cover',
+        'Reorder point': 'Reorder point',
+        'Runs out': 'Runs out',
         'week': 'week',
         'month': 'month',
         'year': 'year',
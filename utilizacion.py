@@ -0,0 +1,166 @@
+"""
+Este archivo calcula la utilización y el rendimiento (throughput) de las fresadoras.
+
+Paso a paso:
+1. Se leen las órdenes, las instalaciones de fresas y los mantenimientos del rango pedido.
+2. Se arma una matriz máquina x día con los modelos fresados (días sin órdenes = 0).
+   Las filas se agrupan por maquina_id (clave entera indexada) y al final se les pone el nombre del registro.
+3. Con operaciones vectorizadas se calculan: modelos por día, media móvil, días inactivos
+   y los tramos de parada (días seguidos sin producción).
+4. Para cada cambio de fresa o mantenimiento se compara el promedio diario antes y después del evento.
+5. Los resultados se memorizan por (máquina, rango) y se invalidan cuando cambian esos datos.
+
+Así se puede ver la tendencia de cada máquina y relacionarla con fresas y mantenimientos.
+"""
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sedes import leer_df, sede_actual
+from models import Orden, FresaInstalada, Mantenimiento, Maquina
+from maquinas import maquinas_registradas
+from bitacora import ultima_posicion
+
+VENTANA_MEDIA_MOVIL = 7    # Días de la media móvil
+DIAS_COMPARACION = 7       # Días antes/después de un evento para comparar el rendimiento
+RANGO_MAXIMO_DIAS = 366    # Límite del rango consultable
+# Tablas (entidades de la bitácora) cuyos cambios invalidan la analítica
+ENTIDADES = ('orden', 'fresa_instalada', 'mantenimiento', 'maquina')
+
+
+def firma_datos():
+    """
+    Firma barata de las tablas usadas: la posición del último evento de órdenes, fresas, mantenimientos
+    o máquinas en la bitácora. Cambia también cuando se edita o se borra una fila.
+    """
+    return ultima_posicion(ENTIDADES)
+
+
+def obtener_utilizacion(desde, hasta, maquina=None):
+    """
+    Devuelve la analítica de utilización, memorizada por (sede, máquina, rango) y firma de datos.
+    """
+    return _utilizacion_memo(sede_actual(), maquina, desde, hasta, firma_datos())
+
+
+@lru_cache(maxsize=128)
+def _utilizacion_memo(sede, maquina, desde, hasta, firma):
+    # La firma forma parte de la clave: si cambian los datos la entrada anterior deja de usarse
+    return calcular_utilizacion(desde, hasta, maquina)
+
+
+def _leer(stmt, columnas_fecha=None):
+    # A través de la sesión para que la consulta quede filtrada por la sede actual
+    return leer_df(stmt, columnas_fecha)
+
+
+def _tramos(mascara):
+    # Devuelve (inicio, fin) de cada tramo seguido de True en un arreglo booleano
+    bordes = np.diff(np.concatenate(([0], mascara.astype(np.int8), [0])))
+    return np.flatnonzero(bordes == 1), np.flatnonzero(bordes == -1) - 1
+
+
+def calcular_utilizacion(desde, hasta, maquina=None):
+    """
+    Calcula modelos por día, media móvil, paradas y efecto de eventos para cada máquina.
+    desde y hasta son fechas (date); el rango incluye ambos días.
+    """
+    dias = pd.date_range(desde, hasta, freq='D')
+    inicio = datetime.combine(desde, datetime.min.time())
+    fin = datetime.combine(hasta, datetime.min.time()) + timedelta(days=1)
+
+    # Nombres de todas las máquinas de la sede (también las desactivadas, que pueden tener órdenes viejas)
+    nombres = {m.id: m.nombre for m in Maquina.query.filter_by(sede_id=sede_actual())}
+    q_ordenes = (
+        select(Orden.maquina_id, Orden.fecha_creacion, Orden.cantidad_modelos)
+        .where(Orden.fecha_creacion >= inicio, Orden.fecha_creacion < fin)
+    )
+    q_fresas = (
+        select(FresaInstalada.maquina_id, FresaInstalada.fecha_instalacion.label('fecha'), FresaInstalada.tipo.label('detalle'))
+        .where(FresaInstalada.fecha_instalacion >= inicio, FresaInstalada.fecha_instalacion < fin)
+    )
+    q_mant = (
+        select(Mantenimiento.maquina_id, Mantenimiento.fecha, Mantenimiento.actividad.label('detalle'))
+        .where(Mantenimiento.fecha >= inicio, Mantenimiento.fecha < fin)
+    )
+    if maquina:
+        ids_filtro = [i for i, n in nombres.items() if n == maquina]
+        q_ordenes = q_ordenes.where(Orden.maquina_id.in_(ids_filtro))
+        q_fresas = q_fresas.where(FresaInstalada.maquina_id.in_(ids_filtro))
+        q_mant = q_mant.where(Mantenimiento.maquina_id.in_(ids_filtro))
+    ordenes = _leer(q_ordenes, ['fecha_creacion'])
+    fresas = _leer(q_fresas, ['fecha'])
+    fresas['tipo'] = 'fresa'
+    mant = _leer(q_mant, ['fecha'])
+    mant['tipo'] = 'mantenimiento'
+
+    # Máquinas: las fresadoras registradas más las que aparecen en las órdenes
+    con_ordenes = sorted(int(i) for i in ordenes['maquina_id'].dropna().unique())
+    if maquina:
+        maquinas = ids_filtro
+    else:
+        registradas = [m.id for m in maquinas_registradas('fresadora')]
+        maquinas = list(dict.fromkeys(registradas + con_ordenes))
+
+    ordenes['maquina_id'] = ordenes['maquina_id'].fillna(0).astype(int)
+    ordenes['dia'] = ordenes['fecha_creacion'].dt.normalize()
+    ordenes['cantidad_modelos'] = pd.to_numeric(ordenes['cantidad_modelos'], errors='coerce').fillna(0)
+    matriz = (
+        ordenes.groupby(['maquina_id', 'dia'])['cantidad_modelos'].sum()
+        .unstack('dia', fill_value=0)
+        .reindex(index=maquinas, columns=dias, fill_value=0)
+        .fillna(0)
+    )
+    valores = matriz.to_numpy(dtype=float)
+    media_movil = matriz.T.rolling(VENTANA_MEDIA_MOVIL, min_periods=1).mean().T.to_numpy()
+    inactivos = valores == 0
+    # Suma acumulada con un cero inicial: la suma de [i, j) es acumulado[j] - acumulado[i]
+    acumulado = np.concatenate((np.zeros((len(maquinas), 1)), np.cumsum(valores, axis=1)), axis=1)
+    n_dias = len(dias)
+
+    eventos = pd.concat([fresas, mant], ignore_index=True)
+    eventos['indice'] = (eventos['fecha'].dt.normalize() - dias[0]).dt.days if len(dias) else 0
+
+    etiquetas = dias.strftime('%Y-%m-%d').tolist()
+    resultado = []
+    for fila, maquina_id in enumerate(maquinas):
+        ini, fin_tramo = _tramos(inactivos[fila])
+        paradas = [
+            {'desde': etiquetas[a], 'hasta': etiquetas[b], 'dias': int(b - a + 1)}
+            for a, b in zip(ini, fin_tramo)
+        ]
+        ev = eventos[eventos['maquina_id'] == maquina_id].sort_values('fecha')
+        idx = ev['indice'].to_numpy(dtype=int).clip(0, n_dias)
+        antes_ini = (idx - DIAS_COMPARACION).clip(0, n_dias)
+        despues_fin = (idx + DIAS_COMPARACION).clip(0, n_dias)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            prom_antes = (acumulado[fila, idx] - acumulado[fila, antes_ini]) / (idx - antes_ini)
+            prom_despues = (acumulado[fila, despues_fin] - acumulado[fila, idx]) / (despues_fin - idx)
+        lista_eventos = [
+            {
+                'tipo': tipo,
+                'fecha': fecha.strftime('%Y-%m-%d %H:%M'),
+                'detalle': detalle,
+                'promedio_antes': round(float(a), 2) if np.isfinite(a) else None,
+                'promedio_despues': round(float(d), 2) if np.isfinite(d) else None,
+            }
+            for tipo, fecha, detalle, a, d in zip(ev['tipo'], ev['fecha'], ev['detalle'], prom_antes, prom_despues)
+        ]
+        total = float(valores[fila].sum())
+        resultado.append({
+            'maquina': nombres.get(maquina_id, ''),
+            'maquina_id': maquina_id,
+            'total_modelos': int(total),
+            'dias_activos': int(n_dias - inactivos[fila].sum()),
+            'dias_inactivos': int(inactivos[fila].sum()),
+            'promedio_diario': round(total / n_dias, 2) if n_dias else 0,
+            'serie': [
+                {'dia': d, 'modelos': int(m), 'media_movil': round(float(mm), 2)}
+                for d, m, mm in zip(etiquetas, valores[fila], media_movil[fila])
+            ],
+            'paradas': paradas,
+            'eventos': lista_eventos,
+        })
+    return resultado